@@ -0,0 +1,84 @@
+import hashlib
+import hmac
+import os
+import sqlite3
+from typing import Optional
+
+from playlist import Playlist
+
+# Users registered from the login form, each with their own playlist.
+
+HASH_ITERATIONS = 200000
+PLAYLIST_NAME = "My Playlist"
+
+
+class AuthenticationError(Exception):
+    pass
+
+
+def hash_password(password: str, salt: bytes = None) -> str:
+    """
+    :return: "salt$hash", hex encoded, of a PBKDF2-SHA256 hash of the password.
+    """
+    salt = salt or os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, HASH_ITERATIONS)
+    return salt.hex() + "$" + digest.hex()
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    salt, _ = password_hash.split("$", 1)
+    return hmac.compare_digest(hash_password(password, bytes.fromhex(salt)), password_hash)
+
+
+class Accounts():
+    """
+    Registration, login, and the playlist of each user.
+    """
+    def __init__(self, db: Playlist):
+        self.db = db
+
+    def register(self, username: str, password: str) -> int:
+        """
+        :return: Id of the new user.
+        :raises AuthenticationError: If the username is taken or a field is empty.
+        """
+        username = (username or "").strip()
+        if not username or not password:
+            raise AuthenticationError("Username and password are required")
+        try:
+            return self.db.create(table='users', data={'username': username, 'password_hash': hash_password(password)})
+        except sqlite3.IntegrityError:
+            raise AuthenticationError("Username already taken")
+
+    def login(self, username: str, password: str) -> int:
+        """
+        :return: Id of the user.
+        :raises AuthenticationError: If the username or the password is wrong.
+        """
+        record = self.db.read(table='users', data=['user_id', 'password_hash'], where={'username': (username or "").strip()})
+        if not record or not verify_password(password or "", record[0][1]):
+            raise AuthenticationError("Wrong username or password")
+        return record[0][0]
+
+    def playlist_of(self, user_id: int) -> int:
+        """
+        :return: Id of the playlist of a user, created on first use.
+        """
+        # Served by the (owner, name) index
+        record = self.db.read(table='playlists', data=['playlist_id'], where={'owner': user_id, 'name': PLAYLIST_NAME}, limit=1)
+        if record:
+            return record[0][0]
+        try:
+            return self.db.create(table='playlists', data={'name': PLAYLIST_NAME, 'owner': user_id})
+        except sqlite3.IntegrityError:
+            # Created meanwhile by another session of the same user
+            return self.db.read(table='playlists', data=['playlist_id'], where={'owner': user_id, 'name': PLAYLIST_NAME}, limit=1)[0][0]
+
+    def shared_playlist(self) -> int:
+        """
+        :return: Id of the playlist of the sessions without login.
+        """
+        record = self.db.conn.execute('SELECT playlist_id FROM playlists WHERE owner IS NULL AND name = ? LIMIT 1', (PLAYLIST_NAME,)).fetchall()
+        if record:
+            return record[0][0]
+        return self.db.create(table='playlists', data={'name': PLAYLIST_NAME})
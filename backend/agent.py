@@ -1,3 +1,5 @@
+import contextlib
+import logging
 from typing import List
 from dialoguekit.core.annotated_utterance import AnnotatedUtterance, Annotation
 from dialoguekit.core.dialogue_act import DialogueAct
@@ -8,19 +10,30 @@ from dialoguekit.core.intent import Intent
 from playlist import Playlist
 import uuid
 import os
-import time
-from threading import Thread
 import random
 from song import Song
 import datetime
 import sqlite3
 from entity_linker import EntityLinker
+from recommender import CatalogRecommender
+from playlist_sync import PlaylistSync
+from artist_stats import ArtistStats
+from instrumentation import timed
+from scheduler import scheduler
+from command_router import CommandRouter
+
+logger = logging.getLogger(__name__)
+
+# Seconds between a response and the suggestion that follows it
+SUGGESTION_DELAY = 0.5
 
 
 class PlaylistAgent(Agent):
     def __init__(self, id: str):
         """Playlist agent."""
         super().__init__(id)
+        # Session of the agent, changed by reset when a pooled agent serves a new session
+        self.generation = 0
 
         self.commands = {
             "add": {
@@ -63,12 +76,45 @@ class PlaylistAgent(Agent):
                 "desc": "Ask for a random song by an artist.",
                 "syntax": "give song : <artist>",
                 },
+            "recommend": {
+                "desc": "Recommend songs that sound like the playlist.",
+                "syntax": "recommend",
+                },
         }
+        self.router = CommandRouter()
+        self.router.register("add", self.command_add)
+        self.router.register("remove", self.command_remove)
+        self.router.register("show", self.command_show)
+        self.router.register("clear", self.command_clear)
+        self.router.register("date album", self.command_date_album)
+        self.router.register("genre artist", self.command_genre_artist)
+        self.router.register("number songs", self.command_number_songs)
+        self.router.register("number albums", self.command_number_albums)
+        self.router.register("which album", self.command_which_album)
+        self.router.register("give song", self.command_give_song)
+        self.router.register("recommend", self.command_recommend)
+        self.reset()
+
+    def reset(self) -> None:
+        """Forgets the conversation, so that the agent can serve a new session."""
+        self.cancel_scheduled()
+        # A suggestion the scheduler already took off its queue checks this and is dropped
+        self.generation += 1
         self.used_commands = set()
-        self.interaction_count = 0 
+        self.interaction_count = 0
+        self.playlist = None
+        self._dialogue_connector = None
 
-    def introduce_new_features(self) -> None:
-        """Introduce new features that the user hasn't used yet."""
+    def introduce_new_features(self, generation: int) -> None:
+        """Introduce new features that the user hasn't used yet.
+
+        Args:
+            generation: Session the suggestion was scheduled in, nothing is sent once the agent serves another one.
+        """
+        # Read before the generation, a reset in between fails the check instead of sending to the new session
+        dialogue_connector = self._dialogue_connector
+        if dialogue_connector is None or generation != self.generation:
+            return
         unused_commands = set(self.commands.keys()) - self.used_commands
         if unused_commands:
             random_command = random.choice(list(unused_commands))
@@ -77,8 +123,7 @@ class PlaylistAgent(Agent):
                 suggestion_text,
                 participant=DialogueParticipant.AGENT,
             )
-            time.sleep(0.5)
-            self._dialogue_connector.register_agent_utterance(response)
+            dialogue_connector.register_agent_utterance(response)
 
     def get_commands(self) -> list:
         return [{
@@ -106,311 +151,324 @@ class PlaylistAgent(Agent):
         )
         self._dialogue_connector.register_agent_utterance(utterance)
 
-    def connect_playlist(self, playlist: int, db: Playlist, entity_linker: EntityLinker) -> None:
+    def connect_playlist(self, playlist: int, db: Playlist, entity_linker: EntityLinker, recommender: CatalogRecommender = None,
+                         playlist_sync: PlaylistSync = None, artist_stats: ArtistStats = None) -> None:
         self.playlist = playlist
         self.db = db
         self.entity_linker = entity_linker
+        self.recommender = recommender
+        self.playlist_sync = playlist_sync
+        # Shared by the platform, so that every agent reads through the same cache
+        self.artist_stats = artist_stats or ArtistStats(db)
+
+        logger.debug("agent playlist id %s", self.playlist)
 
-        print(f"agent playlist id {self.playlist}")
+    def playlist_change(self):
+        """Lock to hold while changing the playlist and publishing the change."""
+        if self.playlist_sync is None:
+            return contextlib.nullcontext()
+        return self.playlist_sync.playlist_lock(self.playlist)
 
     def check_for_suggestions(self):
         if self.interaction_count % 3 == 0:
-            Thread(target=self.introduce_new_features).start()
+            generation = self.generation
+            scheduler.schedule(SUGGESTION_DELAY, lambda: self.introduce_new_features(generation), owner=self)
 
+    def cancel_scheduled(self) -> None:
+        """Cancels the suggestions not sent yet, when the session ends."""
+        scheduler.cancel_owner(self)
+
+    @timed("agent")
     def receive_utterance(self, utterance: Utterance) -> None:
         """Gets called each time there is a new user utterance."""
         self.interaction_count += 1
-        print(f"interaction_count: {self.interaction_count}")
+        logger.debug("interaction_count: %d", self.interaction_count)
 
         if utterance.text == "EXIT":
             self.goodbye()
             return
 
         try:
-            if utterance.text.startswith("add"):
-                self.used_commands.add("add")
-                artists = self.entity_linker.recognize_artist(utterance.text)
-                if artists:
-                    context = {"artists": [artist[0] for artist in artists]}
-                else:
-                    context = {}
-                songs = self.entity_linker.recognize_song(utterance.text[4:], context=context)
-                if songs:
-                    try:
-                        response = self.generate_add_response(songs)
-                    except sqlite3.IntegrityError as e:
-                        print(e)
-                        response = AnnotatedUtterance(
-                            f"The song \"{songs[0].title}\" by \"{songs[0].artist}\" is already in the playlist.",
-                            participant=DialogueParticipant.AGENT,
-                        )
-                else:
-                    response = AnnotatedUtterance(
-                            f"Sorry but I couldn't understand which song you want to add.",
-                            participant=DialogueParticipant.AGENT,
-                        )
-
-                self._dialogue_connector.register_agent_utterance(response)
-                self.check_for_suggestions()
-                return
-
-            elif utterance.text.startswith("remove"):
-                self.used_commands.add("remove")
-                playlist_songs = [Song(id_=song[0], title=song[1], artist_name=song[2], album_name=song[3], artist_id=song[4], album_id=song[5]) for song in self.db.read_songs_from_playlist(playlist_id=self.playlist, data=('songs.id', 'songs.name', 'artists.name', 'albums.name', 'artists.id', 'albums.id'))]
-                songs = self.entity_linker.recognize_song_in_playlist(utterance.text, playlist_songs)
-                song_to_delete = songs[0][0]
-                print(f"song_to_delete: {song_to_delete}")
-                try:
-                    self.db.delete(table='playlist_songs', data={'playlist_id': self.playlist, 'song_id': song_to_delete.id})
-                    response = self.generate_remove_response(song_to_delete)
-                except Exception as e:
-                    print(f"Error: {e}")
-                    response = AnnotatedUtterance(
-                        f"{song_to_delete.title} by {song_to_delete.artist_name} not found in the playlist.",
-                        participant=DialogueParticipant.AGENT,
-                    )
-                self._dialogue_connector.register_agent_utterance(response)
-                self.check_for_suggestions()
-                return
-
-            elif utterance.text.startswith("show"):
-                self.used_commands.add("show")
-                print(f"playlist: {self.playlist}")
-                songs = self.db.read_songs_from_playlist(playlist_id=self.playlist, data=['songs.name', 'artists.name'])
-                text = ""
-                print(f"songs: {songs}")
-                for song in songs:
-                    text += f"{song[0]} by {song[1]}\n"  # song[0] est le titre, song[1] l'ID de l'artiste
-
-                if not text:
-                    text = "The playlist is empty, try adding new songs."
+            routed = self.router.dispatch(utterance.text)
+        except Exception as e:
+            logger.warning("Error while processing user utterance: %s", e)
+            response = AnnotatedUtterance(
+                "I don't understand. Please make sure you have the correct format.",
+                participant=DialogueParticipant.AGENT,
+            )
+            self._dialogue_connector.register_agent_utterance(response)
+            self.check_for_suggestions()
+            return
 
+        if routed is None:
+            response = AnnotatedUtterance(
+                "I don't understand. Please try again.",
+                participant=DialogueParticipant.AGENT,
+            )
+            self._dialogue_connector.register_agent_utterance(response)
+            return
+
+        command, response = routed
+        self.used_commands.add(command)
+        self._dialogue_connector.register_agent_utterance(response)
+        self.check_for_suggestions()
+
+    def command_add(self, argument: str) -> AnnotatedUtterance:
+        """Finds the songs matching the argument, for the user to pick the ones to add."""
+        songs = self.entity_linker.recognize_all(argument, types=("artists", "songs"))["songs"]
+        if songs:
+            try:
+                response = self.generate_add_response(songs)
+            except sqlite3.IntegrityError as e:
+                logger.info(e)
                 response = AnnotatedUtterance(
-                    text,
+                    f"The song \"{songs[0].title}\" by \"{songs[0].artist}\" is already in the playlist.",
+                    participant=DialogueParticipant.AGENT,
+                )
+        else:
+            response = AnnotatedUtterance(
+                    f"Sorry but I couldn't understand which song you want to add.",
                     participant=DialogueParticipant.AGENT,
                 )
-                self._dialogue_connector.register_agent_utterance(response)
-                self.check_for_suggestions()
-                return
+        return response
+
+    def command_remove(self, argument: str) -> AnnotatedUtterance:
+        """Removes the song of the playlist closest to the argument."""
+        song_ids = [record[0] for record in self.db.read(table='playlist_songs', data=['song_id'], where={'playlist_id': self.playlist})]
+        playlist_songs = self.entity_linker.songs_from_ids(song_ids)
+        songs = self.entity_linker.recognize_song_in_playlist(argument, playlist_songs)
+        song_to_delete = songs[0][0]
+        logger.debug("song_to_delete: %s", song_to_delete)
+        removed = 0
+        try:
+            with self.playlist_change():
+                removed = self.db.delete(table='playlist_songs', data={'playlist_id': self.playlist, 'song_id': song_to_delete.id})
+                if removed and self.playlist_sync:
+                    self.playlist_sync.removed(self.playlist, song_to_delete.id)
+        except Exception as e:
+            logger.warning("Error: %s", e)
+        if removed:
+            return self.generate_remove_response(song_to_delete)
+        return AnnotatedUtterance(
+            f"{song_to_delete.title} by {song_to_delete.artist_name} not found in the playlist.",
+            participant=DialogueParticipant.AGENT,
+        )
 
-            elif utterance.text.startswith("clear"):
+    def command_show(self, argument: str) -> AnnotatedUtterance:
+        """Lists the songs of the playlist."""
+        songs = self.db.read_songs_from_playlist(playlist_id=self.playlist, data=['songs.name', 'artists.name'])
+        text = ""
+        logger.debug("songs: %s", songs)
+        for song in songs:
+            text += f"{song[0]} by {song[1]}\n"  # song[0] est le titre, song[1] l'ID de l'artiste
 
-                self.used_commands.add("clear")
-                self.db.delete(table='playlist_songs', data={'playlist_id': self.playlist})
+        if not text:
+            text = "The playlist is empty, try adding new songs."
 
+        response = AnnotatedUtterance(
+            text,
+            participant=DialogueParticipant.AGENT,
+        )
+        return response
+
+    def command_clear(self, argument: str) -> AnnotatedUtterance:
+        """Removes all the songs of the playlist."""
+        with self.playlist_change():
+            if self.db.delete(table='playlist_songs', data={'playlist_id': self.playlist}) and self.playlist_sync:
+                self.playlist_sync.cleared(self.playlist)
+
+        response = AnnotatedUtterance(
+            "Your playlist has been cleared.",
+            participant=DialogueParticipant.AGENT,
+            intent=Intent(label="clear")
+        )
+        return response
+
+    def command_date_album(self, argument: str) -> AnnotatedUtterance:
+        """Tells the release date of an album."""
+        try:
+            albums = self.entity_linker.recognize_all(argument, types=("artists", "albums"))["albums"]
+            album = albums[0][0]
+            release_date_record = self.db.read(table='albums', data=['release_date'], where={'id': album.id})
+            if release_date_record:
+                release_date_timestamp = release_date_record[0][0]
+                date = datetime.datetime.fromtimestamp(release_date_timestamp / 1000)
                 response = AnnotatedUtterance(
-                    "Your playlist has been cleared.",
+                    f"The album '{album.name}' was released on {date.strftime('%Y-%m-%d')}.",
                     participant=DialogueParticipant.AGENT,
-                    intent=Intent(label="clear")
                 )
-                self._dialogue_connector.register_agent_utterance(response)
-                self.check_for_suggestions()
-                return
-            
-            elif "date album : " in utterance.text:
-                self.used_commands.add("date album")
-
-                try:
-                    artists = self.entity_linker.recognize_artist(utterance.text)
-                    if artists:
-                        context = {"artists": [artist[0] for artist in artists]}
-                    else:
-                        context = {}
-
-                    albums = self.entity_linker.recognize_album(utterance.text, context=context)
-                    album = albums[0][0]
-                    release_date_record = self.db.read(table='albums', data=['release_date'], where=f'id = "{album.id}"')
-                    if release_date_record:
-                        release_date_timestamp = release_date_record[0][0]
-                        date = datetime.datetime.fromtimestamp(release_date_timestamp / 1000)
-                        response = AnnotatedUtterance(
-                            f"The album '{album.name}' was released on {date.strftime('%Y-%m-%d')}.",
-                            participant=DialogueParticipant.AGENT,
-                        )
-                    else:
-                        response = AnnotatedUtterance(
-                            f"I don't know when the album '{album.name}' was released.",
-                            participant=DialogueParticipant.AGENT,
-                        )
-                except Exception as e:
-                    response = AnnotatedUtterance(
-                        f"The album \"{album.name}\" does not exist in the database.",
-                        participant=DialogueParticipant.AGENT,
-                    )
-                self._dialogue_connector.register_agent_utterance(response)
-                self.check_for_suggestions()
-                return
-            
-            elif "genre artist : " in utterance.text:
-                self.used_commands.add("genre artist")
-                artists = self.entity_linker.recognize_artist(utterance.text)
-                artist = artists[0][0]
-
-                try:
-                    artist_record = self.db.read(table='artists', data=['id', 'genre', 'name'], where=f'id = "{artist.id}"')
-                    if artist_record:
-                        artist_id = artist_record[0][0]
-                        artist_genre = artist_record[0][1]
-                        artist_name = artist_record[0][2]
-                        print(f"artist_genre: {artist_genre}")
-                        plural_singular = "genres are"
-                        if len(artist_genre) < 2:
-                            plural_singular = " genre is"
-                        if artist_genre:
-                            response = AnnotatedUtterance(
-                                f"{artist_name}'s {plural_singular} {', '.join(artist_genre)}.",
-                                participant=DialogueParticipant.AGENT,
-                            )
-                        else:
-                            response = AnnotatedUtterance(
-                                f"I don't know the genre of the artist '{artist_name}'.",
-                                participant=DialogueParticipant.AGENT,
-                            )
-                    else:
-                        response = AnnotatedUtterance(
-                            f"I don't know the artist '{artist}'.",
-                            participant=DialogueParticipant.AGENT,
-                        )
-
-                except Exception as e:
-                    response = AnnotatedUtterance(
-                        f"The artist \"{artist.name}\" does not exist in the database.",
-                        participant=DialogueParticipant.AGENT,
-                    )
-
-                self._dialogue_connector.register_agent_utterance(response)
-                self.check_for_suggestions()
-                return
-            
-            elif "number songs :" in utterance.text:
-                self.used_commands.add("number songs")
-                artists = self.entity_linker.recognize_artist(utterance.text)
-                artist = artists[0][0]
-
-                try:
-                    total_songs_by_album_by_artist = self.db.read(
-                        table='albums',
-                        data=['total_songs'],
-                        where=f'artist_id = "{str(artist.id)}"'
-                    )
-                    if total_songs_by_album_by_artist:
-                        total_songs = sum([item[0] for item in total_songs_by_album_by_artist])
-                        
-                        response = AnnotatedUtterance(
-                            f"The artist '{artist.name}' has {total_songs} songs.",
-                            participant=DialogueParticipant.AGENT,
-                        )
-
-                except Exception as e:
-                    response = AnnotatedUtterance(
-                        f"The artist \"{artist.name}\" does not exist in the database.",
-                        participant=DialogueParticipant.AGENT,
-                    )
-                self._dialogue_connector.register_agent_utterance(response)
-                self.check_for_suggestions()
-                return
-
-            elif "number albums :" in utterance.text:
-                self.used_commands.add("number albums")
-
-                artists = self.entity_linker.recognize_artist(utterance.text)
-                artist = artists[0][0]
-
-                try:
-                    total_albums_record = self.db.read(table='artists', data=['total_albums'], where=f'id = "{artist.id}"')
-                    if total_albums_record:
-                        response = AnnotatedUtterance(
-                            f"The artist '{artist.name}' has released {total_albums_record[0][0]} albums.",
-                            participant=DialogueParticipant.AGENT,
-                        )
-                    else:
-                        response = AnnotatedUtterance(
-                            f"I don't have information about the artist '{artist.name}'.",
-                            participant=DialogueParticipant.AGENT,
-                        )
-                except Exception as e:
-                    print(e)
-                    response = AnnotatedUtterance(
-                        f"The artist \"{artist.name}\" does not exist in the database.",
-                        participant=DialogueParticipant.AGENT,
-                    )
-                self._dialogue_connector.register_agent_utterance(response)
-                self.check_for_suggestions()
-                return
-
-            elif "which album : " in utterance.text.lower():
-                self.used_commands.add("which album")
-                artists = self.entity_linker.recognize_artist(utterance.text)
-                if artists:
-                    context = {"artists": [artist[0] for artist in artists]}
-                else:
-                    context = {}
-                songs = self.entity_linker.recognize_song(utterance.text, context=context)
-                song = songs[0][0]
-
-                try:
-                    album_record = self.db.read_album_from_song(song_id=song.id, data=['albums.name'])
-                    if album_record:
-                        response = AnnotatedUtterance(
-                            f"The song '{song.title}' is featured in the album(s) '{', '.join(album[0] for album in album_record)}'.",
-                            participant=DialogueParticipant.AGENT,
-                        )
-                    else:
-                        response = AnnotatedUtterance(
-                            f"I don't know which album features the song '{song.title}'.",
-                            participant=DialogueParticipant.AGENT,
-                        )
-                except Exception as e:
-                    response = AnnotatedUtterance(
-                        f"The song \"{song.title}\" does not exist in the database.",
-                        participant=DialogueParticipant.AGENT,
-                    )
-                self._dialogue_connector.register_agent_utterance(response)
-                self.check_for_suggestions()
-                return
-            
-            elif "give song : " in utterance.text:
-                self.used_commands.add("give song")
-                artists = self.entity_linker.recognize_artist(utterance.text)
-                artist = artists[0][0]
-
-                try:
-                    song_record = self.db.read(table='songs', data=['name'], where=f'artist_id = "{artist.id}"')
-                    if song_record:
-                        random_song = random.choice(song_record)
-                        response = AnnotatedUtterance(
-                            f"Here's a song by {artist.name}: {random_song[0]}.",
-                            participant=DialogueParticipant.AGENT,
-                        )
-                    else:
-                        response = AnnotatedUtterance(
-                            f"Sorry, I couldn't find any songs by {artist.name}.",
-                            participant=DialogueParticipant.AGENT,
-                        )
-                except Exception as e:
-                    response = AnnotatedUtterance(
-                        f"The artist \"{artist.name}\" does not exist in the database.",
-                        participant=DialogueParticipant.AGENT,
-                    )
-                self._dialogue_connector.register_agent_utterance(response)
-                self.check_for_suggestions()
-                return
-
-        except InterruptedError as e:
-            print(f"Error while processing user utterance: {e}")
+            else:
+                response = AnnotatedUtterance(
+                    f"I don't know when the album '{album.name}' was released.",
+                    participant=DialogueParticipant.AGENT,
+                )
+        except Exception as e:
             response = AnnotatedUtterance(
-                "I don't understand. Please make sure you have the correct format.",
+                f"The album \"{album.name}\" does not exist in the database.",
                 participant=DialogueParticipant.AGENT,
             )
-            self._dialogue_connector.register_agent_utterance(response)
-            self.check_for_suggestions()
-            return
+        return response
 
-        response = AnnotatedUtterance(
-            "I don't understand. Please try again.",
-            participant=DialogueParticipant.AGENT,
-        )
-        self._dialogue_connector.register_agent_utterance(response)
+    def command_genre_artist(self, argument: str) -> AnnotatedUtterance:
+        """Tells the genres of an artist."""
+        artists = self.entity_linker.recognize_artist(argument)
+        artist = artists[0][0]
+
+        try:
+            stats = self.artist_stats.get(artist.id)
+            if stats and stats.genres:
+                logger.debug("artist_genres: %s", stats.genres)
+                plural_singular = "genres are"
+                if len(stats.genres) < 2:
+                    plural_singular = "genre is"
+                response = AnnotatedUtterance(
+                    f"{artist.name}'s {plural_singular} {', '.join(stats.genres)}.",
+                    participant=DialogueParticipant.AGENT,
+                )
+            elif stats:
+                response = AnnotatedUtterance(
+                    f"I don't know the genre of the artist '{artist.name}'.",
+                    participant=DialogueParticipant.AGENT,
+                )
+            else:
+                response = AnnotatedUtterance(
+                    f"I don't know the artist '{artist.name}'.",
+                    participant=DialogueParticipant.AGENT,
+                )
+
+        except Exception as e:
+            logger.warning(e)
+            response = AnnotatedUtterance(
+                f"The artist \"{artist.name}\" does not exist in the database.",
+                participant=DialogueParticipant.AGENT,
+            )
+        return response
+
+    def command_number_songs(self, argument: str) -> AnnotatedUtterance:
+        """Tells the number of songs of an artist."""
+        artists = self.entity_linker.recognize_artist(argument)
+        artist = artists[0][0]
+
+        try:
+            stats = self.artist_stats.get(artist.id)
+            if stats:
+                response = AnnotatedUtterance(
+                    f"The artist '{artist.name}' has {stats.total_songs} songs.",
+                    participant=DialogueParticipant.AGENT,
+                )
+            else:
+                response = AnnotatedUtterance(
+                    f"I don't have information about the artist '{artist.name}'.",
+                    participant=DialogueParticipant.AGENT,
+                )
+
+        except Exception as e:
+            logger.warning(e)
+            response = AnnotatedUtterance(
+                f"The artist \"{artist.name}\" does not exist in the database.",
+                participant=DialogueParticipant.AGENT,
+            )
+        return response
+
+    def command_number_albums(self, argument: str) -> AnnotatedUtterance:
+        """Tells the number of albums of an artist."""
+        artists = self.entity_linker.recognize_artist(argument)
+        artist = artists[0][0]
+
+        try:
+            stats = self.artist_stats.get(artist.id)
+            if stats:
+                response = AnnotatedUtterance(
+                    f"The artist '{artist.name}' has released {stats.total_albums} albums.",
+                    participant=DialogueParticipant.AGENT,
+                )
+            else:
+                response = AnnotatedUtterance(
+                    f"I don't have information about the artist '{artist.name}'.",
+                    participant=DialogueParticipant.AGENT,
+                )
+        except Exception as e:
+            logger.warning(e)
+            response = AnnotatedUtterance(
+                f"The artist \"{artist.name}\" does not exist in the database.",
+                participant=DialogueParticipant.AGENT,
+            )
+        return response
+
+    def command_which_album(self, argument: str) -> AnnotatedUtterance:
+        """Tells which albums feature a song."""
+        songs = self.entity_linker.recognize_all(argument, types=("artists", "songs"))["songs"]
+        song = songs[0][0]
+
+        try:
+            album_record = self.db.read_album_from_song(song_id=song.id, data=['albums.name'])
+            if album_record:
+                response = AnnotatedUtterance(
+                    f"The song '{song.title}' is featured in the album(s) '{', '.join(album[0] for album in album_record)}'.",
+                    participant=DialogueParticipant.AGENT,
+                )
+            else:
+                response = AnnotatedUtterance(
+                    f"I don't know which album features the song '{song.title}'.",
+                    participant=DialogueParticipant.AGENT,
+                )
+        except Exception as e:
+            response = AnnotatedUtterance(
+                f"The song \"{song.title}\" does not exist in the database.",
+                participant=DialogueParticipant.AGENT,
+            )
+        return response
+
+    def command_give_song(self, argument: str) -> AnnotatedUtterance:
+        """Picks a random song of an artist."""
+        artists = self.entity_linker.recognize_artist(argument)
+        artist = artists[0][0]
+
+        try:
+            song_record = self.db.read(table='songs', data=['name'], where={'artist_id': artist.id})
+            if song_record:
+                random_song = random.choice(song_record)
+                response = AnnotatedUtterance(
+                    f"Here's a song by {artist.name}: {random_song[0]}.",
+                    participant=DialogueParticipant.AGENT,
+                )
+            else:
+                response = AnnotatedUtterance(
+                    f"Sorry, I couldn't find any songs by {artist.name}.",
+                    participant=DialogueParticipant.AGENT,
+                )
+        except Exception as e:
+            response = AnnotatedUtterance(
+                f"The artist \"{artist.name}\" does not exist in the database.",
+                participant=DialogueParticipant.AGENT,
+            )
+        return response
+
+    def command_recommend(self, argument: str) -> AnnotatedUtterance:
+        """Suggests songs that sound like the playlist."""
+        song_ids = [record[0] for record in self.db.read(table='playlist_songs', data=['song_id'], where={'playlist_id': self.playlist})]
+
+        if not self.recommender:
+            response = AnnotatedUtterance(
+                "Sorry, recommendations are not available right now.",
+                participant=DialogueParticipant.AGENT,
+            )
+        elif not song_ids:
+            response = AnnotatedUtterance(
+                "The playlist is empty, add a few songs first so I know what you like.",
+                participant=DialogueParticipant.AGENT,
+            )
+        else:
+            recommendations = self.recommender.recommend(song_ids)
+            songs = self.entity_linker.songs_from_ids([song_id for song_id, _ in recommendations])
+            if songs:
+                response = self.generate_add_response([(song, 0) for song in songs])
+            else:
+                response = AnnotatedUtterance(
+                    "Sorry, I couldn't find songs similar to your playlist.",
+                    participant=DialogueParticipant.AGENT,
+                )
+        return response
 
     def generate_add_response(self, songs: List[Song]) -> AnnotatedUtterance:
         """
@@ -1,7 +1,16 @@
+import logging
+import os
+
 from custom_platform import CustomPlatform
 from agent import PlaylistAgent
+from instrumentation import metrics
+
+# LOG_LEVEL=DEBUG shows the mentions, candidates and scores of each request
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+metrics.start_logging(int(os.environ.get("METRICS_LOG_INTERVAL", 60)))
 
-platform = CustomPlatform(PlaylistAgent)
+# PUBLIC_STATS=1 serves /metrics and /sessions to other hosts, e.g. a monitoring server
+platform = CustomPlatform(PlaylistAgent, public_stats=os.environ.get("PUBLIC_STATS") == "1")
 
 platform.start()
 
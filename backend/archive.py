@@ -0,0 +1,92 @@
+import json
+import logging
+import os
+import shutil
+import zipfile
+import zlib
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20
+
+
+def manifest_path(zip_path: str) -> str:
+    return f"{zip_path}.extracted.json"
+
+
+def read_manifest(zip_path: str) -> dict:
+    try:
+        with open(manifest_path(zip_path), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(zip_path: str, manifest: dict) -> None:
+    tmp_path = f"{manifest_path(zip_path)}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path(zip_path))
+
+
+def file_crc(path: str) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def is_extracted(info: zipfile.ZipInfo, path: str, manifest: dict) -> bool:
+    """
+    :param info: The archive member.
+    :param path: Where the member is extracted.
+    :param manifest: Members already extracted, by name.
+    :return: True if the file on disk comes from this member.
+    """
+    if not os.path.exists(path):
+        return False
+    entry = manifest.get(info.filename)
+    if entry is not None:
+        # Extracted files may be modified in place afterwards (the catalog build does), only the member is compared
+        return entry["size"] == info.file_size and entry["crc"] == info.CRC
+    return os.path.getsize(path) == info.file_size and file_crc(path) == info.CRC
+
+
+def extract_archive(zip_path: str, destination: str) -> List[str]:
+    """
+    Extract the members of a zip archive that are missing or differ from the files on disk.
+    Members are streamed one at a time to a temporary file moved into place once complete,
+    and recorded in a manifest next to the archive so that later calls do not read them again.
+    :param zip_path: Path of the archive.
+    :param destination: Directory to extract to.
+    :return: Names of the extracted members.
+    """
+    manifest = read_manifest(zip_path)
+    extracted = []
+    root = os.path.realpath(destination)
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        for info in zip_ref.infolist():
+            path = os.path.realpath(os.path.join(destination, info.filename))
+            if os.path.commonpath([root, path]) != root:
+                logger.warning("Skipping %s, outside of %s", info.filename, destination)
+                continue
+            if info.is_dir():
+                os.makedirs(path, exist_ok=True)
+                continue
+
+            if not is_extracted(info, path, manifest):
+                logger.info("Extracting %s...", info.filename)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                part_path = f"{path}.part"
+                with zip_ref.open(info) as src, open(part_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                os.replace(part_path, path)
+                extracted.append(info.filename)
+
+            entry = {"size": info.file_size, "crc": info.CRC}
+            if manifest.get(info.filename) != entry:
+                manifest[info.filename] = entry
+                write_manifest(zip_path, manifest)
+    return extracted
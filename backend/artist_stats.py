@@ -0,0 +1,54 @@
+import json
+import sqlite3
+from collections import namedtuple
+from typing import Optional
+
+from linker_cache import CACHE_SIZE, CACHE_TTL, LRUCache
+from playlist import Playlist
+
+# Statistics of an artist, precomputed in the artist_stats table by the catalog build.
+# latest_release is a timestamp in milliseconds, None when the artist has no album.
+ArtistStatsRecord = namedtuple("ArtistStatsRecord", ["artist_id", "total_songs", "total_albums", "genres", "latest_release"])
+
+
+class ArtistStats():
+    """
+    Read-through cache in front of the artist_stats table, shared by every agent.
+    Records are immutable, so they are not copied, and artists without statistics are cached as None.
+    The cache is dropped when the catalog is rebuilt.
+    """
+    def __init__(self, db: Playlist, cache_size: int = CACHE_SIZE * 8, cache_ttl: float = CACHE_TTL):
+        self.db = db
+        self.cache = LRUCache(maxsize=cache_size, ttl=cache_ttl, version=self.build_version, copy=False)
+
+    def build_version(self):
+        try:
+            record = self.db.read(table='catalog_meta', data=['value'], where={'key': 'build_version'})
+        except sqlite3.OperationalError:
+            record = None
+        return record[0][0] if record else None
+
+    def get(self, artist_id: str) -> Optional[ArtistStatsRecord]:
+        """
+        :param artist_id: Id of the artist.
+        :return: Statistics of the artist, None if it has none.
+        :raises sqlite3.OperationalError: If the catalog has no artist_stats table yet.
+        """
+        found, stats = self.cache.get(artist_id)
+        if found:
+            return stats
+        record = self.db.read(
+            table='artist_stats',
+            data=['artist_id', 'total_songs', 'total_albums', 'genres', 'latest_release'],
+            where={'artist_id': artist_id},
+            limit=1,
+        )
+        stats = None
+        if record:
+            artist_id, total_songs, total_albums, genres, latest_release = record[0]
+            stats = ArtistStatsRecord(artist_id, total_songs, total_albums, tuple(json.loads(genres)), latest_release)
+        self.cache.put(artist_id, stats)
+        return stats
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats()
@@ -0,0 +1,87 @@
+import argparse
+import gc
+import os
+import random
+import sqlite3
+import string
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from playlist import Playlist
+from knowledge_base import TABLES, KnowledgeBase
+
+# Compare the memory and load time of the knowledge base as lists of tuples and as columnar tables.
+
+
+def random_id() -> str:
+    return "".join(random.choices(string.ascii_letters + string.digits, k=22))
+
+
+def random_name() -> str:
+    return " ".join("".join(random.choices(string.ascii_lowercase, k=random.randint(2, 8))) for _ in range(random.randint(1, 4)))
+
+
+def create_synthetic_db(path: str, songs: int) -> None:
+    """
+    Write songs/artists/albums tables with the columns read by the knowledge base.
+    """
+    conn = sqlite3.connect(path)
+    artist_ids = [random_id() for _ in range(max(1, songs // 10))]
+    album_ids = [random_id() for _ in range(max(1, songs // 5))]
+    album_artists = [random.choice(artist_ids) for _ in album_ids]
+    conn.execute("CREATE TABLE artists (id TEXT, name TEXT, popularity INTEGER)")
+    conn.execute("CREATE TABLE albums (id TEXT, name TEXT, artist_id TEXT, popularity INTEGER)")
+    conn.execute("CREATE TABLE songs (id TEXT, name TEXT, artist_id TEXT, album_id TEXT, popularity INTEGER)")
+    conn.executemany("INSERT INTO artists VALUES (?, ?, ?)", ((id_, random_name(), random.randint(0, 100)) for id_ in artist_ids))
+    conn.executemany("INSERT INTO albums VALUES (?, ?, ?, ?)", ((id_, random_name(), artist_id, random.randint(0, 100)) for id_, artist_id in zip(album_ids, album_artists)))
+    album_choices = list(zip(album_ids, album_artists))
+
+    def song_rows():
+        for _ in range(songs):
+            album_id, artist_id = random.choice(album_choices)
+            yield random_id(), random_name(), artist_id, album_id, random.randint(0, 100)
+
+    conn.executemany("INSERT INTO songs VALUES (?, ?, ?, ?, ?)", song_rows())
+    conn.commit()
+    conn.close()
+
+
+def measure(load):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory benchmark of the knowledge base layouts.")
+    parser.add_argument("--db", default=None, help="Database to load, a synthetic one is generated if omitted.")
+    parser.add_argument("--songs", type=int, default=200000, help="Number of songs of the synthetic database.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db
+        if path is None:
+            path = os.path.join(tmp, "spotify.sqlite")
+            print(f"Generating a synthetic database with {args.songs} songs...")
+            create_synthetic_db(path, args.songs)
+        db = Playlist(id=uuid.uuid4().hex, path=path, init=False)
+
+        layouts = {
+            "tuples": lambda: KnowledgeBase({table: db.read(table=table, data=columns) for table, columns in TABLES.items()}),
+            "columnar": lambda: KnowledgeBase.from_db(db),
+        }
+        for name, load in layouts.items():
+            knowledge_base, current, peak, elapsed = measure(load)
+            rows = sum(len(records) for _, records in knowledge_base.items())
+            print(f"{name:>8}: {rows} rows, {current / 2**20:8.1f} MiB retained, {peak / 2**20:8.1f} MiB peak, loaded in {elapsed:.2f}s")
+            del knowledge_base
+        db.close()
@@ -0,0 +1,56 @@
+import argparse
+import statistics
+import time
+import uuid
+
+from entity_linker import EntityLinker
+from ngram_recall import SAMPLE_UTTERANCES
+from playlist import Playlist
+
+# Mentions per utterance and end-to-end recognition latency of the mention detection modes,
+# on a fixed set of utterances.
+
+UTTERANCES = SAMPLE_UTTERANCES + [
+    "add the song Hotel California by the Eagles",
+    "add Smells Like Teen Spirit",
+    "which album : Hey Jude by The Beatles",
+    "date album : Back in Black AC/DC",
+    "add a song by Adele",
+    "add I want to hear Lose Yourself by Eminem",
+]
+
+
+def measure(entity_linker: EntityLinker, mode: str, repeat: int) -> dict:
+    entity_linker.mention_mode = mode
+    mentions = [len(entity_linker.mention_detection(text)) for text in UTTERANCES]
+    # Warm up the caches of the indexes before timing
+    for text in UTTERANCES:
+        entity_linker.recognize_all(text)
+    latencies = []
+    for _ in range(repeat):
+        for text in UTTERANCES:
+            start = time.perf_counter()
+            entity_linker.recognize_all(text)
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "mentions": statistics.mean(mentions),
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "mean": statistics.mean(latencies),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare n-gram and NER mention detection.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs over the utterances.")
+    args = parser.parse_args()
+
+    db = Playlist(id=uuid.uuid4().hex, init=False)
+    entity_linker = EntityLinker(db=db)
+    results = {mode: measure(entity_linker, mode, args.repeat) for mode in ("ngram", "ner")}
+
+    print(f"{len(UTTERANCES)} utterances, {args.repeat} runs")
+    for mode, result in results.items():
+        print(f"{mode:>6}: {result['mentions']:5.1f} mentions/utterance, "
+              f"latency p50 {result['p50'] * 1000:7.1f} ms, p95 {result['p95'] * 1000:7.1f} ms, mean {result['mean'] * 1000:7.1f} ms")
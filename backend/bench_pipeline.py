@@ -0,0 +1,211 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+import uuid
+from typing import Callable, Dict, List, Tuple
+
+from bench_kb_memory import create_synthetic_db, random_name
+from catalog_build import CatalogBuilder
+from instrumentation import metrics
+
+# Latency and throughput of entity linking and of the agent on a synthetic catalog.
+# Results are written as JSON, with the commit they were measured on, to compare runs across commits.
+#
+#   python bench_pipeline.py --songs 100000 --output bench_results.json
+
+PERCENTILES = (50, 95, 99)
+
+
+def create_catalog(path: str, songs: int) -> None:
+    """
+    Write a synthetic catalog with the tables of bench_kb_memory, plus the columns and tables read by the agent.
+    """
+    create_synthetic_db(path, songs)
+    conn = sqlite3.connect(path)
+    conn.execute("ALTER TABLE artists ADD COLUMN genre TEXT")
+    conn.execute("ALTER TABLE artists ADD COLUMN total_albums INTEGER")
+    conn.execute("ALTER TABLE albums ADD COLUMN release_date INTEGER")
+    conn.execute("ALTER TABLE albums ADD COLUMN total_songs INTEGER")
+    # Drawn in Python, so that the seed of the benchmark sets them
+    artist_rows = [rowid for rowid, in conn.execute("SELECT rowid FROM artists")]
+    conn.executemany("UPDATE artists SET genre = ? WHERE rowid = ?", ((random_name(), rowid) for rowid in artist_rows))
+    album_rows = [rowid for rowid, in conn.execute("SELECT rowid FROM albums")]
+    conn.executemany("UPDATE albums SET release_date = ? WHERE rowid = ?", ((random.randint(0, 1700000000000), rowid) for rowid in album_rows))
+    for table, column in [("songs", "id"), ("songs", "name"), ("songs", "artist_id"), ("songs", "album_id"), ("artists", "id"),
+                          ("artists", "name"), ("albums", "id"), ("albums", "name"), ("albums", "artist_id")]:
+        conn.execute(f"CREATE INDEX idx_{table}_{column} ON {table} ({column})")
+    conn.execute("UPDATE albums SET total_songs = (SELECT COUNT(*) FROM songs WHERE songs.album_id = albums.id)")
+    conn.execute("UPDATE artists SET total_albums = (SELECT COUNT(*) FROM albums WHERE albums.artist_id = artists.id)")
+    CatalogBuilder(path).create_artist_stats(conn)
+    conn.commit()
+    conn.close()
+
+
+def build_corpus(db, size: int) -> Tuple[Dict[str, List[str]], List[str]]:
+    """
+    Utterances of each command about random songs of the catalog, one in four with a typo.
+    :return: The utterances of each command, and the ids of the songs they are about,
+        which must be in the playlist for the remove utterances to remove something.
+    """
+    rows = db.conn.execute(
+        "SELECT songs.id, songs.name, artists.name FROM songs INNER JOIN artists ON songs.artist_id = artists.id ORDER BY RANDOM() LIMIT ?", (size,)
+    ).fetchall()
+    songs = [(title, artist) for _, title, artist in rows]
+
+    def typo(text: str) -> str:
+        if len(text) < 4 or random.random() > 0.25:
+            return text
+        i = random.randrange(len(text) - 1)
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+    return {
+        "add": [f"add {typo(title)} by {typo(artist)}" for title, artist in songs],
+        "remove": [f"remove {typo(title)}" for title, _ in songs],
+        "which album": [f"which album : {typo(title)} {artist}" for title, artist in songs],
+        "give song": [f"give song : {typo(artist)}" for _, artist in songs],
+        "number songs": [f"number songs : {typo(artist)}" for _, artist in songs],
+    }, [song_id for song_id, _, _ in rows]
+
+
+def summarize(latencies: List[float], elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    result = {"count": len(latencies), "throughput": len(latencies) / elapsed if elapsed else 0.0}
+    for p in PERCENTILES:
+        result[f"p{p}_ms"] = latencies[min(len(latencies) - 1, len(latencies) * p // 100)] * 1000 if latencies else None
+    return result
+
+
+def scoring_passes() -> int:
+    # Fuzzy scoring passes over the catalog indexes, one per table scored unless the tables are scored together
+    return metrics.snapshot()["stages"].get("fuzzy_scoring", {}).get("count", 0)
+
+
+def run(call: Callable[[str], object], utterances: List[str]) -> dict:
+    latencies = []
+    passes = scoring_passes()
+    start = time.perf_counter()
+    for text in utterances:
+        call_start = time.perf_counter()
+        call(text)
+        latencies.append(time.perf_counter() - call_start)
+    result = summarize(latencies, time.perf_counter() - start)
+    result["scoring_passes"] = (scoring_passes() - passes) / len(utterances) if utterances else 0.0
+    return result
+
+
+def peak_rss_mib():
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class RecordingConnector():
+    """
+    Stands in for the DialogueConnector of the agent, keeping its responses.
+    """
+    def __init__(self):
+        self.utterances = []
+
+    def register_agent_utterance(self, utterance) -> None:
+        self.utterances.append(utterance)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the entity linker and the agent on a synthetic catalog.")
+    parser.add_argument("--db", default=None, help="Catalog to use, a synthetic one is generated if omitted.")
+    parser.add_argument("--songs", type=int, default=100000, help="Number of songs of the synthetic catalog (10k to 2M).")
+    parser.add_argument("--utterances", type=int, default=200, help="Number of utterances per command.")
+    parser.add_argument("--cache-size", type=int, default=0, help="Size of the entity linker caches, 0 measures uncached linking.")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file the results are appended to.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Imported after parsing, loading spacy takes a while
+    from agent import PlaylistAgent
+    from entity_linker import EntityLinker
+    from playlist import Playlist
+
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db
+        if path is None:
+            path = os.path.join(tmp, "spotify.sqlite")
+            print(f"Generating a synthetic catalog with {args.songs} songs...")
+            create_catalog(path, args.songs)
+        db = Playlist(id=uuid.uuid4().hex, path=path, init=False)
+        db.pool.write(db.create_tables)
+        playlist_id = db.create(table='playlists', data={'name': 'Benchmark'})
+
+        start = time.perf_counter()
+        entity_linker = EntityLinker(db=db, semantic=False, cache_size=args.cache_size)
+        load_seconds = time.perf_counter() - start
+
+        corpus, corpus_song_ids = build_corpus(db, args.utterances)
+        results = {}
+        results["recognize_song"] = run(lambda text: entity_linker.recognize_song(text[4:]), corpus["add"])
+        results["recognize_artist"] = run(entity_linker.recognize_artist, corpus["give song"])
+        results["recognize_album"] = run(entity_linker.recognize_album, corpus["which album"])
+        results["recognize_all"] = run(lambda text: entity_linker.recognize_all(text, types=("artists", "songs")), corpus["which album"])
+
+        agent = PlaylistAgent(id="benchmark")
+        agent.connect_playlist(playlist_id, db, entity_linker)
+        agent._dialogue_connector = RecordingConnector()
+        # No delayed suggestions, they would be sent from the scheduler thread during the next measurements
+        agent.check_for_suggestions = lambda: None
+        # The songs of the remove utterances are in the playlist
+        for song_id in corpus_song_ids:
+            try:
+                db.create(table='playlist_songs', data={'playlist_id': playlist_id, 'song_id': song_id})
+            except sqlite3.IntegrityError:
+                pass
+
+        from dialoguekit.core.utterance import Utterance
+        from dialoguekit.participant.participant import DialogueParticipant
+        for command, utterances in corpus.items():
+            results[f"agent {command}"] = run(
+                lambda text: agent.receive_utterance(Utterance(text, participant=DialogueParticipant.USER)), utterances
+            )
+
+        report = {
+            "commit": git_commit(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "songs": len(entity_linker.knowledge_base["songs"]),
+            "utterances": args.utterances,
+            "cache_size": args.cache_size,
+            "linker_load_seconds": load_seconds,
+            "peak_rss_mib": peak_rss_mib(),
+            "results": results,
+        }
+        db.close()
+
+    print(f"{report['songs']} songs, linker loaded in {load_seconds:.1f}s, peak RSS {report['peak_rss_mib']} MiB")
+    for name, result in results.items():
+        print(f"{name:>20}: p50 {result['p50_ms']:8.2f} ms, p95 {result['p95_ms']:8.2f} ms, p99 {result['p99_ms']:8.2f} ms, {result['throughput']:8.1f}/s, "
+          f"{result['scoring_passes']:.1f} scoring passes")
+
+    runs = []
+    if os.path.exists(args.output):
+        with open(args.output, "r") as f:
+            runs = json.load(f)
+    runs.append(report)
+    with open(args.output, "w") as f:
+        json.dump(runs, f, indent=2)
+    print(f"Results appended to {args.output}")
@@ -0,0 +1,67 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+
+from bench_kb_memory import create_synthetic_db
+from playlist import Playlist
+
+# Statements per second of the lookups done by the agent and the platform,
+# with values interpolated in the SQL text (one new statement per value) and bound as parameters.
+
+
+def interpolated(db: Playlist, table: str, data: list, where: dict) -> list:
+    # How Playlist.read was called before, kept for comparison
+    request = 'SELECT ' + ', '.join(data) + ' FROM ' + table
+    request += ' WHERE ' + ' AND '.join([f'{key} = "{value}"' for key, value in where.items()])
+    return db.conn.execute(request).fetchall()
+
+
+def bound(db: Playlist, table: str, data: list, where: dict) -> list:
+    return db.read(table=table, data=data, where=where)
+
+
+def run(query, db: Playlist, lookups: list, seconds: float) -> float:
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for table, data, where in lookups:
+            query(db, table, data, where)
+        count += len(lookups)
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark of interpolated and bound lookups.")
+    parser.add_argument("--db", default=None, help="Database to query, a synthetic one is generated if omitted.")
+    parser.add_argument("--songs", type=int, default=100000, help="Number of songs of the synthetic database.")
+    parser.add_argument("--lookups", type=int, default=2000, help="Number of distinct lookups.")
+    parser.add_argument("--seconds", type=float, default=3.0, help="Duration of each run.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db
+        if path is None:
+            path = os.path.join(tmp, "spotify.sqlite")
+            print(f"Generating a synthetic database with {args.songs} songs...")
+            create_synthetic_db(path, args.songs)
+        db = Playlist(id=uuid.uuid4().hex, path=path, init=False)
+        for name, table, column in [("idx_artists_id", "artists", "id"), ("idx_artists_name", "artists", "name"), ("idx_albums_artist_id", "albums", "artist_id")]:
+            db.pool.write(lambda conn: conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({column})"))
+
+        artists = random.sample(db.read(table="artists", data=["id", "name"]), args.lookups)
+        lookups = []
+        for artist_id, name in artists:
+            lookups.append(("artists", ["id"], {"name": name}))
+            lookups.append(("artists", ["id", "name", "popularity"], {"id": artist_id}))
+            lookups.append(("albums", ["id"], {"artist_id": artist_id}))
+
+        for query in (interpolated, bound):
+            # Same rows, except that the interpolated query fails on names containing a double quote
+            rate = run(query, db, lookups, args.seconds)
+            print(f"{query.__name__:>12}: {rate:10.0f} statements/s")
+        db.close()
@@ -0,0 +1,294 @@
+import logging
+import os
+import sqlite3
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Tables and columns of the 8M tracks archive that the build reads from
+SOURCE_INDEXES = [
+    ("idx_audio_features_id", "audio_features", "id"),
+    ("idx_tracks_audio_feature_id", "tracks", "audio_feature_id"),
+    ("idx_tracks_id", "tracks", "id"),
+    ("idx_artists_id", "artists", "id"),
+    ("idx_artists_name", "artists", "name"),
+    ("idx_albums_id", "albums", "id"),
+    ("idx_albums_name", "albums", "name"),
+    ("idx_r_artist_genre_genre_id", "r_artist_genre", "genre_id"),
+    ("idx_r_artist_genre_artist_id", "r_artist_genre", "artist_id"),
+    ("idx_r_track_artist_artist_id", "r_track_artist", "artist_id"),
+    ("idx_r_track_artist_track_id", "r_track_artist", "track_id"),
+    ("idx_r_albums_artists_artist_id", "r_albums_artists", "artist_id"),
+    ("idx_r_albums_artists_album_id", "r_albums_artists", "album_id"),
+    ("idx_r_albums_tracks_album_id", "r_albums_tracks", "album_id"),
+    ("idx_r_albums_tracks_track_id", "r_albums_tracks", "track_id"),
+]
+
+SONGS_INDEXES = [
+    ("idx_songs_id", "songs", "id"),
+    ("idx_songs_name", "songs", "name"),
+    ("idx_songs_album_id", "songs", "album_id"),
+    ("idx_songs_artist_id", "songs", "artist_id"),
+]
+
+# Stages done by the single-script populate_data, used to adopt databases built before checkpoints existed
+LEGACY_STAGES = [
+    "source_indexes", "sample_tracks", "songs", "albums_artist_id",
+    "artists_genre", "albums_total_songs", "artists_total_albums", "schema_export",
+]
+
+# PRAGMAs for the bulk phases: WAL with synchronous=NORMAL keeps the file consistent if the build is interrupted
+BULK_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -262144,  # 256 MiB
+    "temp_store": "MEMORY",
+}
+
+
+class CatalogBuilder():
+    """
+    Builds the catalog tables of the database (songs, album and artist aggregates) in stages.
+    Each stage runs in its own transaction together with its checkpoint, so an interrupted build
+    resumes at the first stage that did not commit.
+    """
+    def __init__(self, path: str = os.path.join("data", "spotify.sqlite"), sample_size: int = 1500000):
+        self.path = path
+        self.sample_size = sample_size
+        self.stages = [
+            ("source_indexes", self.create_source_indexes),
+            ("sample_tracks", self.sample_tracks),
+            ("songs", self.create_songs),
+            ("albums_artist_id", self.update_albums_artist_id),
+            ("artists_genre", self.update_artists_genre),
+            ("albums_total_songs", self.update_albums_total_songs),
+            ("artists_total_albums", self.update_artists_total_albums),
+            ("artist_stats", self.create_artist_stats),
+            ("analyze", self.analyze),
+            ("schema_export", self.export_schema),
+        ]
+
+    def connect(self) -> sqlite3.Connection:
+        # Transactions are managed explicitly, one per stage
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.text_factory = lambda x: x.decode('utf-8', errors='ignore')
+        return conn
+
+    def completed_stages(self, conn: sqlite3.Connection) -> set:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS build_stages (
+                name TEXT PRIMARY KEY,
+                seconds REAL,
+                completed_at REAL
+            );
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        ''')
+        completed = {row[0] for row in conn.execute("SELECT name FROM build_stages")}
+        if not completed and self.has_column(conn, "artists", "total_albums"):
+            logger.info("Adopting a catalog built without checkpoints...")
+            conn.executemany("INSERT INTO build_stages (name, seconds, completed_at) VALUES (?, NULL, ?)", [(name, time.time()) for name in LEGACY_STAGES])
+            completed = set(LEGACY_STAGES)
+        return completed
+
+    def pending_stages(self) -> list:
+        if not os.path.exists(self.path):
+            return [name for name, _ in self.stages]
+        conn = self.connect()
+        try:
+            completed = self.completed_stages(conn)
+        finally:
+            conn.close()
+        return [name for name, _ in self.stages if name not in completed]
+
+    def is_complete(self) -> bool:
+        return not self.pending_stages()
+
+    def run(self) -> None:
+        """
+        Run the stages that have not completed yet, reporting the time taken by each one.
+        """
+        conn = self.connect()
+        try:
+            conn.execute('PRAGMA encoding = "UTF-8"')
+            for pragma, value in BULK_PRAGMAS.items():
+                conn.execute(f"PRAGMA {pragma} = {value}")
+
+            completed = self.completed_stages(conn)
+            start = time.perf_counter()
+            for name, stage in self.stages:
+                if name in completed:
+                    logger.info("Stage %s: already done", name)
+                    continue
+                logger.info("Stage %s...", name)
+                stage_start = time.perf_counter()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    stage(conn)
+                    seconds = time.perf_counter() - stage_start
+                    conn.execute("INSERT INTO build_stages (name, seconds, completed_at) VALUES (?, ?, ?)", (name, seconds, time.time()))
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                logger.info("Stage %s: done in %.1fs", name, seconds)
+
+            conn.execute("INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('build_version', ?)", (uuid.uuid4().hex,))
+            logger.info("Catalog build finished in %.1fs", time.perf_counter() - start)
+            res = conn.execute('SELECT COUNT(*) FROM songs;')
+            logger.info("Total songs: %d", res.fetchone()[0])
+        finally:
+            # synchronous, cache_size and temp_store only last as long as this connection, WAL stays on the file
+            conn.close()
+
+    @staticmethod
+    def has_column(conn: sqlite3.Connection, table: str, column: str) -> bool:
+        return any(row[1] == column for row in conn.execute(f"PRAGMA table_info('{table}');"))
+
+    def add_column(self, conn: sqlite3.Connection, table: str, column: str, type_: str) -> None:
+        if not self.has_column(conn, table, column):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {type_};")
+
+    @staticmethod
+    def create_indexes(conn: sqlite3.Connection, indexes: list) -> None:
+        for name, table, column in indexes:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({column});")
+
+    def create_source_indexes(self, conn: sqlite3.Connection) -> None:
+        self.create_indexes(conn, SOURCE_INDEXES)
+
+    def sample_tracks(self, conn: sqlite3.Connection) -> None:
+        # Keep the ids of the sample instead of deleting the other tracks, which would rewrite most of the table
+        conn.execute("DROP TABLE IF EXISTS sampled_tracks;")
+        conn.execute("CREATE TABLE sampled_tracks (id TEXT PRIMARY KEY) WITHOUT ROWID;")
+        conn.execute("INSERT OR IGNORE INTO sampled_tracks (id) SELECT id FROM tracks ORDER BY RANDOM() LIMIT ?;", (self.sample_size,))
+
+    def create_songs(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DROP TABLE IF EXISTS songs;")
+        conn.execute('''
+            CREATE TABLE songs AS
+            SELECT tracks.*, audio_features.*, r_track_artist.*, r_albums_tracks.*
+            FROM sampled_tracks
+            INNER JOIN tracks ON tracks.id = sampled_tracks.id
+            INNER JOIN audio_features ON tracks.audio_feature_id = audio_features.id
+            INNER JOIN r_track_artist ON tracks.id = r_track_artist.track_id
+            INNER JOIN r_albums_tracks ON tracks.id = r_albums_tracks.track_id;
+        ''')
+        self.create_indexes(conn, SONGS_INDEXES)
+
+    def update_albums_artist_id(self, conn: sqlite3.Connection) -> None:
+        self.add_column(conn, "albums", "artist_id", "TEXT")
+        conn.execute('''
+            UPDATE albums
+            SET artist_id = album_artists.artist_id
+            FROM (
+                -- The first relation row, the main artist, as the correlated subquery this replaces (bare column of MIN)
+                SELECT album_id, artist_id, MIN(rowid)
+                FROM r_albums_artists
+                GROUP BY album_id
+            ) AS album_artists
+            WHERE album_artists.album_id = albums.id;
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_albums_artist_id ON albums (artist_id);")
+
+    def update_artists_genre(self, conn: sqlite3.Connection) -> None:
+        self.add_column(conn, "artists", "genre", "TEXT")
+        conn.execute('''
+            UPDATE artists
+            SET genre = artist_genres.genre_id
+            FROM (
+                -- The first relation row, the main genre (bare column of MIN)
+                SELECT artist_id, genre_id, MIN(rowid)
+                FROM r_artist_genre
+                GROUP BY artist_id
+            ) AS artist_genres
+            WHERE artist_genres.artist_id = artists.id;
+        ''')
+
+    def update_albums_total_songs(self, conn: sqlite3.Connection) -> None:
+        self.add_column(conn, "albums", "total_songs", "INTEGER")
+        conn.execute("UPDATE albums SET total_songs = 0;")
+        conn.execute('''
+            UPDATE albums
+            SET total_songs = album_songs.total
+            FROM (
+                SELECT album_id, COUNT(*) AS total
+                FROM songs
+                GROUP BY album_id
+            ) AS album_songs
+            WHERE album_songs.album_id = albums.id;
+        ''')
+
+    def update_artists_total_albums(self, conn: sqlite3.Connection) -> None:
+        self.add_column(conn, "artists", "total_albums", "INTEGER")
+        conn.execute("UPDATE artists SET total_albums = 0;")
+        conn.execute('''
+            UPDATE artists
+            SET total_albums = artist_albums.total
+            FROM (
+                SELECT artist_id, COUNT(*) AS total
+                FROM albums
+                GROUP BY artist_id
+            ) AS artist_albums
+            WHERE artist_albums.artist_id = artists.id;
+        ''')
+
+    def create_artist_stats(self, conn: sqlite3.Connection) -> None:
+        """
+        One row per artist with what the agent answers about it, read with a single keyed lookup.
+        genres is a JSON array, latest_release a timestamp in milliseconds as albums.release_date.
+        """
+        conn.execute("DROP TABLE IF EXISTS artist_stats;")
+        conn.execute('''
+            CREATE TABLE artist_stats (
+                artist_id TEXT PRIMARY KEY,
+                total_songs INTEGER NOT NULL,
+                total_albums INTEGER NOT NULL,
+                genres TEXT NOT NULL,
+                latest_release INTEGER
+            ) WITHOUT ROWID;
+        ''')
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'r_artist_genre'").fetchone():
+            # In relation order, the main genre first as in artists.genre
+            genres = "SELECT artist_id, json_group_array(genre_id) AS genres FROM (SELECT artist_id, genre_id FROM r_artist_genre ORDER BY rowid) GROUP BY artist_id"
+        else:
+            # Catalogs without the relation table only have the main genre
+            genres = "SELECT id AS artist_id, json_array(genre) AS genres FROM artists WHERE genre IS NOT NULL"
+        conn.execute(f'''
+            INSERT OR IGNORE INTO artist_stats (artist_id, total_songs, total_albums, genres, latest_release)
+            SELECT artists.id,
+                   COALESCE(artist_albums.total_songs, 0),
+                   COALESCE(artist_albums.total_albums, 0),
+                   COALESCE(artist_genres.genres, '[]'),
+                   artist_albums.latest_release
+            FROM artists
+            LEFT JOIN (
+                SELECT artist_id, COUNT(*) AS total_albums, SUM(total_songs) AS total_songs, MAX(release_date) AS latest_release
+                FROM albums
+                GROUP BY artist_id
+            ) AS artist_albums ON artist_albums.artist_id = artists.id
+            LEFT JOIN ({genres}) AS artist_genres ON artist_genres.artist_id = artists.id
+            WHERE artists.id IS NOT NULL;
+        ''')
+
+    def analyze(self, conn: sqlite3.Connection) -> None:
+        conn.execute("ANALYZE;")
+
+    def export_schema(self, conn: sqlite3.Connection) -> None:
+        table_names = [table[0] for table in conn.execute("SELECT name FROM sqlite_master WHERE type='table';")]
+        logger.info("Tables: %s", table_names)
+
+        schema_dir = os.path.join(os.path.dirname(self.path), "new_schema")
+        os.makedirs(schema_dir, exist_ok=True)
+        for table_name in table_names:
+            column_names = [column[1] for column in conn.execute(f"PRAGMA table_info('{table_name}');")]
+            with open(os.path.join(schema_dir, f"{table_name}.csv"), "w") as f:
+                f.write(",".join(column_names) + "\n")
+                row = conn.execute(f"SELECT * FROM {table_name} LIMIT 1;").fetchone()
+                if row:
+                    f.write(",".join([str(column) for column in row]) + "\n")
@@ -0,0 +1,73 @@
+import re
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from instrumentation import metrics
+
+
+class CommandRouter():
+    """Routes an utterance to the handler of the command it starts with.
+
+    The command names are compiled into one anchored regex, so dispatch is a single match whatever
+    the number of commands, and a command name inside an argument (e.g. a song title) is never
+    taken for a command. Each command is timed as the `command:<name>` stage, its failures are
+    counted as `command_errors:<name>`.
+    """
+
+    def __init__(self) -> None:
+        self.handlers: Dict[str, Callable[[str], object]] = {}
+        self.pattern: Optional[re.Pattern] = None
+
+    def register(self, name: str, handler: Callable[[str], object]) -> None:
+        """Registers the handler of a command.
+
+        Args:
+            name: Command name, e.g. "date album", matched case-insensitively.
+            handler: Called with the text after the command and its optional ":".
+        """
+        self.handlers[name.lower()] = handler
+        self.pattern = None
+
+    def compile(self, names: Iterable[str]) -> re.Pattern:
+        # Longest first, so that "number albums" is not cut to a shorter command
+        alternatives = "|".join(re.escape(name).replace(r"\ ", r"\s+") for name in sorted(names, key=len, reverse=True))
+        return re.compile(rf"^\s*({alternatives})(?:\s*:|\b)\s*(.*)$", re.IGNORECASE | re.DOTALL)
+
+    def match(self, text: str) -> Optional[Tuple[str, str]]:
+        """Finds the command of a text.
+
+        Args:
+            text: User utterance.
+
+        Returns:
+            (command name, argument), or None if the text does not start with a command.
+        """
+        if self.pattern is None:
+            self.pattern = self.compile(self.handlers)
+        match = self.pattern.match(text)
+        if match is None:
+            return None
+        return " ".join(match.group(1).lower().split()), match.group(2).strip()
+
+    def dispatch(self, text: str) -> Optional[Tuple[str, object]]:
+        """Runs the handler of the command of a text.
+
+        Args:
+            text: User utterance.
+
+        Returns:
+            (command name, result of the handler), None if no command matches.
+
+        Raises:
+            Exception: Whatever the handler raises, after counting it.
+        """
+        found = self.match(text)
+        if found is None:
+            metrics.increment("command_unknown")
+            return None
+        name, argument = found
+        with metrics.timer(f"command:{name}"):
+            try:
+                return name, self.handlers[name](argument)
+            except Exception:
+                metrics.increment(f"command_errors:{name}")
+                raise
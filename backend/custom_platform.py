@@ -1,23 +1,36 @@
 from __future__ import annotations
 import os, uuid
 
-from flask import request
+from flask import abort, request, jsonify
 
 from dialoguekit.platforms.flask_socket_platform import FlaskSocketPlatform, logger, SocketIORequest, ChatNamespace
 from dialoguekit.connector import DialogueConnector
-from typing import Type, Dict, Any, List, cast
+from typing import Callable, Type, Dict, Any, List, Tuple, cast
 from dataclasses import asdict, dataclass
 from dialoguekit.core import Utterance, AnnotatedUtterance
+from dialoguekit.participant.participant import DialogueParticipant
 import sqlite3
 
 from custom_user import CustomUser
 from playlist import Playlist
+from accounts import Accounts, AuthenticationError
+from artist_stats import ArtistStats
+from catalog_build import CatalogBuilder
 from entity_linker import EntityLinker
+from linker_service import LinkerClient
+from recommender import CatalogRecommender, MAX_RECOMMENDATIONS
+from playlist_sync import PlaylistSync
+from request_pipeline import RequestPipeline, WORKERS, MAX_PENDING
+from instrumentation import metrics
+from session_manager import SessionManager, IDLE_TIMEOUT, AGENT_POOL_SIZE
 
 from song import Song
 
 from dialoguekit.participant import Agent
 
+# Addresses allowed to read /metrics and /sessions unless they are public
+LOCAL_ADDRESSES = {"127.0.0.1", "::1"}
+
 @dataclass
 class CustomMessage:
     text: str
@@ -34,8 +47,6 @@ class CustomMessage:
         Returns:
             An instance of Message.
         """
-        print("Converting message...")
-        print(utterance.annotations)
         message = CustomMessage(utterance.text)
         if isinstance(utterance, AnnotatedUtterance):
             message.intent = str(utterance.intent)
@@ -43,7 +54,7 @@ class CustomMessage:
                         {"slot": annotation.slot, "value": annotation.value}
                         for annotation in utterance.annotations
                     ]
-        print(message)
+        logger.debug("Message: %s", message)
         return message
 
 @dataclass
@@ -53,54 +64,287 @@ class CustomResponse:
 
 class CustomPlatform(FlaskSocketPlatform):
 
-    def __init__(self, agent_class: Type[Agent]) -> None:
+    def __init__(
+        self,
+        agent_class: Type[Agent],
+        workers: int = WORKERS,
+        max_pending: int = MAX_PENDING,
+        linker_processes: int = 0,
+        linker_address: str | Tuple[str, int] = None,
+        idle_timeout: float = IDLE_TIMEOUT,
+        agent_pool_size: int = AGENT_POOL_SIZE,
+        public_stats: bool = False,
+    ) -> None:
+        """
+        Args:
+            agent_class: Class of the agent.
+            workers: Number of threads processing user requests.
+            max_pending: Maximum number of requests waiting for a worker before users are asked to wait.
+            linker_processes: Run entity linking in this many worker processes, 0 runs it in this process.
+            linker_address: Socket path, or (host, port), of a running linker_service.py, used instead of local processes.
+            idle_timeout: Seconds without requests after which a session is closed.
+            agent_pool_size: Number of agents of closed sessions kept for new sessions.
+            public_stats: Serve /metrics and /sessions to any client, instead of
+                only to requests from this host.
+        """
         super().__init__(agent_class=agent_class)
-        self._active_users: Dict[str, CustomUser] = {}
+        self.sessions = SessionManager(self.get_new_agent, idle_timeout=idle_timeout, pool_size=agent_pool_size, on_expire=self.expire)
+        # Playlist of each session, the shared playlist until the user logs in
+        self.playlists: Dict[str, int] = {}
+        self.pipeline = RequestPipeline(workers=workers, max_pending=max_pending)
         if os.path.exists('data/spotify.sqlite'):
             self.db = Playlist(id=uuid.uuid4().hex, init=False)
+            # Adds the tables and columns of newer versions, migrating the existing rows
+            self.db.pool.write(self.db.create_tables)
         else:
             self.db = Playlist(id=uuid.uuid4().hex)
+        # Resumes an interrupted build where it stopped
+        if not CatalogBuilder(self.db.path).is_complete():
             self.db.populate_data()
 
-        playlist = self.db.read(table='playlists', data=['playlist_id'], where=f'name = "My Playlist"')
-        if not playlist:
-            self.playlist = self.db.create(table='playlists', data={'name': 'My Playlist'})
-        else:
-            self.playlist = playlist[0][0]
+        self.accounts = Accounts(self.db)
+        self.playlist = self.accounts.shared_playlist()
+        self.artist_stats = ArtistStats(self.db)
 
-        if os.path.exists(os.path.join('data', 'models', 'ner_model', 'model-best')):
-            self.entity_linker = EntityLinker(db=self.db)
+        if linker_address:
+            self.entity_linker = LinkerClient.connect(self.db, linker_address)
+        elif os.path.exists(os.path.join('data', 'models', 'ner_model', 'model-best')):
+            self.entity_linker = LinkerClient.local(self.db, processes=linker_processes) if linker_processes else EntityLinker(db=self.db)
         else:
             self.entity_linker = EntityLinker(db=self.db, train=True)
 
+        try:
+            self.recommender = CatalogRecommender(self.db, self.entity_linker)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Recommendations disabled, the songs table has no audio features: {e}")
+            self.recommender = None
+
+        self.playlist_sync = PlaylistSync(self.db, self.emit)
+        self.public_stats = public_stats
+        self.app.add_url_rule("/metrics", "metrics", self.get_metrics)
+        self.app.add_url_rule("/sessions", "sessions", self.get_sessions)
+        self.sessions.start_sweeping()
+
+    def emit(self, event: str, data: Any, user_id: str) -> None:
+        """Emits an event to a client.
+
+        Args:
+            event: Event name.
+            data: Event payload.
+            user_id: User ID.
+        """
+        with metrics.timer("emit"):
+            self.socketio.emit(event, data, room=user_id)
+
+    def check_stats_access(self) -> None:
+        """Rejects the current HTTP request with a 403 unless statistics are public or it comes from this host."""
+        if not self.public_stats and request.remote_addr not in LOCAL_ADDRESSES:
+            abort(403)
+
+    def get_metrics(self):
+        """Returns the stage timers and counters of the platform, with the linker worker and cache ones.
+
+        Returns:
+            JSON response.
+        """
+        self.check_stats_access()
+        snapshot = metrics.snapshot()
+        if isinstance(self.entity_linker, LinkerClient):
+            snapshot["linker"] = self.entity_linker.metrics()
+        snapshot["linker_cache"] = self.entity_linker.cache_stats()
+        snapshot["artist_stats_cache"] = self.artist_stats.cache_stats()
+        snapshot["sessions"] = self.sessions.stats()
+        return jsonify(snapshot)
+
+    def get_sessions(self):
+        """Returns the live sessions with an estimate of the memory each one holds.
+
+        The estimates are listed largest first, without the user IDs: those are
+        the Socket.IO session IDs that identify a client in its requests.
+
+        Returns:
+            JSON response.
+        """
+        self.check_stats_access()
+        shared = [self, self.db, self.entity_linker, self.recommender, self.playlist_sync, self.pipeline, self.accounts, self.artist_stats, self.sessions]
+        memory = self.sessions.memory_estimates(shared)
+        return jsonify({
+            **self.sessions.stats(),
+            "memory_bytes": sum(memory.values()),
+            "sessions_memory_bytes": sorted(memory.values(), reverse=True),
+        })
+
+    def get_user(self, user_id: str) -> CustomUser:
+        """Returns the user of a live session.
+
+        Args:
+            user_id: User ID.
+
+        Returns:
+            The user, None if the session is closed.
+        """
+        session = self.sessions.get(user_id)
+        return session.user if session else None
+
     def connect(self, user_id: str) -> None:
         """Connects a user to an agent.
 
         Args:
             user_id: User ID.
         """
-        print("Connecting...")
-        self._active_users[user_id] = CustomUser(user_id)
-
-        agent = self.get_new_agent()
-        agent.connect_playlist(self.playlist, self.db, self.entity_linker)
-        commands = agent.get_commands()
+        session = self.sessions.open(user_id, CustomUser(user_id))
+        commands = session.agent.get_commands()
         self.socketio.emit("commands", commands, room=user_id)
-        
-        user = self._active_users[user_id]
-        user.connect_playlist(self.playlist, self.db)
-    
-        print(f"platform playlist id {self.playlist}")
-        songs = self.db.read_songs_from_playlist(playlist_id=self.playlist, data=('songs.name', 'artists.name', 'albums.name'))
-        song_data = [{"title": song[0], "artist": song[1], "album": song[2]} for song in songs]
-        self.socketio.emit("playlist", song_data, room=user_id)
-
-        dialogue_connector = DialogueConnector(
-            agent=agent,
-            user=user,
+
+        # The session keeps its playlist when it is reopened after an idle timeout
+        self.connect_playlist(user_id, self.playlist_of(user_id))
+
+        session.connector = DialogueConnector(
+            agent=session.agent,
+            user=session.user,
             platform=self,
         )
-        dialogue_connector.start()
+        session.connector.start()
+
+    def disconnect(self, user_id: str) -> None:
+        """Stops sending playlist changes to a user and disconnects it.
+
+        Args:
+            user_id: User ID.
+        """
+        self.playlist_sync.unsubscribe(user_id)
+        self.pipeline.cancel(user_id)
+        self.playlists.pop(user_id, None)
+        self.close_session(user_id)
+
+    def expire(self, user_id: str) -> None:
+        """Closes an idle session, the client starts a new conversation on its next message.
+
+        Args:
+            user_id: User ID.
+        """
+        self.close_session(user_id)
+        self.socketio.emit("restart", room=user_id)
+
+    def close_session(self, user_id: str) -> None:
+        """Closes a session, its agent is pooled once its running request, if any, is done.
+
+        Args:
+            user_id: User ID.
+        """
+        session = self.sessions.detach(user_id)
+        if session is None:
+            return
+        # Queued after the requests of the session, so that no request uses the agent once it is pooled
+        if not self.pipeline.submit(user_id, lambda: self.sessions.teardown(session)):
+            self.sessions.teardown(session, reuse=False)
+
+    def playlist_of(self, user_id: str) -> int:
+        """Returns the ID of the playlist a session works on.
+
+        Args:
+            user_id: User ID.
+        """
+        return self.playlists.get(user_id, self.playlist)
+
+    def connect_playlist(self, user_id: str, playlist_id: int) -> None:
+        """Points the agent, the user and the playlist updates of a session to a playlist.
+
+        Args:
+            user_id: User ID.
+            playlist_id: Playlist ID.
+        """
+        self.playlists[user_id] = playlist_id
+        session = self.sessions.get(user_id)
+        if session is not None:
+            session.agent.connect_playlist(playlist_id, self.db, self.entity_linker, self.recommender, self.playlist_sync, self.artist_stats)
+            session.user.connect_playlist(playlist_id, self.db)
+        self.playlist_sync.unsubscribe(user_id)
+        self.playlist_sync.subscribe(playlist_id, user_id)
+        self.playlist_sync.send_snapshot(playlist_id, user_id)
+
+    def authenticate(self, user_id: str, credentials: dict, register: bool = False) -> None:
+        """Logs a session in, or registers a new user, and switches it to the playlist of that user.
+
+        Args:
+            user_id: User ID.
+            credentials: Dictionary with the username and password.
+            register: Whether to create the user.
+        """
+        username, password = credentials.get("username"), credentials.get("password")
+        try:
+            if register:
+                account = self.accounts.register(username, password)
+            else:
+                account = self.accounts.login(username, password)
+        except AuthenticationError as e:
+            self.socketio.emit("authentication", {"success": False, "error": str(e)}, room=user_id)
+            return
+        if user_id not in self.playlists:
+            # Disconnected meanwhile
+            return
+        self.connect_playlist(user_id, self.accounts.playlist_of(account))
+        self.socketio.emit("authentication", {"success": True, "error": None}, room=user_id)
+
+    def dispatch(self, user_id: str, request: Callable[[], None]) -> None:
+        """Runs a request of a user on the worker pool, after the previous requests of that user.
+
+        Args:
+            user_id: User ID.
+            request: The request handler, called without arguments.
+        """
+        self.sessions.touch(user_id)
+        if not self.pipeline.submit(user_id, request):
+            metrics.increment("requests_rejected")
+            self.display_agent_utterance(
+                user_id,
+                AnnotatedUtterance(
+                    "I'm still working on previous requests, please try again in a moment.",
+                    participant=DialogueParticipant.AGENT,
+                ),
+            )
+
+    def message(self, user_id: str, text: str) -> None:
+        """Queues a user input, the agent processes it on a worker thread.
+
+        Args:
+            user_id: User ID.
+            text: User input.
+        """
+        self.dispatch(user_id, lambda: self.handle_message(user_id, text))
+
+    def handle_message(self, user_id: str, text: str) -> None:
+        """Passes a queued user input to the user of its session.
+
+        The session is looked up when the request runs, since it can expire or
+        be closed while the request waits for a worker. An expired session is
+        reopened; the input of a client that disconnected is dropped.
+
+        Args:
+            user_id: User ID.
+            text: User input.
+        """
+        user = self.get_user(user_id)
+        if user is None:
+            if user_id not in self.playlists:
+                logger.info(f"Dropping a message of {user_id}, disconnected before it was processed")
+                return
+            # Expired while idle, or while the message was queued
+            self.connect(user_id)
+            user = self.get_user(user_id)
+        user.handle_input(text)
+
+    def sync(self, user_id: str) -> None:
+        """Sends the playlist snapshot to a client that missed a revision.
+
+        Args:
+            user_id: User ID.
+        """
+        self.playlist_sync.send_snapshot(self.playlist_of(user_id), user_id)
+
+    def song_added(self, user_id: str, song: Song) -> None:
+        songs = self.entity_linker.songs_from_ids([song.id])
+        self.playlist_sync.added(self.playlist_of(user_id), songs[0] if songs else song)
 
     def start(self, host: str = "127.0.0.1", port: str = "5000") -> None:
         """Starts the platform.
@@ -109,7 +353,7 @@ class CustomPlatform(FlaskSocketPlatform):
             host: Hostname.
             port: Port.
         """
-        print("Starting namespace...")
+        logger.info("Starting namespace...")
         self.socketio.on_namespace(CustomNamespace("/", self))
         self.socketio.run(self.app, host=host, port=port)
 
@@ -123,64 +367,72 @@ class CustomPlatform(FlaskSocketPlatform):
             utterance: An instance of Utterance.
         """
         message = CustomMessage.from_utterance(utterance)
-        self.socketio.send(
-            asdict(CustomResponse(user_id, message)),
-            room=user_id,
-        )
+        with metrics.timer("emit"):
+            self.socketio.send(
+                asdict(CustomResponse(user_id, message)),
+                room=user_id,
+            )
 
     def remove(self, user_id: str, remove: dict) -> None:
-        song = Song(remove["title"], remove["artist"], remove["album"])
+        song = Song(id_=remove.get("id"), title=remove["title"], artist_name=remove["artist"], album_name=remove["album"])
         try:
-            artist_record = self.db.read(table='artists', data=['id'], where=f'name = "{song.artist_name}"')
-            song_record = self.db.read(table='songs', data=['id'], where=f'name = "{song.title}" AND artist_id = "{artist_record[0][0]}"')
-            song_id = song_record[0][0]
-            playlist_song_record = self.db.read(table='playlist_songs', data=['playlist_id'], where=f'playlist_id = "{self.playlist}" AND song_id = "{song_id}"')
-            print(f"deleted playlist_song _record: {playlist_song_record}")
-            self.db.delete(table='playlist_songs', data={'playlist_id': self.playlist, 'song_id': song_id})
+            if song.id:
+                song_id = song.id
+            else:
+                artist_record = self.db.read(table='artists', data=['id'], where={'name': song.artist_name})
+                song_record = self.db.read(table='songs', data=['id'], where={'name': song.title, 'artist_id': artist_record[0][0]})
+                song_id = song_record[0][0]
+            playlist_id = self.playlist_of(user_id)
+            with self.playlist_sync.playlist_lock(playlist_id):
+                if self.db.delete(table='playlist_songs', data={'playlist_id': playlist_id, 'song_id': song_id}):
+                    self.playlist_sync.removed(playlist_id, song_id)
 
         except Exception as e:
-            print(f"Error: {e}")
+            logger.warning(f"Error: {e}")
             
 
     def add(self, user_id: str, add: dict) -> None:
         if "id" in add:
-            try: 
-                self.db.create(table='playlist_songs', data={'playlist_id': self.playlist, 'song_id': add["id"]})
-            except sqlite3.IntegrityError as e:
-                print(e)
-                self.socketio.emit("add:response", {"status": "KO", "message": "Song already in playlist"}, room=user_id)
-                return
-            songs = self.db.read_songs_from_playlist(playlist_id=self.playlist, data=('songs.name', 'artists.name', 'albums.name'))
-            song_data = [{"title": song[0], "artist": song[1], "album": song[2]} for song in songs]
-            self.socketio.emit("playlist", song_data, room=user_id)
+            playlist_id = self.playlist_of(user_id)
+            with self.playlist_sync.playlist_lock(playlist_id):
+                try: 
+                    self.db.create(table='playlist_songs', data={'playlist_id': playlist_id, 'song_id': add["id"]})
+                except sqlite3.IntegrityError as e:
+                    logger.info(e)
+                    self.socketio.emit("add:response", {"status": "KO", "message": "Song already in playlist"}, room=user_id)
+                    return
+                self.song_added(user_id, Song(id_=add["id"], title=add.get("title"), artist_name=add.get("artist"), album_name=add.get("album")))
             return
 
         else:
-            song = Song(title=add["title"], artist_name=add["artist"], album_name=add["album"])
-            print(song.album_name, song.artist_name, song.title)
-            artist_record = self.db.read(table='artists', data=['id'], where=f'name = "{song.artist_name}"')
+            song = Song(id_=None, title=add["title"], artist_name=add["artist"], album_name=add["album"])
+            artist_record = self.db.read(table='artists', data=['id'], where={'name': song.artist_name})
             if not artist_record:
                 self.socketio.emit("add:response", {"status": "KO", "message": "Artist not found"}, room=user_id)
                 return
 
             artist_id = artist_record[0][0]
 
-            album_record = self.db.read(table='albums', data=['id'], where=f'name "{song.album_name}"')
+            album_record = self.db.read(table='albums', data=['id'], where={'name': song.album_name})
             if not album_record:
                 self.socketio.emit("add:response", {"status": "KO", "message": "Album not found"}, room=user_id)
                 return
 
             album_id = album_record[0][0]
 
-            song_record = self.db.read(table='songs', data=['id'], where=f'name = "{song.title}" AND artist_id = "{artist_id}"')
+            song_record = self.db.read(table='songs', data=['id'], where={'name': song.title, 'artist_id': artist_id})
             if song_record:
                 song_id = song_record[0][0]
-                try: 
-                    self.db.create(table='playlist_songs', data={'playlist_id': self.playlist, 'song_id': song_id})
-                except sqlite3.IntegrityError as e:
-                    print(e)
-                    self.socketio.emit("add:response", {"status": "KO", "message": "Song already in playlist"}, room=user_id)
-                    return
+                playlist_id = self.playlist_of(user_id)
+                with self.playlist_sync.playlist_lock(playlist_id):
+                    try: 
+                        self.db.create(table='playlist_songs', data={'playlist_id': playlist_id, 'song_id': song_id})
+                    except sqlite3.IntegrityError as e:
+                        logger.info(e)
+                        self.socketio.emit("add:response", {"status": "KO", "message": "Song already in playlist"}, room=user_id)
+                        return
+                    song.id = song_id
+                    self.song_added(user_id, song)
                 self.socketio.emit("add:response", {"status": "OK", "message": "Song added successfully"}, room=user_id)
                 return
             else:
@@ -188,7 +440,33 @@ class CustomPlatform(FlaskSocketPlatform):
                 return
 
     def clear(self, user_id: str) -> None:
-        self.db.delete(table='playlist_songs', data={'playlist_id': self.playlist})
+        playlist_id = self.playlist_of(user_id)
+        with self.playlist_sync.playlist_lock(playlist_id):
+            if self.db.delete(table='playlist_songs', data={'playlist_id': playlist_id}):
+                self.playlist_sync.cleared(playlist_id)
+
+    def recommend(self, user_id: str, recommend: dict) -> None:
+        if not self.recommender:
+            self.socketio.emit("recommend:response", {"status": "KO", "message": "Recommendations not available"}, room=user_id)
+            return
+
+        # The limit comes from the client, a large one would make Annoy walk the whole index
+        try:
+            limit = int(recommend.get("limit", 5))
+        except (AttributeError, TypeError, ValueError, OverflowError):
+            self.socketio.emit("recommend:response", {"status": "KO", "message": "Invalid limit"}, room=user_id)
+            return
+        limit = min(max(limit, 1), MAX_RECOMMENDATIONS)
+
+        song_ids = [record[0] for record in self.db.read(table='playlist_songs', data=['song_id'], where={'playlist_id': self.playlist_of(user_id)})]
+        if not song_ids:
+            self.socketio.emit("recommend:response", {"status": "KO", "message": "Playlist is empty"}, room=user_id)
+            return
+
+        recommendations = self.recommender.recommend(song_ids, limit=limit)
+        songs = self.entity_linker.songs_from_ids([song_id for song_id, _ in recommendations])
+        song_data = [{"id": song.id, "title": song.title, "artist": song.artist_name, "album": song.album_name} for song in songs]
+        self.socketio.emit("recommend:response", {"status": "OK", "songs": song_data}, room=user_id)
 
 class CustomNamespace(ChatNamespace):
     def __init__(self, namespace: str, platform: CustomPlatform) -> None:
@@ -200,17 +478,37 @@ class CustomNamespace(ChatNamespace):
         logger.info(f"Client connected; user_id: {req.sid}")
 
     def on_remove(self, data: dict) -> None:
-        req: SocketIORequest = cast(SocketIORequest, request)
-        self._platform.remove(req.sid, data["remove"])
+        user_id = cast(SocketIORequest, request).sid
+        self._platform.dispatch(user_id, lambda: self._platform.remove(user_id, data["remove"]))
         logger.info(f"Message received: {data}")
 
     def on_add(self, data: dict) -> None:
-        print("Adding song...")
-        req: SocketIORequest = cast(SocketIORequest, request)
-        self._platform.add(req.sid, data["add"])
+        user_id = cast(SocketIORequest, request).sid
+        self._platform.dispatch(user_id, lambda: self._platform.add(user_id, data["add"]))
         logger.info(f"Message received: {data}")
 
     def on_clear(self, data: dict) -> None:
+        user_id = cast(SocketIORequest, request).sid
+        self._platform.dispatch(user_id, lambda: self._platform.clear(user_id))
+        logger.info(f"Message received: {data}")
+
+    def on_login(self, data: dict) -> None:
+        user_id = cast(SocketIORequest, request).sid
+        # Password hashing takes a while, off the socket thread
+        self._platform.dispatch(user_id, lambda: self._platform.authenticate(user_id, data))
+        logger.info(f"Login of {data.get('username')}; user_id: {user_id}")
+
+    def on_register(self, data: dict) -> None:
+        user_id = cast(SocketIORequest, request).sid
+        self._platform.dispatch(user_id, lambda: self._platform.authenticate(user_id, data, register=True))
+        logger.info(f"Registration of {data.get('username')}; user_id: {user_id}")
+
+    def on_playlist_sync(self, data: dict) -> None:
         req: SocketIORequest = cast(SocketIORequest, request)
-        self._platform.clear(req.sid)
+        self._platform.sync(req.sid)
+        logger.info(f"Message received: {data}")
+
+    def on_recommend(self, data: dict) -> None:
+        user_id = cast(SocketIORequest, request).sid
+        self._platform.dispatch(user_id, lambda: self._platform.recommend(user_id, data.get("recommend", {})))
         logger.info(f"Message received: {data}")
\ No newline at end of file
@@ -1,6 +1,10 @@
+import logging
+
 from dialoguekit.participant.user import User, UserType
 from playlist import Playlist
 
+logger = logging.getLogger(__name__)
+
 class CustomUser(User):
     def __init__(self, id: str, user_type: UserType = UserType.HUMAN) -> None:
         super().__init__(id, user_type=user_type)
@@ -11,5 +15,5 @@ class CustomUser(User):
         self._playlist = playlist_id
         self._db = db
 
-        print(f"user playlist id {self._playlist}")
+        logger.debug("user playlist id %s", self._playlist)
 
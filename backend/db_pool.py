@@ -0,0 +1,148 @@
+import queue
+import sqlite3
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Callable, List, Set, Tuple
+
+# Most writes are a single small statement, a batch groups the writes queued while the previous one committed
+MAX_BATCH = 64
+CACHED_STATEMENTS = 256
+
+
+def connect(path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=check_same_thread, cached_statements=CACHED_STATEMENTS)
+    conn.text_factory = lambda x: x.decode('utf-8', errors='ignore')
+    return conn
+
+
+class ThreadReader():
+    """
+    Holds the read connection of a thread in its thread-local storage, dropped when the thread exits.
+    """
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+
+def close_reader(readers: Set[sqlite3.Connection], lock: threading.Lock, conn: sqlite3.Connection) -> None:
+    with lock:
+        if conn not in readers:
+            # Already closed by ConnectionPool.close
+            return
+        readers.discard(conn)
+    conn.close()
+
+
+class ConnectionPool():
+    """
+    Access to one sqlite database from many threads.
+    Each thread reads through its own connection, closed when the thread exits; in WAL mode readers do not
+    block each other nor the writer.
+    All writes go through a queue to a single writer thread, which commits the writes queued together
+    in one transaction, each in its own savepoint so that a failing write does not undo the others.
+    """
+    def __init__(self, path: str, max_batch: int = MAX_BATCH):
+        self.path = path
+        self.max_batch = max_batch
+        self.local = threading.local()
+        self.readers: Set[sqlite3.Connection] = set()
+        self.readers_lock = threading.Lock()
+
+        # Transactions of the writer are managed explicitly
+        self.writer = connect(path, check_same_thread=False)
+        self.writer.isolation_level = None
+        self.writer.execute("PRAGMA journal_mode = WAL")
+        self.writer.execute("PRAGMA synchronous = NORMAL")
+
+        self.queue: "queue.Queue[Tuple[Callable, Future]]" = queue.Queue()
+        self.closed = False
+        self.thread = threading.Thread(target=self.write_loop, name="db-writer", daemon=True)
+        self.thread.start()
+
+    def reader(self) -> sqlite3.Connection:
+        """
+        :return: The read connection of the calling thread.
+        """
+        reader = getattr(self.local, "reader", None)
+        if reader is None:
+            # Only used by this thread, but closed by close()
+            conn = connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA query_only = ON")
+            reader = ThreadReader(conn)
+            with self.readers_lock:
+                self.readers.add(conn)
+            # The thread-local storage of a thread is dropped when it exits, socket threads are short-lived
+            weakref.finalize(reader, close_reader, self.readers, self.readers_lock, conn)
+            self.local.reader = reader
+        return reader.conn
+
+    def write(self, operation: Callable[[sqlite3.Connection], object]):
+        """
+        Run an operation on the writer connection and wait for its transaction to commit.
+        :param operation: Called with the writer connection, must not commit nor rollback.
+        :return: What the operation returned.
+        :raises: What the operation raised (e.g. sqlite3.IntegrityError), its changes are rolled back.
+        """
+        if self.closed:
+            raise sqlite3.ProgrammingError("Cannot write to a closed pool.")
+        future = Future()
+        self.queue.put((operation, future))
+        return future.result()
+
+    def write_loop(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)
+                    break
+                batch.append(item)
+            self.commit_batch(batch)
+
+    def commit_batch(self, batch: List[Tuple[Callable, Future]]) -> None:
+        results = []
+        try:
+            self.writer.execute("BEGIN IMMEDIATE")
+            for operation, future in batch:
+                self.writer.execute("SAVEPOINT operation")
+                try:
+                    results.append((future, operation(self.writer), None))
+                    self.writer.execute("RELEASE operation")
+                except Exception as e:
+                    self.writer.execute("ROLLBACK TO operation")
+                    self.writer.execute("RELEASE operation")
+                    results.append((future, None, e))
+            self.writer.execute("COMMIT")
+        except Exception as e:
+            if self.writer.in_transaction:
+                self.writer.execute("ROLLBACK")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        # Callers only see their result once it is committed
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def close(self) -> None:
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.close()
+        with self.readers_lock:
+            readers = list(self.readers)
+            self.readers.clear()
+        for conn in readers:
+            conn.close()
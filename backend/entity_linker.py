@@ -1,3 +1,4 @@
+import logging
 import re
 from typing import Any, List
 import spacy
@@ -11,27 +12,53 @@ import random
 import json
 from collections import defaultdict
 from sklearn.model_selection import train_test_split
-from sentence_transformers import SentenceTransformer
-from annoy import AnnoyIndex
 from song import Song
 from artist import Artist
 from album import Album
+from archive import extract_archive
+from kb_index import SHORTLIST_SIZE, CatalogIndex, clean_text, shortlist_extract, shortlist_extract_by_table
+from semantic_index import SemanticIndex, load_model
+from linker_cache import LRUCache, cached_recognition, CACHE_SIZE, CACHE_TTL, VERSION_CHECK_INTERVAL
+from instrumentation import metrics, timed
 import os
+import sqlite3
 import subprocess
-import zipfile
+import threading
+import time
 import warnings
 
 warnings.filterwarnings("ignore", category=UserWarning, module='spacy')
 
+logger = logging.getLogger(__name__)
+
+# NER labels of the trained model and the knowledge base table of each
+LABEL_TABLES = {"SONG_TITLE": "songs", "ARTIST_NAME": "artists", "ALBUM_NAME": "albums"}
+# Names of the agent commands, which an utterance may start with
+COMMANDS = ("add", "remove", "show", "clear", "date album", "genre artist", "number songs", "number albums", "which album", "give song", "recommend")
+# Number of candidates selected per mention in each table
+CANDIDATE_LIMITS = {"songs": 3, "artists": 10, "albums": 3}
+
 class EntityLinker:
-    def __init__(self, db, spacy_model='en_core_web_lg', train=False):
+    def __init__(self, db, spacy_model='en_core_web_lg', train=False, batched=True, workers=-1, shortlist=SHORTLIST_SIZE, semantic=True, mention_mode="ner", cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL):
         """
         Initialize the recognizer with a knowledge base and the SpaCy model.
         :param knowledge_base: A dictionary of song titles with associated metadata.
         :param spacy_model: Name of the SpaCy model to use for mention detection.
+        :param batched: Score all mentions of a table in one vectorized call, with or without the shortlist.
+        :param workers: Number of threads used for batched matching, -1 uses all cores.
+        :param shortlist: Number of titles retrieved from the trigram index before fuzzy scoring, 0 scans the whole catalog.
+            Short mentions and mentions without a good shortlisted match are scored against the whole catalog anyway.
+        :param semantic: Merge nearest neighbours from the Annoy indexes built by semantic_index.py, when they exist.
+        :param mention_mode: "ner" uses the entities of the NER model, falling back to n-grams without stop-word-only ones; "ngram" uses every n-gram.
+        :param cache_size: Number of recognition results and of mention matches kept in memory, 0 disables the caches.
+        :param cache_ttl: Seconds after which a cached result is recomputed.
         """
-        print("Initializing EntityLinker...")
+        logger.info("Initializing EntityLinker...")
         self.db = db
+        self.mention_mode = mention_mode
+        self.batched = batched
+        self.workers = workers
+        self.shortlist = shortlist
 
         if train:
             #spacy.cli.download(spacy_model)
@@ -39,31 +66,124 @@ class EntityLinker:
 
             ner_dataset_path = os.path.join("data", "elmd2.zip")
             if not os.path.exists(ner_dataset_path):
-                print("Downloading data...")
+                logger.info("Downloading data...")
                 curl_command = ["curl", "-L", "-o", ner_dataset_path,"http://mtg.upf.edu/system/files/projectsweb/elmd2.zip", "--ssl-no-revoke"]
                 result = subprocess.run(curl_command, check=True)
 
-            if not os.path.exists(os.path.join("data", "elmd2")):
-                zip_path = os.path.expanduser(ner_dataset_path)
-                print("Extracting data...")
-                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                    zip_ref.extractall("data")
+            zip_path = os.path.expanduser(ner_dataset_path)
+            logger.info("Extracting data...")
+            extract_archive(zip_path, "data")
 
             TRAINING_DATA = self.get_training_data()
             self.train_model(TRAINING_DATA)
 
-        print("Loading model...")
+        logger.info("Loading model...")
         self.nlp = spacy.load(os.path.join("data", "models", "ner_model", "model-best"))
+        self.stop_words = set(self.nlp.Defaults.stop_words)
+
+        logger.info("Loading knowledge base...")
+        self.semantic = semantic
+        self.embedding_model = None
+        self.catalog_lock = threading.Lock()
+        self.load_catalog()
+
+        # Results of recognize_* and matches of single mentions, dropped when the catalog index is reloaded
+        self.cache = None
+        self.match_cache = None
+        if cache_size:
+            self.cache = LRUCache(maxsize=cache_size, ttl=cache_ttl, version=self.catalog_version)
+            self.match_cache = LRUCache(maxsize=cache_size * 8, ttl=cache_ttl, version=self.catalog_version, copy=False)
+
+    def build_version(self):
+        """
+        :return: Build version of the catalog in the database, changed by every CatalogBuilder run.
+        """
+        try:
+            record = self.db.read(table='catalog_meta', data=['value'], where={'key': 'build_version'})
+        except sqlite3.OperationalError:
+            record = None
+        return record[0][0] if record else None
 
-        print("Loading knowledge base...")
-        self.knowledge_base = {
-            "songs": self.db.read(table="songs", data=["id", "name", "artist_id", "album_id", "popularity"]),
-            "artists": self.db.read(table="artists", data=["id", "name", "popularity"]),
-            "albums": self.db.read(table="albums", data=["id", "name", "artist_id", "popularity"]),
+    def catalog_version(self):
+        """
+        :return: Version of the loaded catalog index, which changes when the index is reloaded.
+        """
+        return self.catalog_index.version
+
+    def load_catalog(self):
+        """
+        Load the catalog index of the current catalog, building it if needed, and its semantic indexes.
+        The index is replaced as a whole; a request running during the swap may read from both, like it would
+        read a catalog being rebuilt in the database, and its result is not cached.
+        """
+        build_version = self.build_version()
+        catalog_index = CatalogIndex.load_or_build(self.db)
+        semantic_index = {}
+        if self.semantic:
+            for table, index in catalog_index.title_index.items():
+                index = SemanticIndex.load(table, index, catalog_index.version)
+                if index:
+                    semantic_index[table] = index
+            if semantic_index and self.embedding_model is None:
+                logger.info("Loading embedding model...")
+                self.embedding_model = load_model()
+        self.catalog_index = catalog_index
+        self.semantic_index = semantic_index
+        self.catalog_build_version = build_version
+        self.catalog_checked = time.monotonic()
+
+    def check_catalog(self):
+        """
+        Reload the catalog index when the catalog has been rebuilt, checked at most every VERSION_CHECK_INTERVAL seconds.
+        The caches are keyed by the version of the loaded index, so they are dropped along with it.
+        """
+        if time.monotonic() - self.catalog_checked < VERSION_CHECK_INTERVAL:
+            return
+        with self.catalog_lock:
+            if time.monotonic() - self.catalog_checked < VERSION_CHECK_INTERVAL:
+                return
+            self.catalog_checked = time.monotonic()
+            if self.build_version() == self.catalog_build_version:
+                return
+            logger.info("Catalog rebuilt, reloading the catalog index...")
+            self.load_catalog()
+            if self.cache is not None:
+                self.cache.clear()
+                self.match_cache.clear()
+
+    @property
+    def knowledge_base(self):
+        return self.catalog_index.knowledge_base
+
+    @property
+    def title_index(self):
+        return self.catalog_index.title_index
+
+    @property
+    def ngram_index(self):
+        return self.catalog_index.ngram_index
+
+    @property
+    def combined_index(self):
+        return self.catalog_index.combined_index
+
+    def metrics(self):
+        """
+        :return: Stage timers and counters of this process.
+        """
+        return metrics.snapshot()
+
+    def cache_stats(self):
+        """
+        :return: Hit and miss counters of the caches.
+        """
+        return {
+            "results": self.cache.stats() if self.cache else None,
+            "mentions": self.match_cache.stats() if self.match_cache else None,
         }
 
     def train_model(self, training_data):
-        print("Training model...")
+        logger.info("Training model...")
         # Add a new entity label if it’s not already there
         if "ner" in self.nlp.pipe_names:
             ner = self.nlp.get_pipe("ner")
@@ -97,10 +217,10 @@ class EntityLinker:
         self.nlp.to_disk(os.path.join("data", "models", "ner_model", "model-best"))
         ret = subprocess.run(['python', '-m', 'spacy', 'init', 'config', os.path.join("data", "models", "ner_model", "config.cfg"), '--lang', 'en', '--pipeline', 'ner'], shell=True)
         if ret.returncode != 0:
-            print("Failed to create config file")
+            logger.error("Failed to create config file")
         ret = subprocess.run(['python', '-m', 'spacy', 'train', os.path.join("data", "models", "ner_model", "config.cfg"), '--output', os.path.join("data", "models", "ner_model"), '--paths.train', os.path.join("data", "models", "ner_model", "training_data.spacy"), '--paths.dev', os.path.join("data", "models", "ner_model", "dev_data.spacy"), "--training.optimizer.learn_rate", "0.0001", "--training.optimizer.grad_clip", "0.5", "--training.max_epochs", "10"], shell=True)
         if ret.returncode != 0:
-            print("Failed to train model")
+            logger.error("Failed to train model")
 
         nlp_ner = spacy.load(os.path.join("data", "models", "ner_model", "model-best"))
 
@@ -110,7 +230,7 @@ class EntityLinker:
 
         # Print detected entities
         for ent in doc.ents:
-            print(f"Entity: {ent.text}, Label: {ent.label_}")
+            logger.info("Entity: %s, Label: %s", ent.text, ent.label_)
 
     def convert_data_to_spacy(self, nlp, path, data):
         doc_bin = DocBin()
@@ -141,7 +261,7 @@ class EntityLinker:
         Get the training data from the knowledge base.
         :return: A list of training data.
         """
-        print("Getting training data...")
+        logger.info("Getting training data...")
         output = []
         json_files = os.listdir(os.path.join("data", "elmd2"))
         for i, file in tqdm(enumerate(json_files)):
@@ -186,117 +306,298 @@ class EntityLinker:
         
         return output
 
+    @timed("mention_detection")
     def mention_detection(self, text, n=3, labels=['SONG_TITLE', 'ARTIST_NAME', 'ALBUM_NAME']):
         """
         Detect mentions of potential song titles in the text.
         :param text: Input text.
+        :param n: Maximum number of words of the n-grams.
+        :param labels: NER labels to keep, spans of other labels are used when none of these is found.
         :return: List of detected song title mentions.
         """
-        """ doc = self.nlp(text)
-        mentions = defaultdict(list)
-        for i, ent in enumerate(doc.ents):
-            print(ent.text, ent.start_char, ent.end_char, ent.label_)
-            mentions[ent.label_].append(ent.text)
-        print(f"mentions: {mentions}")
-        return mentions """
+        if isinstance(labels, str):
+            labels = [labels]
+        if self.mention_mode == "ner":
+            entities = self.entity_mentions(text)
+            mentions = [mention for label in labels for mention in entities.get(label, [])]
+            if not mentions:
+                mentions = [mention for spans in entities.values() for mention in spans]
+            if mentions:
+                logger.debug("mentions: %s", mentions)
+                return mentions
+        return self.ngram_mentions(text, n)
+
+    @timed("mention_detection")
+    def typed_mention_detection(self, text, n=3):
+        """
+        Detect mentions once for all the knowledge base tables.
+        :param text: Input text.
+        :param n: Maximum number of words of the n-grams.
+        :return: Dictionary from table to its mentions.
+        """
+        if self.mention_mode == "ner":
+            entities = self.entity_mentions(text)
+            if entities:
+                all_mentions = [mention for spans in entities.values() for mention in spans]
+                mentions = {table: entities.get(label) or all_mentions for label, table in LABEL_TABLES.items()}
+                logger.debug("mentions: %s", mentions)
+                return mentions
+        mentions = self.ngram_mentions(text, n)
+        return {table: mentions for table in LABEL_TABLES.values()}
+
+    def entity_mentions(self, text):
+        """
+        :return: Dictionary from NER label to the text of the entities with that label.
+        """
+        entities = defaultdict(list)
+        for ent in self.nlp(text).ents:
+            if ent.text not in entities[ent.label_]:
+                entities[ent.label_].append(ent.text)
+        return dict(entities)
+
+    def ngram_mentions(self, text, n=3):
+        """
+        :return: The word 1- to n-grams of the text. In "ner" mode, n-grams made only of stop words, or only of the words
+            of a command name the text starts with, are left out.
+        """
         mentions = []
         words = re.findall(r'\w+', text)
-        print(f"words: {words}")
+        logger.debug("words: %s", words)
+        prune = self.mention_mode == "ner"
+        command_length = self.command_length(words) if prune else 0
         for i in range(len(words)):
             for j in range(1, n + 1):
                 if i + j > len(words):
                     break
+                if prune and (i + j <= command_length or all(word.lower() in self.stop_words for word in words[i:i+j])):
+                    continue
                 ngram = ' '.join(words[i:i+j])
                 mentions.append(ngram)
-        print(f"mentions: {mentions}")
+        logger.debug("mentions: %s", mentions)
         return mentions
     
+    def command_length(self, words):
+        """
+        :param words: Words of the text.
+        :return: Number of words of the command name the text starts with, 0 if it does not start with one. A text that is
+            only a command name is a title, e.g. the argument "Clear" of "add Clear", and has none.
+        """
+        lowered = [word.lower() for word in words]
+        for command in sorted(COMMANDS, key=len, reverse=True):
+            command_words = command.split()
+            if len(lowered) > len(command_words) and lowered[:len(command_words)] == command_words:
+                return len(command_words)
+        return 0
+
     def clean_text(self, text):
-        # Convert to lower case and remove punctuation
-        text = text.lower()
-        text = re.sub(r'[^\w\s]', '', text)
-        return text
+        return clean_text(text)
 
-    def song_candidate_selection(self, mentions, limit=3):
+    def match_mentions(self, table, mentions, limit):
+        """
+        Fuzzy match the mentions against the index of a knowledge base table.
+        :param table: Name of the knowledge base table.
+        :param mentions: The detected mentions.
+        :param limit: Number of matches per mention.
+        :return: List of (cleaned mention, [(row, score), ...]) tuples.
+        """
+        mentions = [self.clean_text(mention) for mention in mentions]
+        if self.match_cache is None:
+            return list(zip(mentions, self.score_mentions(table, mentions, limit)))
+
+        matches = []
+        missing = []
+        for i, mention in enumerate(mentions):
+            found, value = self.match_cache.get((table, mention, limit))
+            matches.append(list(value) if found else None)
+            if not found:
+                missing.append(i)
+        if missing:
+            version = self.catalog_version()
+            scored = self.score_mentions(table, [mentions[i] for i in missing], limit)
+            for i, value in zip(missing, scored):
+                matches[i] = value
+                if self.catalog_version() == version:
+                    self.match_cache.put((table, mentions[i], limit), tuple(value))
+        return list(zip(mentions, matches))
+
+    def match_all_mentions(self, mentions, limits):
+        """
+        Fuzzy match the mentions of several knowledge base tables in one pass over the combined index.
+        :param mentions: Dictionary from table to its detected mentions.
+        :param limits: Dictionary from table to the number of matches per mention.
+        :return: Dictionary from table to a list of (cleaned mention, [(row, score), ...]) tuples, as match_mentions.
+        """
+        mentions = {table: [self.clean_text(mention) for mention in table_mentions] for table, table_mentions in mentions.items()}
+        matches = {table: [None] * len(table_mentions) for table, table_mentions in mentions.items()}
+        missing = {}
+        for table, table_mentions in mentions.items():
+            for i, mention in enumerate(table_mentions):
+                found, value = self.match_cache.get((table, mention, limits[table])) if self.match_cache is not None else (False, None)
+                if found:
+                    matches[table][i] = list(value)
+                else:
+                    missing.setdefault(table, []).append(i)
+        if missing:
+            version = self.catalog_version()
+            scored = self.score_all_mentions({table: [mentions[table][i] for i in rows] for table, rows in missing.items()}, limits)
+            for table, rows in missing.items():
+                for i, value in zip(rows, scored[table]):
+                    matches[table][i] = value
+                    if self.match_cache is not None and self.catalog_version() == version:
+                        self.match_cache.put((table, mentions[table][i], limits[table]), tuple(value))
+        return {table: list(zip(mentions[table], matches[table])) for table in mentions}
+
+    def score_mentions(self, table, mentions, limit):
+        """
+        :param mentions: Cleaned mentions.
+        :return: List of [(row, score), ...], one per mention.
+        """
+        index = self.title_index[table]
+        with metrics.timer("fuzzy_scoring"):
+            if self.shortlist:
+                # Only score the titles sharing the most trigrams with the mention
+                matches = shortlist_extract(index, self.ngram_index[table], mentions, limit=limit, size=self.shortlist, workers=self.workers,
+                                            batched=self.batched)
+            elif self.batched:
+                matches = index.extract_many(mentions, limit=limit, workers=self.workers)
+            else:
+                matches = [index.extract(mention, limit=limit) for mention in mentions]
+        return self.merge_semantic_matches(table, mentions, limit, matches)
+
+    def score_all_mentions(self, mentions, limits):
+        """
+        Score the mentions of several tables with one pass over the combined index, or one pass per table when not batched.
+        :param mentions: Dictionary from table to its cleaned mentions.
+        :param limits: Dictionary from table to the number of matches per mention.
+        :return: Dictionary from table to a list of [(row, score), ...], one per mention.
+        """
+        if not self.batched:
+            return {table: self.score_mentions(table, table_mentions, limits[table]) for table, table_mentions in mentions.items()}
+        limits = {table: limits[table] for table in mentions}
+        with metrics.timer("fuzzy_scoring"):
+            if self.shortlist:
+                matches = shortlist_extract_by_table(self.combined_index, self.catalog_index.combined_ngram_index, mentions, limits,
+                                                     size=self.shortlist, workers=self.workers)
+            else:
+                matches = self.combined_index.extract_by_table(mentions, limits, workers=self.workers)
+        return {table: self.merge_semantic_matches(table, mentions[table], limits[table], table_matches) for table, table_matches in matches.items()}
+
+    def merge_semantic_matches(self, table, mentions, limit, matches):
+        """
+        Merge the nearest neighbours of the mentions in the semantic index of the table, if it has one, into their fuzzy matches.
+        :return: The merged matches, one list per mention.
+        """
+        if table not in self.semantic_index:
+            return matches
+        semantic_matches = self.semantic_candidate_selection(table, mentions, limit)
+        return [self.merge_matches(fuzzy, semantic) for fuzzy, (_, semantic) in zip(matches, semantic_matches)]
+
+    def semantic_candidate_selection(self, table, mentions, limit=3):
+        """
+        Select candidates by embedding similarity, using the Annoy index of a knowledge base table.
+        :param table: Name of the knowledge base table.
+        :param mentions: The detected mentions.
+        :param limit: Number of neighbours per mention.
+        :return: List of (cleaned mention, [(row, score), ...]) tuples, with scores on the same 0-100 scale as fuzz.ratio.
+        """
+        mentions = [self.clean_text(mention) for mention in mentions]
+        if table not in self.semantic_index or not mentions:
+            return [(mention, []) for mention in mentions]
+        embeddings = self.embedding_model.encode(mentions, normalize_embeddings=True)
+        return list(zip(mentions, self.semantic_index[table].query(embeddings, limit=limit)))
+
+    def merge_matches(self, *matches):
+        """
+        Merge lists of (row, score) tuples, keeping the best score of each row.
+        :return: The merged list, best first.
+        """
+        best = {}
+        for row, score in (match for match_list in matches for match in match_list):
+            if score > best.get(row, -1):
+                best[row] = score
+        return sorted(best.items(), key=lambda x: x[1], reverse=True)
+
+    @timed("candidate_selection")
+    def song_candidate_selection(self, mentions, limit=3, matches=None):
         """
         Select candidate songs from the knowledge base based on the mention using fuzzy matching.
         :param mention: The detected song title mention.
         :param limit: Number of candidates to return.
+        :param matches: Matches of the mentions already scored by match_all_mentions.
         :return: List of (song, score) tuples.
         """
         total_song_candidates = []
-           
-        print("Reading from knowledge base...")
         records = self.knowledge_base["songs"]
+        songs = {}
 
-        songs = [Song(title=row[1], id_=row[0], artist_id=row[2], album_id=row[3], popularity=row[4]) for row in records]
-
-        song_titles_cleaned = [self.clean_text(title) for title in [song.title for song in songs]] # Le faire au début une fois pour toute quand on définit la knowledge base
-
-        for mention in mentions:
-            mention = self.clean_text(mention)
-            song_candidates = process.extract(mention, song_titles_cleaned, limit=limit, scorer=fuzz.ratio)
-            song_candidates = [(songs[idx], score + len(mention) * 5) for _, score, idx in song_candidates]
-            total_song_candidates += song_candidates
+        if matches is None:
+            matches = self.match_mentions("songs", mentions, limit)
+        for mention, mention_matches in matches:
+            for row, score in mention_matches:
+                if row not in songs:
+                    record = records[row]
+                    songs[row] = Song(title=record[1], id_=record[0], artist_id=record[2], album_id=record[3], popularity=record[4])
+                total_song_candidates.append((songs[row], score + len(mention) * 5))
 
-        print(f"Song candidates: {total_song_candidates}")
+        logger.debug("Song candidates: %s", total_song_candidates)
 
         return total_song_candidates
     
 
-    def album_candidate_selection(self, mentions, limit=3):
+    @timed("candidate_selection")
+    def album_candidate_selection(self, mentions, limit=3, matches=None):
         """
         Select candidate albums from the knowledge base based on the mention using fuzzy matching.
         :param mention: The detected album title mention.
         :param limit: Number of candidates to return.
+        :param matches: Matches of the mentions already scored by match_all_mentions.
         :return: List of (song, score) tuples.
         """
         total_album_candidates = []
-           
-        print("Reading from knowledge base...")
         records = self.knowledge_base["albums"]
+        albums = {}
 
-        albums = [Album(name=row[1], id_=row[0], artist_id=row[2], popularity=row[3]) for row in records]
-
-        album_titles_cleaned = [self.clean_text(name) for name in [album.name for album in albums]] # Le faire au début une fois pour toute quand on définit la knowledge base
+        if matches is None:
+            matches = self.match_mentions("albums", mentions, limit)
+        for mention, mention_matches in matches:
+            for row, score in mention_matches:
+                if row not in albums:
+                    record = records[row]
+                    albums[row] = Album(name=record[1], id_=record[0], artist_id=record[2], popularity=record[3])
+                total_album_candidates.append((albums[row], score + len(mention) * 5))
 
-        for mention in mentions:
-            mention = self.clean_text(mention)
-            album_candidates = process.extract(mention, album_titles_cleaned, limit=limit, scorer=fuzz.ratio)
-            album_candidates = [(albums[idx], score + len(mention) * 5) for _, score, idx in album_candidates]
-            total_album_candidates += album_candidates
-
-        print(f"Album candidates: {total_album_candidates}")
+        logger.debug("Album candidates: %s", total_album_candidates)
 
         return total_album_candidates
 
     
-    def artist_candidate_selection(self, mentions, limit=10):
+    @timed("candidate_selection")
+    def artist_candidate_selection(self, mentions, limit=10, matches=None):
         """
         Select candidate artists from the knowledge base based on the mention using fuzzy matching.
         :param mention: The detected artist name mention.
         :param limit: Number of candidates to return.
+        :param matches: Matches of the mentions already scored by match_all_mentions.
         :return: List of (artist, score) tuples.
         """
         total_artist_candidates = []
-           
-        print("Reading from knowledge base...")
         records = self.knowledge_base["artists"]
+        artists = {}
 
-        artists = [Artist(name=row[1], id_=row[0], popularity=row[2]) for row in records]
-
-        artist_titles_cleaned = [self.clean_text(name) for name in [artist.name for artist in artists]] # Le faire au début une fois pour toute quand on définit la knowledge base
+        if matches is None:
+            matches = self.match_mentions("artists", mentions, limit)
+        for mention, mention_matches in matches:
+            for row, score in mention_matches:
+                if row not in artists:
+                    record = records[row]
+                    artists[row] = Artist(name=record[1], id_=record[0], popularity=record[2])
+                total_artist_candidates.append((artists[row], score + len(mention) * 5))
 
-        for mention in mentions:
-            mention = self.clean_text(mention)
-            artist_candidates = process.extract(mention, artist_titles_cleaned, limit=limit, scorer=fuzz.ratio)
-            artist_candidates = [(artists[idx], score + len(mention) * 5) for _, score, idx in artist_candidates]
-            total_artist_candidates += artist_candidates
-
-        print(f"Artist candidates: {total_artist_candidates}")
+        logger.debug("Artist candidates: %s", total_artist_candidates)
 
         return total_artist_candidates
 
+    @timed("disambiguation")
     def song_disambiguation(self, mention, candidates, context: dict[str, Any] = None):
         """
         Disambiguate the correct song from the candidates, using context if available.
@@ -306,7 +607,6 @@ class EntityLinker:
         :return: The final selected song (most likely match).
         """       
         # Use context (artist, album) to boost candidates with matching metadata
-        print("Song disambiguation...")
         for i, (song, score) in enumerate(candidates):    
             candidates[i] = (song, score + song.popularity )
 
@@ -315,7 +615,7 @@ class EntityLinker:
                 if context.get("artists"):
                     for j, artist in enumerate(context["artists"]):
                         if artist.id == song.artist_id:
-                            print(f"artist.name: {artist.name}, position: {j}, old score: {score}, new score: {score + (len(context['artists']) - j) * 10}")
+                            logger.debug("artist.name: %s, position: %d, old score: %s, new score: %s", artist.name, j, score, score + (len(context['artists']) - j) * 10)
                             candidates[i] = (song, score + (len(context["artists"]) - j) * 10)  # Boost score if artist matches
                 
                 if context.get("album"):
@@ -323,10 +623,13 @@ class EntityLinker:
                         if album.id == song.album_id:
                             candidates[i] = (song, score + (len(context["albums"]) - j) * 5)  # Boost score if artist matches
 
-        print([(candidate[0].title, candidate[0].artist_name, candidate[1]) for candidate in sorted(candidates, key=lambda x: x[1], reverse=True)[:10]])
-        return sorted(candidates, key=lambda x: x[1], reverse=True)[:10]  # Return the songs with the highest scores
+        best = sorted(candidates, key=lambda x: x[1], reverse=True)[:10]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Song disambiguation: %s", [(song.title, song.artist_name, score) for song, score in best])
+        return best  # Return the songs with the highest scores
     
 
+    @timed("disambiguation")
     def album_disambiguation(self, mention, candidates, context: dict[str, Any] = None):
         """
         Disambiguate the correct album from the candidates, using context if available.
@@ -336,7 +639,6 @@ class EntityLinker:
         :return: The final selected song (most likely match).
         """       
         # Use context (artist, album) to boost candidates with matching metadata
-        print("Album disambiguation...")
         for i, (album, score) in enumerate(candidates):    
             candidates[i] = (album, score + album.popularity) 
 
@@ -345,15 +647,18 @@ class EntityLinker:
                 if context.get("artists"):
                     for j, artist in enumerate(context["artists"]):
                         if artist.id == album.artist_id:
-                            print(f"artist.name: {artist.name}, position: {j}, old score: {score}, new score: {score + (len(context['artists']) - j) * 10}")
+                            logger.debug("artist.name: %s, position: %d, old score: %s, new score: %s", artist.name, j, score, score + (len(context['artists']) - j) * 10)
                             candidates[i] = (album, score + album.popularity + (len(context["artists"]) - j) * 10)  # Boost score if artist matches
 
-        print([(candidate[0].name, candidate[1]) for candidate in sorted(candidates, key=lambda x: x[1], reverse=True)[:10]])
-        return sorted(candidates, key=lambda x: x[1], reverse=True)[:10]  # Return the songs with the highest scores
+        best = sorted(candidates, key=lambda x: x[1], reverse=True)[:10]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Album disambiguation: %s", [(album.name, score) for album, score in best])
+        return best  # Return the songs with the highest scores
     
 
 
 
+    @timed("disambiguation")
     def artist_disambiguation(self, mention, candidates):
         """
         Disambiguate the correct artist from the candidates, using context if available.
@@ -362,15 +667,17 @@ class EntityLinker:
         :param context: Optional context (album) to improve disambiguation.
         :return: The final selected artist (most likely match).
         """
-        print("Artist disambiguation...")
         for i, (artist, score) in enumerate(candidates):
             candidates[i] = (artist, score + artist.popularity)
         
-        print([(candidate[0].name, candidate[1]) for candidate in sorted(candidates, key=lambda x: x[1], reverse=True)[:10]])
-        return sorted(candidates, key=lambda x: x[1], reverse=True)[:10]  # Return the songs with the highest scores
+        best = sorted(candidates, key=lambda x: x[1], reverse=True)[:10]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Artist disambiguation: %s", [(artist.name, score) for artist, score in best])
+        return best  # Return the songs with the highest scores
 
 
 
+    @cached_recognition
     def recognize_song(self, text, context: dict[str, Any] = None):
         """
         The complete pipeline: Mention detection, candidate selection, and disambiguation.
@@ -386,16 +693,14 @@ class EntityLinker:
         if candidates:
             best_match = self.song_disambiguation(mentions, candidates, context)
             for song, score in best_match:
-                artist = [artist[1] for artist in self.knowledge_base["artists"] if artist[0] == song.artist_id][0] #Tuple index out of range
-                album = [album[1] for album in self.knowledge_base["albums"] if album[0] == song.album_id][0]
-                song.artist_name = artist
-                song.album_name = album
-            print(f"best_match: {best_match}")
+                self.resolve_song_names(song)
+            logger.debug("best_match: %s", best_match)
             return best_match
         # Créer les objets sons à partir de la liste de candidats
 
         return None
     
+    @cached_recognition
     def recognize_artist(self, text):
         """
         The complete pipeline: Mention detection, candidate selection, and disambiguation.
@@ -410,10 +715,11 @@ class EntityLinker:
         candidates = self.artist_candidate_selection(mentions)
         if candidates:
             best_match = self.artist_disambiguation(mentions, candidates)
-            print(f"best_match: {best_match}")
+            logger.debug("best_match: %s", best_match)
             return best_match
         return None
     
+    @cached_recognition
     def recognize_album(self, text, context: dict[str, Any] = None):
         """
         The complete pipeline: Mention detection, candidate selection, and disambiguation.
@@ -428,10 +734,72 @@ class EntityLinker:
         candidates = self.album_candidate_selection(mentions)
         if candidates:
             best_match = self.album_disambiguation(mentions, candidates, context=context)
-            print(f"best_match: {best_match}")
+            logger.debug("best_match: %s", best_match)
             return best_match
         return None
 
+    @cached_recognition
+    def recognize_all(self, text, types=("artists", "songs", "albums"), context: dict[str, Any] = None):
+        """
+        Recognize several entity types in one pass: mentions are detected once (typed by the NER model) and scored against
+        all the tables in one pass over the combined index, then artists are disambiguated first and used as context for the songs and albums.
+        :param text: Input text to process.
+        :param types: Tables to recognize, among "artists", "songs" and "albums".
+        :param context: Optional context (artists, albums), extended with the recognized artists.
+        :return: Dictionary from table to the recognized (entity, score) tuples, or None for a table without match.
+        """
+        results = {table: None for table in types}
+        mentions = self.typed_mention_detection(text=text)
+        matches = self.match_all_mentions({table: mentions[table] for table in types if mentions[table]}, CANDIDATE_LIMITS)
+
+        context = dict(context or {})
+        if "artists" in types and mentions["artists"]:
+            candidates = self.artist_candidate_selection(mentions["artists"], matches=matches["artists"])
+            if candidates:
+                results["artists"] = self.artist_disambiguation(mentions["artists"], candidates)
+                context["artists"] = context.get("artists", []) + [artist for artist, _ in results["artists"]]
+
+        if "songs" in types and mentions["songs"]:
+            candidates = self.song_candidate_selection(mentions["songs"], matches=matches["songs"])
+            if candidates:
+                results["songs"] = self.song_disambiguation(mentions["songs"], candidates, context)
+                for song, score in results["songs"]:
+                    self.resolve_song_names(song)
+
+        if "albums" in types and mentions["albums"]:
+            candidates = self.album_candidate_selection(mentions["albums"], matches=matches["albums"])
+            if candidates:
+                results["albums"] = self.album_disambiguation(mentions["albums"], candidates, context=context)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("best_matches: %s", {table: matches[0] if matches else None for table, matches in results.items()})
+        return results
+
+    def resolve_song_names(self, song: Song) -> Song:
+        """
+        Fill in the artist and album names of a song from the knowledge base.
+        :param song: The song, with artist_id and album_id set.
+        :return: The same song.
+        """
+        song.artist_name = self.knowledge_base.name("artists", song.artist_id)
+        song.album_name = self.knowledge_base.name("albums", song.album_id)
+        return song
+
+    def songs_from_ids(self, song_ids: List[str]) -> List[Song]:
+        """
+        Build the songs with the given ids from the knowledge base, skipping unknown ids.
+        :param song_ids: Ids of the songs, e.g. the content of a playlist.
+        :return: List of songs with their artist and album names.
+        """
+        self.check_catalog()
+        songs = []
+        for song_id in song_ids:
+            record = self.knowledge_base.get("songs", song_id)
+            if record:
+                song = Song(title=record[1], id_=record[0], artist_id=record[2], album_id=record[3], popularity=record[4])
+                songs.append(self.resolve_song_names(song))
+        return songs
+
     def recognize_song_in_playlist(self, text: str, playlist: List[Song]) -> List[Song]:
         mentions = self.mention_detection(text=text)
         if not mentions:
@@ -447,7 +815,7 @@ class EntityLinker:
             song_candidates = [(playlist[idx], score) for _, score, idx in song_candidates]
             total_song_candidates += song_candidates
 
-        print(f"Song candidates: {total_song_candidates}")
+        logger.debug("Song candidates: %s", total_song_candidates)
 
         if song_candidates:
             best_match = self.song_disambiguation(mentions, song_candidates)
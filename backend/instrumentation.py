@@ -0,0 +1,151 @@
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict
+
+# Stage timers and counters of the request path, shared by the modules of a process.
+# Exported by the platform on /metrics and, when started, as a periodic log line.
+# Processes of a LinkerService keep their own metrics, returned by EntityLinker.metrics().
+
+logger = logging.getLogger(__name__)
+
+SAMPLES = 1024
+LOG_INTERVAL = 60
+
+
+class StageTimer():
+    """
+    Count, total and maximum duration of a stage, with the last `samples` durations for percentiles.
+    """
+    def __init__(self, samples: int = SAMPLES):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=samples)
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.samples.append(seconds)
+
+    def stats(self) -> dict:
+        samples = sorted(self.samples)
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, len(samples) * p // 100)] * 1000 if samples else None
+
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total / self.count * 1000 if self.count else None,
+            "p50_ms": percentile(50),
+            "p95_ms": percentile(95),
+            "max_ms": self.max * 1000,
+        }
+
+
+class Metrics():
+    """
+    Thread-safe registry of stage timers and counters.
+    """
+    def __init__(self, samples: int = SAMPLES):
+        self.sample_count = samples
+        self.stages: Dict[str, StageTimer] = {}
+        self.counters: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.log_thread = None
+        self.log_stop = threading.Event()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            timer = self.stages.get(stage)
+            if timer is None:
+                timer = self.stages[stage] = StageTimer(self.sample_count)
+            timer.record(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Time the enclosed block as a run of `stage`, also when it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "uptime": time.time() - self.started,
+                "stages": {stage: timer.stats() for stage, timer in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stages.clear()
+            self.counters.clear()
+            self.started = time.time()
+
+    def summary(self) -> str:
+        """
+        :return: One line with the count, p50 and p95 of each stage and the counters.
+        """
+        snapshot = self.snapshot()
+        stages = " ".join(
+            f"{stage}={stats['count']}/{stats['p50_ms']:.1f}/{stats['p95_ms']:.1f}ms"
+            for stage, stats in sorted(snapshot["stages"].items())
+        )
+        counters = " ".join(f"{name}={value}" for name, value in sorted(snapshot["counters"].items()))
+        return f"metrics (count/p50/p95): {stages} {counters}".rstrip()
+
+    def start_logging(self, interval: float = LOG_INTERVAL) -> None:
+        """
+        Log the summary at INFO level every `interval` seconds, from a daemon thread.
+        """
+        if self.log_thread is not None:
+            return
+        self.log_stop.clear()
+
+        def run():
+            while not self.log_stop.wait(interval):
+                logger.info(self.summary())
+
+        self.log_thread = threading.Thread(target=run, name="metrics-log", daemon=True)
+        self.log_thread.start()
+
+    def stop_logging(self) -> None:
+        if self.log_thread is not None:
+            self.log_stop.set()
+            self.log_thread.join()
+            self.log_thread = None
+
+
+metrics = Metrics()
+
+
+def timed(stage: str):
+    """
+    Decorator timing each call of a function as a run of `stage`.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                metrics.record(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,576 @@
+import bisect
+import hashlib
+import itertools
+import logging
+import os
+import re
+import shutil
+import sqlite3
+from collections.abc import Sequence as SequenceABC
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+from rapidfuzz import process, fuzz
+
+from knowledge_base import TABLES, KnowledgeBase, StringColumn
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+# Bump when the layout of the artifacts changes
+FORMAT_VERSION = 3
+# Cleaned titles never contain NUL, so it is safe to use as a separator between titles
+_SEPARATOR = "\x00"
+# Number of titles scored per cdist call, bounds the score matrix to mentions x chunk
+CHUNK_SIZE = 100_000
+# Bits per character in a packed trigram, enough for any unicode code point
+_CODE_POINT_BITS = 21
+# Texts are padded with two spaces on each side, so that even one character has trigrams
+_PADDING = "  "
+# Number of titles scored per mention when shortlisting
+SHORTLIST_SIZE = 5000
+# Shorter mentions share too few trigrams with their matches, they are scored against the whole index
+MIN_SHORTLIST_LENGTH = 4
+# Mentions whose best shortlisted match scores less are scored against the whole index
+FALLBACK_SCORE = 80
+
+
+def index_directory(db_path: str) -> str:
+    # Indexes are kept next to the database, e.g. data/spotify_index/ for data/spotify.sqlite
+    return os.path.splitext(db_path)[0] + "_index"
+
+
+def clean_text(text: str) -> str:
+    # Convert to lower case and remove punctuation
+    return _PUNCTUATION.sub('', text.lower())
+
+
+class TitleIndex():
+    """
+    Normalized names of one knowledge base table, built once and stored on disk.
+    `titles[i]` is the cleaned name of the record at position `rows[i]` in the table.
+    Records whose name is empty after cleaning are left out of the index.
+    """
+    def __init__(self, titles: Sequence[str], rows: np.ndarray):
+        self.titles = titles
+        self.rows = rows
+        self._choices = None
+
+    def __len__(self):
+        return len(self.titles)
+
+    @classmethod
+    def build(cls, records: Sequence[tuple], name_col: int = 1) -> "TitleIndex":
+        """
+        Clean the names of a table.
+        :param records: Rows of the table.
+        :param name_col: Position of the name in a row.
+        :return: The index.
+        """
+        titles = []
+        rows = []
+        for i, record in enumerate(records):
+            title = clean_text(record[name_col] or "")
+            if title:
+                titles.append(title)
+                rows.append(i)
+        return cls(titles, np.asarray(rows, dtype=np.int32))
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        StringColumn.from_list(self.titles).save(directory, "titles")
+        np.save(os.path.join(directory, "rows.npy"), self.rows)
+
+    @classmethod
+    def load(cls, directory: str) -> "TitleIndex":
+        return cls(StringColumn.load(directory, "titles"), np.load(os.path.join(directory, "rows.npy"), mmap_mode="r"))
+
+    def choices(self) -> List[str]:
+        # The exhaustive scans need the titles as a list; it is decoded once per process, on first use
+        if self._choices is None:
+            self._choices = list(self.titles)
+        return self._choices
+
+    def extract(self, mention: str, limit: int = 3) -> List[Tuple[int, float]]:
+        """
+        Fuzzy match a cleaned mention against the index.
+        :param mention: The cleaned mention.
+        :param limit: Number of matches to return.
+        :return: List of (table row, score) tuples, best first.
+        """
+        matches = process.extract(mention, self.choices(), limit=limit, scorer=fuzz.ratio)
+        return [(int(self.rows[idx]), score) for _, score, idx in matches]
+
+    def extract_many(self, mentions: List[str], limit: int = 3, workers: int = -1) -> List[List[Tuple[int, float]]]:
+        """
+        Fuzzy match several cleaned mentions against the index in one vectorized pass.
+        Gives the same results as calling `extract` for each mention.
+        :param mentions: The cleaned mentions.
+        :param limit: Number of matches to return per mention.
+        :param workers: Number of threads used by rapidfuzz, -1 uses all cores.
+        :return: For each mention, a list of (table row, score) tuples, best first.
+        """
+        titles = self.choices()
+        if not mentions or not titles or limit <= 0:
+            return [[] for _ in mentions]
+
+        best_idx = [np.empty(0, dtype=np.int64) for _ in mentions]
+        best_scores = [np.empty(0, dtype=np.float64) for _ in mentions]
+        for start in range(0, len(titles), CHUNK_SIZE):
+            chunk = titles[start:start + CHUNK_SIZE]
+            scores = process.cdist(mentions, chunk, scorer=fuzz.ratio, dtype=np.float64, workers=workers)
+            for i, row_scores in enumerate(scores):
+                top = _top_k(row_scores, limit)
+                idx = np.concatenate((best_idx[i], top + start))
+                row_scores = np.concatenate((best_scores[i], row_scores[top]))
+                keep = _top_k(row_scores, limit)
+                best_idx[i] = idx[keep]
+                best_scores[i] = row_scores[keep]
+
+        return [
+            [(int(self.rows[idx]), float(score)) for idx, score in zip(best_idx[i], best_scores[i])]
+            for i in range(len(mentions))
+        ]
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Positions of the k highest scores, best first, ties broken by lowest position like `process.extract`.
+    """
+    if k < len(scores):
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        greater = np.flatnonzero(scores > kth)
+        equal = np.flatnonzero(scores == kth)[:k - len(greater)]
+        candidates = np.concatenate((greater, equal))
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:k]
+
+
+class _ConcatenatedTitles(SequenceABC):
+    """
+    Read-only view of several title sequences end to end, `bounds[k]` being the position of the first title of part k.
+    """
+    def __init__(self, parts: List[Sequence[str]], bounds: List[int]):
+        self.parts = parts
+        self.bounds = bounds
+
+    def __len__(self):
+        return self.bounds[-1]
+
+    def __getitem__(self, i: int) -> str:
+        part = bisect.bisect_right(self.bounds, i) - 1
+        return self.parts[part][i - self.bounds[part]]
+
+    def __iter__(self) -> Iterator[str]:
+        return itertools.chain.from_iterable(self.parts)
+
+
+class CombinedTitleIndex(TitleIndex):
+    """
+    The TitleIndex of every table end to end, used to score mentions against all of them in one pass.
+    The titles of `tables[t]` are at positions `bounds[t]` to `bounds[t + 1]`, `tags[i]` is the table of the title
+    at position i and `rows[i]` its row in that table. Titles are read from the per-table indexes, not copied.
+    """
+    def __init__(self, title_index: Dict[str, TitleIndex]):
+        self.tables = [table for table in TABLES if table in title_index]
+        self.indexes = [title_index[table] for table in self.tables]
+        self.bounds = np.cumsum([0] + [len(index) for index in self.indexes])
+        titles = _ConcatenatedTitles([index.titles for index in self.indexes], self.bounds.tolist())
+        rows = np.concatenate([np.asarray(index.rows, dtype=np.int32) for index in self.indexes])
+        super().__init__(titles, rows)
+        self.tags = np.repeat(np.arange(len(self.tables), dtype=np.int8), np.diff(self.bounds))
+
+    def choices(self) -> List[str]:
+        # The decoded titles of the per-table indexes are shared, only the list of references is new
+        if self._choices is None:
+            self._choices = [title for index in self.indexes for title in index.choices()]
+        return self._choices
+
+    def extract_by_table(self, mentions: Dict[str, List[str]], limits: Dict[str, int],
+                         workers: int = -1) -> Dict[str, List[List[Tuple[int, float]]]]:
+        """
+        Fuzzy match the cleaned mentions of several tables against their titles in one vectorized pass, chunk by chunk.
+        Gives the same results as `extract_many` on the index of each table.
+        :param mentions: Dictionary from table to the mentions to match against it.
+        :param limits: Dictionary from table to the number of matches to return per mention.
+        :param workers: Number of threads used by rapidfuzz, -1 uses all cores.
+        :return: Dictionary from table to a list of (table row, score) tuples per mention, best first.
+        """
+        queries = list(dict.fromkeys(mention for table_mentions in mentions.values() for mention in table_mentions))
+        query_index = {mention: i for i, mention in enumerate(queries)}
+        spans = [(table, int(self.bounds[t]), int(self.bounds[t + 1])) for t, table in enumerate(self.tables)
+                 if mentions.get(table) and limits.get(table, 0) > 0]
+        best = {table: [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)) for _ in table_mentions]
+                for table, table_mentions in mentions.items()}
+
+        titles = self.choices() if spans else []
+        for start in range(0, len(titles), CHUNK_SIZE):
+            end = min(start + CHUNK_SIZE, len(titles))
+            parts = [(table, max(lo, start), min(hi, end)) for table, lo, hi in spans if lo < end and hi > start]
+            if not parts:
+                continue
+            chunk = [title for _, lo, hi in parts for title in titles[lo:hi]]
+            scores = process.cdist(queries, chunk, scorer=fuzz.ratio, dtype=np.float64, workers=workers)
+            offset = 0
+            for table, lo, hi in parts:
+                table_scores = scores[:, offset:offset + hi - lo]
+                offset += hi - lo
+                for i, mention in enumerate(mentions[table]):
+                    row_scores = table_scores[query_index[mention]]
+                    top = _top_k(row_scores, limits[table])
+                    idx = np.concatenate((best[table][i][0], top + lo))
+                    row_scores = np.concatenate((best[table][i][1], row_scores[top]))
+                    keep = _top_k(row_scores, limits[table])
+                    best[table][i] = (idx[keep], row_scores[keep])
+
+        return {
+            table: [[(int(self.rows[idx]), float(score)) for idx, score in zip(*found)] for found in table_best]
+            for table, table_best in best.items()
+        }
+
+
+def trigrams(text: str) -> np.ndarray:
+    """
+    Distinct trigrams of a cleaned text padded with two spaces on each side, packed into uint64.
+    """
+    if not text:
+        return np.empty(0, dtype=np.uint64)
+    code_points = np.frombuffer((_PADDING + text + _PADDING).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    grams = (code_points[:-2] << (2 * _CODE_POINT_BITS)) | (code_points[1:-1] << _CODE_POINT_BITS) | code_points[2:]
+    return np.unique(grams)
+
+
+class NGramIndex():
+    """
+    Trigram inverted index over a TitleIndex, used to shortlist titles before fuzzy scoring.
+    Titles sharing only scattered characters with a mention have no trigram in common with it and are not shortlisted,
+    see `shortlist_extract` for the fallback and ngram_recall.py for the recall against the exhaustive scan.
+    `postings[offsets[i]:offsets[i + 1]]` are the positions in the TitleIndex of the titles containing `keys[i]`,
+    `lengths[j]` is the number of trigrams of the title at position j.
+    The arrays are stored as .npy files and memory-mapped on load.
+    """
+    ARRAYS = ("keys", "offsets", "postings", "lengths")
+
+    def __init__(self, titles: Sequence[str], keys: np.ndarray, offsets: np.ndarray, postings: np.ndarray, lengths: np.ndarray):
+        self.titles = titles
+        self.keys = keys
+        self.offsets = offsets
+        self.postings = postings
+        self.lengths = lengths
+
+    @classmethod
+    def build(cls, title_index: TitleIndex) -> "NGramIndex":
+        titles = title_index.titles
+        if not titles:
+            empty = np.empty(0, dtype=np.int32)
+            return cls(titles, np.empty(0, dtype=np.uint64), np.zeros(1, dtype=np.int64), empty, empty)
+
+        # Pad every title with spaces and separate them with NUL, then pack all trigrams at once
+        padded = _SEPARATOR.join(_PADDING + title + _PADDING for title in titles)
+        code_points = np.frombuffer(padded.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        grams = (code_points[:-2] << (2 * _CODE_POINT_BITS)) | (code_points[1:-1] << _CODE_POINT_BITS) | code_points[2:]
+        # Code points of each padded title and its separator, i.e. trigrams starting in it
+        lengths = np.fromiter((len(title) + 2 * len(_PADDING) + 1 for title in titles), dtype=np.int64, count=len(titles))
+        owners = np.repeat(np.arange(len(titles), dtype=np.int32), lengths)[:len(grams)]
+        valid = (code_points[:-2] != 0) & (code_points[1:-1] != 0) & (code_points[2:] != 0)
+        grams = grams[valid]
+        owners = owners[valid]
+        del code_points, valid
+
+        order = np.lexsort((owners, grams))
+        grams = grams[order]
+        owners = owners[order]
+        del order
+        distinct = np.ones(len(grams), dtype=bool)
+        distinct[1:] = (grams[1:] != grams[:-1]) | (owners[1:] != owners[:-1])
+        grams = grams[distinct]
+        owners = owners[distinct]
+
+        keys, starts = np.unique(grams, return_index=True)
+        offsets = np.append(starts, len(grams)).astype(np.int64)
+        lengths = np.bincount(owners, minlength=len(titles)).astype(np.int32)
+        return cls(titles, keys, offsets, owners, lengths)
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory: str, title_index: TitleIndex) -> "NGramIndex":
+        arrays = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in cls.ARRAYS]
+        return cls(title_index.titles, *arrays)
+
+    def shortlist(self, mention: str, size: int = SHORTLIST_SIZE, bounds: np.ndarray = None) -> np.ndarray:
+        """
+        Positions of the titles most similar to a cleaned mention, ranked by the Dice coefficient of their trigrams.
+        :param mention: The cleaned mention.
+        :param size: Maximum number of titles to return.
+        :param bounds: Bounds of the tables of a CombinedTitleIndex, to keep up to `size` titles of each table.
+        :return: Sorted positions in the TitleIndex.
+        """
+        grams = trigrams(mention)
+        found = np.searchsorted(self.keys, grams)
+        in_range = found < len(self.keys)
+        found = found[in_range]
+        found = found[self.keys[found] == grams[in_range]]
+        if not len(found):
+            return np.empty(0, dtype=np.int32)
+
+        postings = np.concatenate([self.postings[self.offsets[i]:self.offsets[i + 1]] for i in found])
+        positions, shared = np.unique(postings, return_counts=True)
+        if bounds is None:
+            segments = [(0, len(positions))]
+        else:
+            segments = zip(np.searchsorted(positions, bounds[:-1]), np.searchsorted(positions, bounds[1:]))
+        kept = []
+        for lo, hi in segments:
+            segment = positions[lo:hi]
+            if len(segment) > size:
+                dice = 2 * shared[lo:hi] / (len(grams) + self.lengths[segment])
+                segment = np.sort(segment[_top_k(dice, size)])
+            kept.append(segment)
+        return np.concatenate(kept)
+
+    def extract(self, mention: str, limit: int = 3, size: int = SHORTLIST_SIZE) -> List[Tuple[int, float]]:
+        """
+        Fuzzy match a cleaned mention against the shortlisted titles only.
+        :param mention: The cleaned mention.
+        :param limit: Number of matches to return.
+        :param size: Number of titles to shortlist before scoring.
+        :return: List of (TitleIndex position, score) tuples, best first.
+        """
+        positions = self.shortlist(mention, size=size)
+        matches = process.extract(mention, [self.titles[i] for i in positions], limit=limit, scorer=fuzz.ratio)
+        return [(int(positions[idx]), score) for _, score, idx in matches]
+
+    def extract_many(self, mentions: List[str], limit: int = 3, size: int = SHORTLIST_SIZE, workers: int = -1) -> List[List[Tuple[int, float]]]:
+        """
+        Fuzzy match several cleaned mentions against the union of their shortlists in one vectorized call.
+        Every mention is scored against the titles shortlisted for any of them, so it finds at least the matches of `extract`.
+        :param mentions: The cleaned mentions.
+        :param limit: Number of matches to return per mention.
+        :param size: Number of titles to shortlist per mention.
+        :param workers: Number of threads used by rapidfuzz, -1 uses all cores.
+        :return: For each mention, a list of (TitleIndex position, score) tuples, best first.
+        """
+        if not mentions or limit <= 0:
+            return [[] for _ in mentions]
+        positions = np.unique(np.concatenate([self.shortlist(mention, size=size) for mention in mentions]))
+        if not len(positions):
+            return [[] for _ in mentions]
+        scores = process.cdist(mentions, [self.titles[i] for i in positions], scorer=fuzz.ratio, dtype=np.float64, workers=workers)
+        return [[(int(positions[i]), float(row_scores[i])) for i in _top_k(row_scores, limit)] for row_scores in scores]
+
+
+def _shortlisted_matches(title_index: TitleIndex, ngram_index: NGramIndex, mentions: List[str], limit: int, size: int,
+                         fallback_score: float, workers: int = -1, batched: bool = True) -> Tuple[List[List[Tuple[int, float]]], List[int]]:
+    """
+    :return: The shortlisted matches of each mention, as (table row, score) tuples,
+        and the positions of the mentions to score against the whole index.
+    """
+    matches = [[] for _ in mentions]
+    long_mentions = [i for i, mention in enumerate(mentions) if len(mention) >= MIN_SHORTLIST_LENGTH]
+    if batched:
+        found = ngram_index.extract_many([mentions[i] for i in long_mentions], limit=limit, size=size, workers=workers)
+    else:
+        found = [ngram_index.extract(mentions[i], limit=limit, size=size) for i in long_mentions]
+    for i, positions in zip(long_mentions, found):
+        matches[i] = [(int(title_index.rows[j]), score) for j, score in positions]
+    weak = [i for i, found in enumerate(matches) if not found or found[0][1] < fallback_score]
+    return matches, weak
+
+
+def shortlist_extract(title_index: TitleIndex, ngram_index: NGramIndex, mentions: List[str], limit: int = 3, size: int = SHORTLIST_SIZE,
+                      workers: int = -1, fallback_score: float = FALLBACK_SCORE, batched: bool = True) -> List[List[Tuple[int, float]]]:
+    """
+    Fuzzy match cleaned mentions against their trigram shortlists. Trigrams miss titles that only share scattered
+    characters with the mention, so the mentions the shortlist serves badly, shorter than MIN_SHORTLIST_LENGTH or whose
+    best shortlisted match scores less than `fallback_score`, are scored against the whole index.
+    :param mentions: The cleaned mentions.
+    :param limit: Number of matches to return per mention.
+    :param size: Number of titles to shortlist per mention.
+    :param workers: Number of threads used by rapidfuzz, -1 uses all cores.
+    :param fallback_score: Best shortlisted score under which a mention is scored exhaustively.
+    :param batched: Score all mentions in one vectorized call per pass, else one mention at a time.
+    :return: For each mention, a list of (table row, score) tuples, best first.
+    """
+    matches, weak = _shortlisted_matches(title_index, ngram_index, mentions, limit, size, fallback_score, workers, batched)
+    if weak:
+        weak_mentions = [mentions[i] for i in weak]
+        if batched:
+            found = title_index.extract_many(weak_mentions, limit=limit, workers=workers)
+        else:
+            found = [title_index.extract(mention, limit=limit) for mention in weak_mentions]
+        for i, mention_matches in zip(weak, found):
+            matches[i] = mention_matches
+    return matches
+
+
+def shortlist_extract_by_table(index: CombinedTitleIndex, ngram_index: NGramIndex, mentions: Dict[str, List[str]], limits: Dict[str, int],
+                               size: int = SHORTLIST_SIZE, workers: int = -1,
+                               fallback_score: float = FALLBACK_SCORE) -> Dict[str, List[List[Tuple[int, float]]]]:
+    """
+    `shortlist_extract` for several tables at once, over the CombinedTitleIndex. Every mention is shortlisted in all
+    the tables, the union of the shortlists is scored with a single cdist and the matches are split by table.
+    The mentions the shortlist serves badly in a table are then scored against the whole index, also in one pass.
+    :param mentions: Dictionary from table to the cleaned mentions to match against it.
+    :param limits: Dictionary from table to the number of matches to return per mention.
+    :param size: Number of titles to shortlist per mention and table.
+    :param workers: Number of threads used by rapidfuzz, -1 uses all cores.
+    :param fallback_score: Best shortlisted score under which a mention is scored exhaustively.
+    :return: Dictionary from table to a list of (table row, score) tuples per mention, best first.
+    """
+    matches = {table: [[] for _ in table_mentions] for table, table_mentions in mentions.items()}
+    tags = {table: index.tables.index(table) for table in mentions}
+    queries = list(dict.fromkeys(mention for table_mentions in mentions.values() for mention in table_mentions
+                                 if len(mention) >= MIN_SHORTLIST_LENGTH))
+    if queries:
+        positions = np.unique(np.concatenate([ngram_index.shortlist(mention, size=size, bounds=index.bounds) for mention in queries]))
+        positions = positions[np.isin(index.tags[positions], list(tags.values()))]
+        if len(positions):
+            # The decoded titles are kept for the exhaustive fallback, indexing them is much cheaper than the memory-mapped column
+            titles = index.choices()
+            scores = process.cdist(queries, [titles[i] for i in positions], scorer=fuzz.ratio, dtype=np.float64, workers=workers)
+            query_index = {mention: i for i, mention in enumerate(queries)}
+            position_tags = index.tags[positions]
+            for table, table_mentions in mentions.items():
+                in_table = np.flatnonzero(position_tags == tags[table])
+                rows = index.rows[positions[in_table]]
+                for i, mention in enumerate(table_mentions):
+                    if mention in query_index:
+                        row_scores = scores[query_index[mention], in_table]
+                        matches[table][i] = [(int(rows[j]), float(row_scores[j])) for j in _top_k(row_scores, limits[table])]
+
+    weak = {
+        table: [i for i, found in enumerate(table_matches) if not found or found[0][1] < fallback_score]
+        for table, table_matches in matches.items()
+    }
+    weak = {table: positions for table, positions in weak.items() if positions}
+    if weak:
+        found = index.extract_by_table({table: [mentions[table][i] for i in positions] for table, positions in weak.items()}, limits, workers=workers)
+        for table, positions in weak.items():
+            for i, mention_matches in zip(positions, found[table]):
+                matches[table][i] = mention_matches
+    return matches
+
+
+def catalog_signature(db) -> str:
+    """
+    Cheap fingerprint of the catalog tables, used to detect stale artifacts after the catalog is rebuilt.
+    The build version written by CatalogBuilder changes on every build, even one ending with the same row counts;
+    row counts alone still catch catalogs modified outside of it.
+    """
+    parts = [f"v{FORMAT_VERSION}"]
+    try:
+        record = db.read(table="catalog_meta", data=["value"], where={"key": "build_version"})
+    except sqlite3.OperationalError:
+        # Catalog built before catalog_meta existed
+        record = None
+    parts.append(f"build:{record[0][0] if record else None}")
+    for table in TABLES:
+        count, max_rowid = db.read(table=table, data=["COUNT(*)", "MAX(rowid)"])[0]
+        parts.append(f"{table}:{count}:{max_rowid}")
+    return ";".join(parts)
+
+
+class CatalogIndex():
+    """
+    The knowledge base and the fuzzy indexes of every table, stored as flat files in one directory per catalog version.
+    The combined index scores the mentions of several tables in one pass, its trigram index is the only extra file.
+    Every process memory-maps the same files read-only, so the OS page cache holds a single copy.
+    """
+    def __init__(self, knowledge_base: KnowledgeBase, title_index: Dict[str, TitleIndex], ngram_index: Dict[str, NGramIndex],
+                 combined_index: CombinedTitleIndex, combined_ngram_index: NGramIndex, version: str = None):
+        self.knowledge_base = knowledge_base
+        self.title_index = title_index
+        self.ngram_index = ngram_index
+        self.combined_index = combined_index
+        self.combined_ngram_index = combined_ngram_index
+        self.version = version
+
+    @classmethod
+    def build(cls, db) -> "CatalogIndex":
+        knowledge_base = KnowledgeBase.from_db(db)
+        title_index = {table: TitleIndex.build(records) for table, records in knowledge_base.items()}
+        ngram_index = {table: NGramIndex.build(index) for table, index in title_index.items()}
+        combined_index = CombinedTitleIndex(title_index)
+        return cls(knowledge_base, title_index, ngram_index, combined_index, NGramIndex.build(combined_index))
+
+    def save(self, directory: str) -> None:
+        self.knowledge_base.save(os.path.join(directory, "kb"))
+        for table, index in self.title_index.items():
+            index.save(os.path.join(directory, "titles", table))
+        for table, index in self.ngram_index.items():
+            index.save(os.path.join(directory, "trigrams", table))
+        self.combined_ngram_index.save(os.path.join(directory, "trigrams", "combined"))
+
+    @classmethod
+    def load(cls, directory: str) -> "CatalogIndex":
+        knowledge_base = KnowledgeBase.load(os.path.join(directory, "kb"))
+        title_index = {table: TitleIndex.load(os.path.join(directory, "titles", table)) for table in TABLES}
+        ngram_index = {table: NGramIndex.load(os.path.join(directory, "trigrams", table), title_index[table]) for table in TABLES}
+        combined_index = CombinedTitleIndex(title_index)
+        combined_ngram_index = NGramIndex.load(os.path.join(directory, "trigrams", "combined"), combined_index)
+        return cls(knowledge_base, title_index, ngram_index, combined_index, combined_ngram_index, version=os.path.basename(directory))
+
+    @classmethod
+    def load_or_build(cls, db) -> "CatalogIndex":
+        """
+        Memory-map the artifacts of the current catalog, building them first if needed.
+        Artifacts are built in a private directory and renamed into place, so concurrent workers never see a partial build.
+        :param db: The Playlist database of the catalog.
+        :return: The loaded index.
+        """
+        signature = catalog_signature(db)
+        directory = os.path.join(index_directory(db.path), hashlib.sha1(signature.encode("utf-8")).hexdigest()[:16])
+        if not os.path.exists(directory):
+            logger.info("Building catalog index %s...", directory)
+            tmp_directory = f"{directory}.tmp-{os.getpid()}"
+            cls.build(db).save(tmp_directory)
+            try:
+                os.rename(tmp_directory, directory)
+            except OSError:
+                # Another worker finished the same build first
+                shutil.rmtree(tmp_directory, ignore_errors=True)
+        return cls.load(directory)
+
+
+def shortlist_recall(title_index: TitleIndex, ngram_index: NGramIndex, mentions: List[str], limit: int = 3, size: int = SHORTLIST_SIZE,
+                     min_score: float = 60, fallback_score: float = FALLBACK_SCORE) -> dict:
+    """
+    Compare `shortlist_extract` against the exhaustive scan, one mention at a time.
+    Titles with the same score are interchangeable, so a rank of the exhaustive top `limit` counts as kept
+    when the match at the same rank through the shortlist scores as much.
+    :param mentions: The cleaned mentions to evaluate.
+    :param min_score: Exhaustive matches scoring at least this much are counted as relevant.
+    :return: Recall of the exhaustive top `limit`, overall and for relevant matches only, the share of mentions
+        whose best score is unchanged, and the share of mentions scored exhaustively.
+    """
+    found = expected = relevant_found = relevant_expected = same_best = fallbacks = 0
+    for mention in mentions:
+        exhaustive = [score for _, score in title_index.extract(mention, limit=limit)]
+        matches, weak = _shortlisted_matches(title_index, ngram_index, [mention], limit, size, fallback_score, batched=False)
+        if weak:
+            fallbacks += 1
+            matches = [title_index.extract(mention, limit=limit)]
+        shortlisted = [score for _, score in matches[0]]
+        shortlisted += [-1.0] * (len(exhaustive) - len(shortlisted))
+        kept = [shortlisted[rank] >= score for rank, score in enumerate(exhaustive)]
+        expected += len(exhaustive)
+        found += sum(kept)
+        relevant_expected += sum(score >= min_score for score in exhaustive)
+        relevant_found += sum(k for k, score in zip(kept, exhaustive) if score >= min_score)
+        if not exhaustive or kept[0]:
+            same_best += 1
+    return {
+        "mentions": len(mentions),
+        "recall": found / expected if expected else 1.0,
+        "relevant_recall": relevant_found / relevant_expected if relevant_expected else 1.0,
+        "relevant": relevant_expected,
+        "relevant_missed": relevant_expected - relevant_found,
+        "best_score_match": same_best / len(mentions) if mentions else 1.0,
+        "fallback": fallbacks / len(mentions) if mentions else 0.0,
+    }
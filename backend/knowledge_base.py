@@ -0,0 +1,317 @@
+import mmap
+import os
+import zlib
+from array import array
+from collections.abc import Sequence as SequenceABC
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+TABLES = {
+    "songs": ["id", "name", "artist_id", "album_id", "popularity"],
+    "artists": ["id", "name", "popularity"],
+    "albums": ["id", "name", "artist_id", "popularity"],
+}
+# Columns holding ids of another table, stored as row positions in that table
+FOREIGN_KEYS = {
+    "artists": {},
+    "albums": {"artist_id": "artists"},
+    "songs": {"artist_id": "artists", "album_id": "albums"},
+}
+STRING_COLUMNS = ("id", "name")
+
+
+def _hash(id_) -> int:
+    # Stable across processes, unlike hash()
+    return zlib.crc32(str(id_).encode("utf-8"))
+
+
+class IdIndex():
+    """
+    Open addressing hash table from ids to row positions, backed by a single int32 array.
+    `slots` holds row positions (or -1 for an empty slot); the id of a slot is read back from the table itself.
+    When an id appears on several rows, the first row is kept.
+    """
+    def __init__(self, ids: Sequence[str], slots: np.ndarray):
+        self.ids = ids
+        self.slots = slots
+        self.mask = len(slots) - 1
+
+    @classmethod
+    def build(cls, ids: Sequence[str]) -> "IdIndex":
+        """
+        :param ids: The id column of a table.
+        :return: The index, with a load factor of at most one half.
+        """
+        # Probe against plain strings, the column may decode its values on every access
+        values = list(ids)
+        size = 1 << max(1, (2 * len(values) - 1).bit_length())
+        mask = size - 1
+        slots = [-1] * size
+        for row, id_ in enumerate(values):
+            if id_ is None:
+                continue
+            slot = _hash(id_) & mask
+            while slots[slot] != -1:
+                if values[slots[slot]] == id_:
+                    break
+                slot = (slot + 1) & mask
+            else:
+                slots[slot] = row
+        return cls(ids, np.asarray(slots, dtype=np.int32))
+
+    def get(self, id_) -> int:
+        """
+        :param id_: The id to look up.
+        :return: Row position of the id, or -1 if it is unknown.
+        """
+        if id_ is None:
+            return -1
+        slot = _hash(id_) & self.mask
+        while True:
+            row = int(self.slots[slot])
+            if row == -1 or self.ids[row] == id_:
+                return row
+            slot = (slot + 1) & self.mask
+
+
+class StringColumn(SequenceABC):
+    """
+    Strings stored as one concatenated utf-8 buffer; string i is `buffer[offsets[i]:offsets[i + 1]]`.
+    None is stored as an empty string. A loaded column is memory-mapped, so processes share its pages.
+    """
+    def __init__(self, buffer: bytes, offsets: np.ndarray):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    @classmethod
+    def from_list(cls, values: Sequence[Optional[str]]) -> "StringColumn":
+        builder = StringColumnBuilder()
+        for value in values:
+            builder.append(value)
+        return builder.build()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def save(self, directory: str, name: str) -> None:
+        with open(os.path.join(directory, f"{name}.buf"), "wb") as f:
+            f.write(self.buffer)
+        np.save(os.path.join(directory, f"{name}.offsets.npy"), self.offsets)
+
+    @classmethod
+    def load(cls, directory: str, name: str) -> "StringColumn":
+        offsets = np.load(os.path.join(directory, f"{name}.offsets.npy"), mmap_mode="r")
+        with open(os.path.join(directory, f"{name}.buf"), "rb") as f:
+            # mmap cannot map an empty file
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if offsets[-1] else b""
+        return cls(buffer, offsets)
+
+
+class StringColumnBuilder():
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offsets = array("q", [0])
+
+    def append(self, value: Optional[str]) -> None:
+        if value:
+            self.buffer += value.encode("utf-8")
+        self.offsets.append(len(self.buffer))
+
+    def extend(self, values) -> None:
+        for value in values:
+            self.append(value)
+
+    def build(self) -> StringColumn:
+        return StringColumn(bytes(self.buffer), np.frombuffer(self.offsets, dtype=np.int64))
+
+
+class IntColumn():
+    def __init__(self, values: np.ndarray):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i: int) -> int:
+        return int(self.values[i])
+
+
+class ForeignKeyColumn():
+    """
+    Ids of another table, integer-coded as row positions in that table (-1 for an unknown id, read back as None).
+    """
+    def __init__(self, codes: np.ndarray, target: StringColumn):
+        self.codes = codes
+        self.target = target
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        code = self.codes[i]
+        return self.target[code] if code != -1 else None
+
+
+class ColumnarTable():
+    """
+    A read-only table stored column by column.
+    Rows are read back as tuples in column order, so it can be used in place of a list of tuples.
+    """
+    def __init__(self, columns: Dict[str, object]):
+        self.columns = columns
+        self._columns = list(columns.values())
+
+    def __len__(self):
+        return len(self._columns[0]) if self._columns else 0
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("row index out of range")
+        return tuple(column[i] for column in self._columns)
+
+    def __iter__(self) -> Iterator[tuple]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def column(self, name: str):
+        return self.columns[name]
+
+    @classmethod
+    def from_batches(cls, columns: List[str], batches, foreign_keys: Dict[str, StringColumn] = {}) -> "ColumnarTable":
+        """
+        Build a table from batches of rows without keeping the rows in memory.
+        :param columns: Column names, "id" and "name" are stored as strings, other columns as integers.
+        :param batches: Iterable of lists of row tuples.
+        :param foreign_keys: For the columns holding ids of another table, the id column of that table.
+        :return: The table.
+        """
+        codes = {}
+        for name, target in foreign_keys.items():
+            # Built in reverse so that the first row of a duplicated id wins
+            ids = list(target)
+            codes[name] = dict(zip(reversed(ids), range(len(ids) - 1, -1, -1)))
+
+        builders = {}
+        for name in columns:
+            builders[name] = StringColumnBuilder() if name in STRING_COLUMNS else array("i")
+
+        for batch in batches:
+            for name, values in zip(columns, zip(*batch)):
+                builder = builders[name]
+                if name in codes:
+                    builder.extend(codes[name].get(value, -1) for value in values)
+                elif isinstance(builder, StringColumnBuilder):
+                    builder.extend(values)
+                else:
+                    builder.extend(int(value or 0) for value in values)
+
+        table = {}
+        for name in columns:
+            builder = builders[name]
+            if name in foreign_keys:
+                table[name] = ForeignKeyColumn(np.frombuffer(builder, dtype=np.int32), foreign_keys[name])
+            elif isinstance(builder, StringColumnBuilder):
+                table[name] = builder.build()
+            else:
+                table[name] = IntColumn(np.frombuffer(builder, dtype=np.int32))
+        return cls(table)
+
+
+class KnowledgeBase():
+    """
+    The songs, artists and albums tables used by the entity linker, with O(1) lookups by id.
+    Tables are accessed like a dictionary: `knowledge_base["songs"][row]`.
+    """
+    def __init__(self, tables: Dict[str, Sequence[tuple]], id_index: Dict[str, IdIndex] = None):
+        self.tables = tables
+        if id_index is None:
+            id_index = {table: IdIndex.build([record[0] for record in records]) for table, records in tables.items()}
+        self.id_index = id_index
+
+    @classmethod
+    def from_db(cls, db) -> "KnowledgeBase":
+        """
+        Load the tables column by column. Artist and album ids of songs and albums are integer-coded.
+        :param db: The Playlist database to read the tables from.
+        """
+        tables = {}
+        id_index = {}
+        # Referenced tables are loaded first so that their ids can be coded
+        for table in ("artists", "albums", "songs"):
+            columns = TABLES[table]
+            foreign_keys = {name: tables[target].column("id") for name, target in FOREIGN_KEYS[table].items()}
+            tables[table] = ColumnarTable.from_batches(columns, db.read_batches(table=table, data=columns), foreign_keys=foreign_keys)
+            id_index[table] = IdIndex.build(tables[table].column("id"))
+        return cls(tables, id_index)
+
+    def save(self, directory: str) -> None:
+        """
+        Write the columnar tables and their id indexes as flat files, one directory per table.
+        """
+        for table, records in self.tables.items():
+            table_dir = os.path.join(directory, table)
+            os.makedirs(table_dir, exist_ok=True)
+            for name, column in records.columns.items():
+                if isinstance(column, StringColumn):
+                    column.save(table_dir, name)
+                elif isinstance(column, ForeignKeyColumn):
+                    np.save(os.path.join(table_dir, f"{name}.npy"), column.codes)
+                else:
+                    np.save(os.path.join(table_dir, f"{name}.npy"), column.values)
+            np.save(os.path.join(table_dir, "id.slots.npy"), self.id_index[table].slots)
+
+    @classmethod
+    def load(cls, directory: str) -> "KnowledgeBase":
+        """
+        Memory-map the tables written by `save`, read-only.
+        """
+        tables = {}
+        id_index = {}
+        for table in ("artists", "albums", "songs"):
+            table_dir = os.path.join(directory, table)
+            columns = {}
+            for name in TABLES[table]:
+                if name in FOREIGN_KEYS[table]:
+                    target = tables[FOREIGN_KEYS[table][name]].column("id")
+                    columns[name] = ForeignKeyColumn(np.load(os.path.join(table_dir, f"{name}.npy"), mmap_mode="r"), target)
+                elif name in STRING_COLUMNS:
+                    columns[name] = StringColumn.load(table_dir, name)
+                else:
+                    columns[name] = IntColumn(np.load(os.path.join(table_dir, f"{name}.npy"), mmap_mode="r"))
+            tables[table] = ColumnarTable(columns)
+            id_index[table] = IdIndex(columns["id"], np.load(os.path.join(table_dir, "id.slots.npy"), mmap_mode="r"))
+        return cls(tables, id_index)
+
+    def __getitem__(self, table: str) -> Sequence[tuple]:
+        return self.tables[table]
+
+    def items(self):
+        return self.tables.items()
+
+    def row(self, table: str, id_) -> int:
+        return self.id_index[table].get(id_)
+
+    def get(self, table: str, id_) -> Optional[tuple]:
+        """
+        :param table: Name of the table.
+        :param id_: Id of the record.
+        :return: The record, or None if the id is unknown.
+        """
+        row = self.id_index[table].get(id_)
+        return self.tables[table][row] if row != -1 else None
+
+    def name(self, table: str, id_) -> Optional[str]:
+        record = self.get(table, id_)
+        return record[1] if record else None
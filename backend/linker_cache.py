@@ -0,0 +1,122 @@
+import copy
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Tuple
+
+from kb_index import clean_text
+
+CACHE_SIZE = 1024
+CACHE_TTL = 600
+VERSION_CHECK_INTERVAL = 5
+
+
+class LRUCache():
+    """
+    Bounded least-recently-used cache whose entries expire after `ttl` seconds.
+    All entries are dropped when `version()` returns a new value, checked at most every `check_interval` seconds.
+    Values are copied in and out when `copy` is set, so callers can modify what they get.
+    """
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL, version: Callable[[], Hashable] = None,
+                 check_interval: float = VERSION_CHECK_INTERVAL, copy: bool = True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = version
+        self.check_interval = check_interval
+        self.copy = copy
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.current_version = version() if version else None
+        self.last_check = time.monotonic()
+
+    def check_version(self, now: float) -> None:
+        if self.version is None or now - self.last_check < self.check_interval:
+            return
+        self.last_check = now
+        version = self.version()
+        if version != self.current_version:
+            self.current_version = version
+            self.entries.clear()
+            self.invalidations += 1
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        :return: (True, value) if the key is cached, else (False, None).
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.check_version(now)
+            entry = self.entries.get(key)
+            if entry is None or now - entry[0] > self.ttl:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            value = entry[1]
+        return True, copy.deepcopy(value) if self.copy else value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        value = copy.deepcopy(value) if self.copy else value
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "invalidations": self.invalidations,
+            }
+
+
+def freeze(value) -> Hashable:
+    """
+    Hashable key of an argument: entities are identified by their id, containers are made into tuples.
+    """
+    if hasattr(value, "id"):
+        return value.id
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def cached_recognition(method):
+    """
+    Cache the results of an EntityLinker recognize_* method in `self.cache`,
+    keyed by the normalized text, the method and its other arguments (e.g. the context).
+    A rebuilt catalog is reloaded first, so that no result of the previous catalog is served.
+    """
+    @functools.wraps(method)
+    def wrapper(self, text, *args, **kwargs):
+        self.check_catalog()
+        if self.cache is None:
+            return method(self, text, *args, **kwargs)
+        key = (method.__name__, clean_text(text), freeze(args), freeze(kwargs))
+        found, value = self.cache.get(key)
+        if not found:
+            version = self.catalog_version()
+            value = method(self, text, *args, **kwargs)
+            if self.catalog_version() == version:
+                # Else computed while the catalog index was reloaded
+                self.cache.put(key, value)
+        return value
+    return wrapper
@@ -0,0 +1,266 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from multiprocessing.managers import BaseManager
+from typing import Any, List, Tuple, Union
+
+from kb_index import CatalogIndex
+from linker_cache import VERSION_CHECK_INTERVAL
+from playlist import Playlist
+from song import Song
+
+logger = logging.getLogger(__name__)
+
+# Entity linking in worker processes, so that it is not limited by the GIL of the platform.
+# Each worker loads its own EntityLinker; the knowledge base and title indexes are memory-mapped,
+# so their pages are shared between the workers.
+#
+# In the platform:  LinkerClient.local(db, processes=4)
+# As a service:     python linker_service.py --processes 4
+#                   LinkerClient.connect(db)
+#
+# The service listens on a socket only its user can open (a named pipe on Windows). Calls are pickled,
+# so they are authenticated with LINKER_AUTHKEY, or a random key the service writes to KEY_PATH.
+
+ADDRESS = r"\\.\pipe\musiccrs-linker" if sys.platform == "win32" else os.path.join("data", "linker.sock")
+KEY_PATH = os.path.join("data", "linker.key")
+
+_linker = None
+
+
+def create_authkey(path: str = KEY_PATH) -> bytes:
+    """
+    :return: LINKER_AUTHKEY, else a new random key written to `path`, readable by this user only.
+    """
+    key = os.environ.get("LINKER_AUTHKEY")
+    if key:
+        return key.encode()
+    key = secrets.token_hex(32).encode()
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    os.chmod(path, 0o600)
+    return key
+
+
+def read_authkey(path: str = KEY_PATH) -> bytes:
+    """
+    :return: LINKER_AUTHKEY, else the key written by the running service.
+    :raises RuntimeError: If there is neither.
+    """
+    key = os.environ.get("LINKER_AUTHKEY")
+    if key:
+        return key.encode()
+    try:
+        with open(path, "rb") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        raise RuntimeError(f"No key to connect to the linker service: set LINKER_AUTHKEY or start linker_service.py, which writes {path}")
+
+
+def _init_worker(db_path: str, linker_kwargs: dict) -> None:
+    global _linker
+    # Imported here, spacy and the models are only needed in the workers
+    from entity_linker import EntityLinker
+    db = Playlist(id=uuid.uuid4().hex, path=db_path, init=False)
+    _linker = EntityLinker(db=db, **linker_kwargs)
+
+
+def _call(method: str, args: tuple, kwargs: dict) -> Any:
+    return getattr(_linker, method)(*args, **kwargs)
+
+
+class LinkerService():
+    """
+    A pool of processes running EntityLinker methods.
+    """
+    METHODS = ("recognize_song", "recognize_artist", "recognize_album", "recognize_all", "recognize_song_in_playlist", "songs_from_ids", "cache_stats", "metrics")
+
+    def __init__(self, db_path: str, processes: int = None, **linker_kwargs):
+        """
+        :param db_path: Path of the sqlite database.
+        :param processes: Number of worker processes, defaults to the number of cores.
+        :param linker_kwargs: Arguments of EntityLinker.
+        """
+        # Build the on-disk catalog index once here, the workers only load it
+        db = Playlist(id=uuid.uuid4().hex, path=db_path, init=False)
+        CatalogIndex.load_or_build(db)
+        db.close()
+
+        # spawn: the platform has threads and sqlite connections that must not be forked
+        context = multiprocessing.get_context("spawn")
+        self.pool = context.Pool(processes=processes or os.cpu_count(), initializer=_init_worker, initargs=(db_path, linker_kwargs))
+
+    def call(self, method: str, args: tuple = (), kwargs: dict = {}) -> Any:
+        """
+        Run an EntityLinker method in one of the workers and wait for its result.
+        """
+        if method not in self.METHODS:
+            raise AttributeError(f"EntityLinker method {method} is not available through the service")
+        return self.pool.apply(_call, (method, args, kwargs))
+
+    def close(self) -> None:
+        self.pool.close()
+        self.pool.join()
+
+
+class LinkerManager(BaseManager):
+    pass
+
+
+class LinkerClient():
+    """
+    Calls EntityLinker methods through a LinkerService, with the same signatures as EntityLinker.
+    Safe to use from several threads, calls run concurrently in the workers.
+    """
+    def __init__(self, call, db: Playlist, service: LinkerService = None):
+        self._call = call
+        self.service = service
+        self.db = db
+        # Drops the connection of the calling thread to a remote service
+        self.release = lambda: None
+        # The recommender reads the catalog index, memory-mapped so it costs little in this process
+        self.catalog_lock = threading.Lock()
+        self.load_catalog()
+
+    def build_version(self):
+        """
+        :return: Build version of the catalog in the database, changed by every CatalogBuilder run.
+        """
+        try:
+            record = self.db.read(table='catalog_meta', data=['value'], where={'key': 'build_version'})
+        except sqlite3.OperationalError:
+            record = None
+        return record[0][0] if record else None
+
+    def load_catalog(self):
+        """
+        Load the catalog index of the current catalog, building it if needed.
+        """
+        build_version = self.build_version()
+        self.catalog_index = CatalogIndex.load_or_build(self.db)
+        self.catalog_build_version = build_version
+        self.catalog_checked = time.monotonic()
+
+    def check_catalog(self):
+        """
+        Reload the catalog index when the catalog has been rebuilt, checked at most every VERSION_CHECK_INTERVAL seconds,
+        like the workers do with their own.
+        """
+        if time.monotonic() - self.catalog_checked < VERSION_CHECK_INTERVAL:
+            return
+        with self.catalog_lock:
+            if time.monotonic() - self.catalog_checked < VERSION_CHECK_INTERVAL:
+                return
+            self.catalog_checked = time.monotonic()
+            if self.build_version() == self.catalog_build_version:
+                return
+            logger.info("Catalog rebuilt, reloading the catalog index...")
+            self.load_catalog()
+
+    @classmethod
+    def local(cls, db: Playlist, processes: int = None, **linker_kwargs) -> "LinkerClient":
+        """
+        Start the worker processes as children of this process.
+        """
+        service = LinkerService(db.path, processes=processes, **linker_kwargs)
+        return cls(service.call, db, service=service)
+
+    @classmethod
+    def connect(cls, db: Playlist, address: Union[str, Tuple[str, int]] = ADDRESS, authkey: bytes = None) -> "LinkerClient":
+        """
+        Connect to a service started with `python linker_service.py`.
+        :param address: Socket path, or (host, port) of a service started with --port.
+        :param authkey: Defaults to LINKER_AUTHKEY or the key file of the service.
+        """
+        LinkerManager.register("call")
+        manager = LinkerManager(address=address, authkey=authkey or read_authkey())
+        manager.connect()
+        # Proxies are not thread-safe, one per thread. A proxy releases its object in the service
+        # when it is garbage collected, i.e. when its thread exits and the thread-local storage is dropped.
+        proxies = threading.local()
+
+        def call(method, args=(), kwargs={}):
+            proxy = getattr(proxies, "proxy", None)
+            if proxy is None:
+                proxy = proxies.proxy = manager.call()
+            return proxy.call(method, args, kwargs)
+
+        def release():
+            proxies.__dict__.pop("proxy", None)
+
+        client = cls(call, db)
+        client.release = release
+        return client
+
+    def recognize_song(self, text, context: dict[str, Any] = None):
+        return self._call("recognize_song", (text,), {"context": context})
+
+    def recognize_artist(self, text):
+        return self._call("recognize_artist", (text,))
+
+    def recognize_album(self, text, context: dict[str, Any] = None):
+        return self._call("recognize_album", (text,), {"context": context})
+
+    def recognize_all(self, text, types=("artists", "songs", "albums"), context: dict[str, Any] = None):
+        return self._call("recognize_all", (text,), {"types": types, "context": context})
+
+    def recognize_song_in_playlist(self, text: str, playlist: List[Song]) -> List[Tuple[Song, float]]:
+        return self._call("recognize_song_in_playlist", (text, playlist))
+
+    def songs_from_ids(self, song_ids: List[str]) -> List[Song]:
+        return self._call("songs_from_ids", (song_ids,))
+
+    def cache_stats(self) -> dict:
+        """
+        :return: Cache counters of the worker that handles the call, each worker has its own caches.
+        """
+        return self._call("cache_stats")
+
+    def metrics(self) -> dict:
+        """
+        :return: Stage timers and counters of the worker that handles the call.
+        """
+        return self._call("metrics")
+
+    def close(self) -> None:
+        self.release()
+        if self.service:
+            self.service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the entity linker in worker processes behind a local socket.")
+    parser.add_argument("--db", default=os.path.join("data", "spotify.sqlite"))
+    parser.add_argument("--processes", type=int, default=None, help="Number of worker processes, defaults to the number of cores.")
+    parser.add_argument("--socket", default=ADDRESS, help="Path of the socket, or name of the pipe on Windows.")
+    parser.add_argument("--port", type=int, default=None, help="Listen on 127.0.0.1:PORT instead of the socket.")
+    args = parser.parse_args()
+    address = ("127.0.0.1", args.port) if args.port else args.socket
+    authkey = create_authkey()
+
+    service = LinkerService(args.db, processes=args.processes)
+
+    class ServiceProxy():
+        def call(self, method, args=(), kwargs={}):
+            return service.call(method, args, kwargs)
+
+    LinkerManager.register("call", callable=ServiceProxy)
+    if isinstance(address, str) and sys.platform != "win32" and os.path.exists(address):
+        # Left by a previous run
+        os.remove(address)
+    # Created with the permissions of the umask, restricted before the first client can authenticate
+    old_umask = os.umask(0o177)
+    try:
+        server = LinkerManager(address=address, authkey=authkey).get_server()
+    finally:
+        os.umask(old_umask)
+    print(f"Entity linker service listening on {address}")
+    server.serve_forever()
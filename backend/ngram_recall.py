@@ -0,0 +1,63 @@
+import argparse
+import os
+import random
+import uuid
+
+from playlist import Playlist
+from kb_index import FALLBACK_SCORE, SHORTLIST_SIZE, CatalogIndex, clean_text, shortlist_recall
+
+# Report how many of the exhaustive fuzzy matches the trigram shortlist, with its exhaustive fallback, keeps.
+# Mentions are catalog names with a random typo, plus the n-grams of a few typical requests.
+
+SAMPLE_UTTERANCES = [
+    "add Blinding Lights by The Weeknd",
+    "add shape of you ed sheeran",
+    "which album : Bohemian Rhapsody",
+    "date album : Thriller",
+    "number songs : Taylor Swift",
+    "give song : Daft Punk",
+]
+
+
+def with_typo(text: str) -> str:
+    if len(text) < 2:
+        return text
+    i = random.randrange(len(text))
+    edit = random.choice(["delete", "swap", "replace"])
+    if edit == "delete":
+        return text[:i] + text[i + 1:]
+    if edit == "swap" and i < len(text) - 1:
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    return text[:i] + random.choice("abcdefghijklmnopqrstuvwxyz") + text[i + 1:]
+
+
+def utterance_mentions(text: str, n: int = 3) -> list:
+    words = clean_text(text).split()
+    return [" ".join(words[i:i + j]) for i in range(len(words)) for j in range(1, n + 1) if i + j <= len(words)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall of the trigram shortlist against the exhaustive scan.")
+    parser.add_argument("--db", default=os.path.join("data", "spotify.sqlite"))
+    parser.add_argument("--samples", type=int, default=200, help="Number of catalog names to perturb per table.")
+    parser.add_argument("--limit", type=int, default=3)
+    parser.add_argument("--shortlist", type=int, default=SHORTLIST_SIZE)
+    parser.add_argument("--fallback-score", type=float, default=FALLBACK_SCORE, help="Best shortlisted score under which a mention is scored exhaustively.")
+    parser.add_argument("--min-score", type=float, default=60, help="Exhaustive matches scoring at least this much are relevant.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    db = Playlist(id=uuid.uuid4().hex, path=args.db, init=False)
+    catalog_index = CatalogIndex.load_or_build(db)
+
+    for table, title_index in catalog_index.title_index.items():
+        ngram_index = catalog_index.ngram_index[table]
+
+        mentions = [with_typo(title) for title in random.sample(title_index.titles, min(args.samples, len(title_index)))]
+        mentions += [mention for text in SAMPLE_UTTERANCES for mention in utterance_mentions(text)]
+        report = shortlist_recall(title_index, ngram_index, mentions, limit=args.limit, size=args.shortlist, min_score=args.min_score,
+                                  fallback_score=args.fallback_score)
+        print(f"{table}: {report['mentions']} mentions, recall@{args.limit} {report['recall']:.3f}, "
+              f"relevant recall@{args.limit} {report['relevant_recall']:.3f} ({report['relevant_missed']} of {report['relevant']} missed), "
+              f"best score kept {report['best_score_match']:.3f}, scored exhaustively {report['fallback']:.3f}")
@@ -1,3 +1,5 @@
+import logging
+from functools import lru_cache
 from typing import List
 
 import sqlite3
@@ -5,46 +7,84 @@ import musicbrainzngs
 import time
 import json
 import subprocess
-import zipfile
 import os
 import pandas as pd
 
+from archive import extract_archive
+from db_pool import ConnectionPool
+from catalog_build import CatalogBuilder
+from instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=256)
+def select_statement(table: str, columns: tuple, where: tuple = (), limit: bool = False) -> str:
+    # One SQL text per query shape, values are bound as parameters so that sqlite reuses the prepared statement
+    request = 'SELECT ' + ', '.join(columns) + ' FROM ' + table
+    if where:
+        request += ' WHERE ' + ' AND '.join([key + ' = ?' for key in where])
+    if limit:
+        request += ' LIMIT ?'
+    return request
+
 
 class Playlist():
     def __init__(self, id, path=os.path.join("data", "spotify.sqlite"), init=True):
     # Connexion à la base de données SQLite
         self.id = id
-        self.conn = sqlite3.connect(path, check_same_thread=False)
-        self.conn.text_factory = lambda x: x.decode('utf-8', errors='ignore')
+        self.path = path
+        if init:
+            # Before connecting: connect() creates an empty file, and extraction replaces the file
+            self.fetch_data()
+        self.pool = ConnectionPool(path)
         if init:
             self.init_db()
 
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Read connection of the calling thread, writes go through self.pool.write
+        return self.pool.reader()
+
+    def close(self):
+        self.pool.close()
+
+    @timed("db_write")
     def create(self, table: str, data: dict[str, str]):
-        cursor = self.conn.cursor()
-        cursor.execute('INSERT INTO ' + table + ' (' + ', '.join(data.keys()) + ') VALUES (' + ', '.join(['?'] * len(data)) + ')', tuple(data.values()))
-        self.conn.commit()
-        return cursor.lastrowid
+        request = 'INSERT INTO ' + table + ' (' + ', '.join(data.keys()) + ') VALUES (' + ', '.join(['?'] * len(data)) + ')'
+        return self.pool.write(lambda conn: conn.execute(request, tuple(data.values())).lastrowid)
 
+    @timed("db_write")
     def delete(self, table: str, data: dict[str, str] = {}):
-        cursor = self.conn.cursor()
-        cursor.execute('DELETE FROM ' + table + ' WHERE ' + ' AND '.join([key + ' = ?' for key in data.keys()]), tuple(data.values()))
-        self.conn.commit()
+        request = 'DELETE FROM ' + table + ' WHERE ' + ' AND '.join([key + ' = ?' for key in data.keys()])
+        return self.pool.write(lambda conn: conn.execute(request, tuple(data.values())).rowcount)
     
+    @timed("db_write")
     def update(self, table: str, data: dict[str, str], where: dict[str, str] = {}):
+        request = 'UPDATE ' + table + ' SET ' + ', '.join([key + ' = ?' for key in data.keys()]) + ' WHERE ' + ' AND '.join([key + ' = ?' for key in where.keys()])
+        return self.pool.write(lambda conn: conn.execute(request, tuple(data.values()) + tuple(where.values())).rowcount)
+
+    @timed("db_read")
+    def read(self, table: str, data: list[str] = ("*"), where: dict[str, str] = {}, limit=None):
+        """
+        Select rows of a table.
+        :param table: Name of the table.
+        :param data: Columns to select.
+        :param where: Column/value pairs the rows must all match, values are bound as parameters.
+        :param limit: Maximum number of rows.
+        :return: List of row tuples.
+        """
+        request = select_statement(table, tuple(data), tuple(where.keys()), bool(limit))
+        parameters = tuple(where.values()) + ((limit,) if limit else ())
+        return self.conn.execute(request, parameters).fetchall()
+
+    def read_batches(self, table: str, data: list[str] = ("*"), where: dict[str, str] = {}, batch_size=10000):
         cursor = self.conn.cursor()
-        cursor.execute('UPDATE ' + table + ' SET ' + ', '.join([key + ' = ?' for key in data.keys()]) + ' WHERE ' + ' AND '.join([key + ' = ?' for key in where.keys()]), tuple(data.values()) + tuple(where.values()))
-        self.conn.commit()
-
-    def read(self, table: str, data: list[str] = ("*"), where: str = "", limit=None):
-        cursor = self.conn.cursor()
-        request = 'SELECT ' + ', '.join(data) + ' FROM ' + table
-        if where:
-            request += ' WHERE ' + where
-        if limit:
-            request += ' LIMIT ' + str(limit)
-        cursor.execute(request)
-        return cursor.fetchall()
+        cursor.execute(select_statement(table, tuple(data), tuple(where.keys())), tuple(where.values()))
+        while batch := cursor.fetchmany(batch_size):
+            yield batch
 
+    @timed("db_read")
     def read_songs_from_playlist(self, playlist_id, data: list[str] = ["*"]):
         cursor = self.conn.cursor()
         cursor.execute('SELECT ' + ', '.join(data) + ' FROM songs ' +
@@ -54,6 +94,7 @@ class Playlist():
             'WHERE playlist_songs.playlist_id = ?', (playlist_id,))
         return cursor.fetchall()
     
+    @timed("db_read")
     def read_album_from_song(self, song_id, data: list[str] = ("*")):
         cursor = self.conn.cursor()
         cursor.execute('''
@@ -64,226 +105,66 @@ class Playlist():
     ''', (song_id,))
         return cursor.fetchall()
     
-    def init_db(self):
-        print("Initializing database...")
-
+    def fetch_data(self):
         download_path = os.path.join("data", "archive.zip")
         if not os.path.exists(download_path):
-            print("Downloading data...")
+            logger.info("Downloading data...")
             curl_command = ["curl", "-L", "-o", download_path,"https://www.kaggle.com/api/v1/datasets/download/maltegrosse/8-m-spotify-tracks-genre-audio-features", "--ssl-no-revoke"]
             result = subprocess.run(curl_command, check=True)
         zip_path = os.path.expanduser(download_path)
 
-        print("Extracting data...")
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall("data")
-        
-        cursor = self.conn.cursor()
-        cursor.execute('PRAGMA encoding = "UTF-8"')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS playlists (
-                playlist_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL
-            );
-        ''')
+        logger.info("Extracting data...")
+        extract_archive(zip_path, "data")
 
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS playlist_songs (
-                playlist_id TEXT,
-                song_id TEXT,
-                FOREIGN KEY (playlist_id) REFERENCES playlists(playlist_id),
-                FOREIGN KEY (song_id) REFERENCES songs(id),
-                PRIMARY KEY (playlist_id, song_id)
-            );
-        ''')
-        
-        self.conn.commit()
+    def init_db(self):
+        logger.info("Initializing database...")
+        self.pool.write(self.create_tables)
 
-    def populate_data(self):
-        print("Populating data...")
-        cursor = self.conn.cursor()
+    def create_tables(self, conn: sqlite3.Connection):
+        cursor = conn.cursor()
         cursor.execute('PRAGMA encoding = "UTF-8"')
 
-        print("Creating indexes...")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_audio_features_id ON audio_features (id);")
-        print("Index created: idx_audio_features_id")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_tracks_audio_feature_id ON tracks (audio_feature_id);")
-        print("Index created: idx_tracks_audio_feature_id")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_tracks_id ON tracks (id);")
-        print("Index created: idx_tracks_id")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_artists_id ON artists (id);")
-        print("Index created: idx_artists_id")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_artists_name ON artists (name);")
-        print("Index created: idx_artists_name")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_albums_id ON albums (id);")
-        print("Index created: idx_albums_id")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_albums_name ON albums (name);")
-        print("Index created: idx_albums_name")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_r_artist_genre_genre_id ON r_artist_genre (genre_id);")
-        print("Index created: idx_r_artist_genre_genre_id")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_r_artist_genre_artist_id ON r_artist_genre (artist_id);")
-        print("Index created: idx_r_artist_genre_artist_id")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_r_track_artist_artist_id ON r_track_artist (artist_id);")
-        print("Index created: idx_r_track_artist_artist_id")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_r_track_artist_track_id ON r_track_artist (track_id);")
-        print("Index created: idx_r_track_artist_track_id")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_r_albums_artists_artist_id ON r_albums_artists (artist_id);")
-        print("Index created: idx_r_albums_artist_artist_id")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_r_albums_artists_album_id ON r_albums_artists (album_id);")
-        print("Index created: idx_r_albums_artist_album_id")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_r_albums_tracks_album_id ON r_albums_tracks (album_id);")
-        print("Index created: idx_r_albums_tracks_album_id")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_r_albums_tracks_track_id ON r_albums_tracks (track_id);")
-        print("Index created: idx_r_albums_tracks_track_id")
-
-        self.conn.commit()
-
         cursor.execute('''
-            DELETE FROM tracks
-            WHERE id NOT IN (
-                SELECT id FROM tracks
-                ORDER BY RANDOM()
-                LIMIT 1500000
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL UNIQUE,
+                password_hash TEXT NOT NULL
             );
         ''')
 
-        self.conn.commit()
-
-        cursor.execute("SELECT COUNT(*) FROM tracks;")
-        print(f"Total tracks: {cursor.fetchone()[0]}")
-
-        cursor.execute("CREATE TABLE IF NOT EXISTS songs AS SELECT * FROM tracks INNER JOIN audio_features ON tracks.audio_feature_id = audio_features.id INNER JOIN r_track_artist ON tracks.id = r_track_artist.track_id  INNER JOIN r_albums_tracks ON tracks.id = r_albums_tracks.track_id;")
-        print("Created songs table")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_songs_id ON songs (id);")
-        print("Index created: idx_songs_id")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_songs_name ON songs (name);")
-        print("Index created: idx_songs_name")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_songs_album_id ON songs (album_id);")
-        print("Index created: idx_songs_album_id")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_songs_artist_id ON songs (artist_id);")
-        print("Index created: idx_songs_artist_id")
-
-        cursor.execute("ALTER TABLE albums ADD COLUMN artist_id TEXT;")
-        cursor.execute('''
-            UPDATE albums
-            SET artist_id = (
-                SELECT r_albums_artists.artist_id 
-                FROM r_albums_artists 
-                WHERE r_albums_artists.album_id = albums.id
-            );
-        ''')
-        print("Updated albums with artist_id")
-
-        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_albums_artist_id ON albums (artist_id);")
-        print("Index created: idx_albums_artist_id")
-
-        self.conn.commit()
-
-        cursor.execute("ALTER TABLE artists ADD COLUMN genre TEXT;")
         cursor.execute('''
-            UPDATE artists
-            SET genre = (
-                SELECT r_artist_genre.genre_id 
-                FROM r_artist_genre 
-                WHERE r_artist_genre.artist_id = artists.id
+            CREATE TABLE IF NOT EXISTS playlists (
+                playlist_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                owner INTEGER REFERENCES users(user_id)
             );
         ''')
-        print("Updated artists with genre")
-
-        cursor.execute('''
-            ALTER TABLE albums
-            ADD COLUMN total_songs INTEGER
-        ''')
-
-        # Update the song_count column for each album
-        cursor.execute('''
-            UPDATE albums
-            SET total_songs = (
-                SELECT COUNT(*)
-                FROM songs
-                WHERE songs.album_id = albums.id
-            )
-        ''')
-        print("Updated albums with total_songs")
-
-        cursor.execute('''
-            ALTER TABLE artists
-            ADD COLUMN total_albums INTEGER
-        ''')
-
-        # Update the song_count column for each album
-        cursor.execute('''
-            UPDATE artists
-            SET total_albums = (
-                SELECT COUNT(*)
-                FROM albums
-                WHERE albums.artist_id = artists.id
-            )
-        ''')
-        print("Updated artists with total_albums")
-
-        self.conn.commit()
-
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';") 
-        table_names = [table[0] for table in cursor.fetchall()] 
-        print("Tables:", table_names) 
-
-        os.makedirs("data/new_schema", exist_ok=True) 
-        for table_name in table_names: 
-            cursor.execute(f"PRAGMA table_info('{table_name}');") 
-            column_names = [column[1] for column in cursor.fetchall()] 
-            with open(f"data/new_schema/{table_name}.csv", "w") as f: 
-                f.write(",".join(column_names) + "\n") 
-                cursor.execute(f"SELECT * FROM {table_name} LIMIT 1;") 
-                row = cursor.fetchone()
-                if row:
-                    f.write(",".join([str(column) for column in row]) + "\n") 
-        
-        res = cursor.execute('SELECT COUNT(*) FROM songs;')
-        print(f"Total songs added: {res.fetchone()[0]}")
-        self.conn.commit()
-
-        """ self.conn.text_factory = bytes
-        cursor = self.conn.cursor()
-
-        from encodings.aliases import aliases
-        _encodings = set(aliases.values())
+        if 'owner' not in [column[1] for column in cursor.execute('PRAGMA table_info(playlists)')]:
+            cursor.execute('ALTER TABLE playlists ADD COLUMN owner INTEGER REFERENCES users(user_id)')
+        # Playlist of a user in O(log n), one per user and name
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_playlists_owner ON playlists (owner, name)')
+
+        # Clustered on the primary key: the songs of a playlist are one range of the table,
+        # read without a separate index, and the playlists of different users are on different pages
+        playlist_songs = '''
+            CREATE TABLE IF NOT EXISTS {name} (
+                playlist_id INTEGER NOT NULL,
+                song_id TEXT NOT NULL,
+                FOREIGN KEY (playlist_id) REFERENCES playlists(playlist_id),
+                FOREIGN KEY (song_id) REFERENCES songs(id),
+                PRIMARY KEY (playlist_id, song_id)
+            ) WITHOUT ROWID;
+        '''
+        record = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'playlist_songs'").fetchone()
+        if record and 'WITHOUT ROWID' not in record[0].upper():
+            logger.info("Migrating playlist_songs...")
+            cursor.execute(playlist_songs.format(name='playlist_songs_new'))
+            cursor.execute('INSERT OR IGNORE INTO playlist_songs_new SELECT CAST(playlist_id AS INTEGER), song_id FROM playlist_songs WHERE playlist_id IS NOT NULL AND song_id IS NOT NULL')
+            cursor.execute('DROP TABLE playlist_songs')
+            cursor.execute('ALTER TABLE playlist_songs_new RENAME TO playlist_songs')
+        else:
+            cursor.execute(playlist_songs.format(name='playlist_songs'))
 
-        def try_encodings(byte_text: bytes):
-            for encoding in _encodings:
-                try:
-                    print(f'Encoding {encoding}: {byte_text.decode(encoding)}')
-                    print(f"Encoding {encoding} suceeded")
-                except (UnicodeDecodeError, LookupError):
-                    pass
-        
-        print("Trying to decode byte strings...")
-        cursor.execute("SELECT * FROM artists")
-        col_ix = 0
-        while row := cursor.fetchone():
-            try:
-                text = row[col_ix].decode()
-            except UnicodeDecodeError as e:
-                print('Cannot decode byte string: ', row[col_ix])
-                try_encodings(row[col_ix])
-                break """
\ No newline at end of file
+    def populate_data(self):
+        logger.info("Populating data...")
+        CatalogBuilder(self.path).run()
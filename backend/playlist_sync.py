@@ -0,0 +1,124 @@
+import contextlib
+import threading
+import uuid
+from typing import Callable, Dict, Iterator, Set
+
+from playlist import Playlist
+from song import Song
+
+
+def song_data(song: Song) -> dict:
+    return {"id": song.id, "title": song.title, "artist": song.artist_name, "album": song.album_name}
+
+
+class PlaylistSync():
+    """Versioned change stream of the playlists.
+
+    Every change to a playlist gets the next revision of that playlist and is sent to its
+    subscribers as a delta (`playlist:add`, `playlist:remove`, `playlist:clear`). Clients
+    apply deltas in order and ask for a `playlist:snapshot` on connect, or when a revision
+    is skipped. `epoch` changes when the server restarts, as revisions start over.
+
+    Writers change a playlist and publish the change under `playlist_lock`, so that a
+    snapshot is read either before the change or after its delta has its revision.
+    Writers only publish changes that matched rows, a delta that changes nothing is not sent.
+    The state of a playlist is dropped once it has no subscriber and no writer, its
+    next subscriber starts from a snapshot.
+    """
+
+    def __init__(self, db: Playlist, emit: Callable[[str, dict, str], None]) -> None:
+        """
+        Args:
+            db: The database holding the playlists.
+            emit: Called with (event, data, user_id) to send an event to a user.
+        """
+        self.db = db
+        self.emit = emit
+        self.epoch = uuid.uuid4().hex
+        self.revisions: Dict[int, int] = {}
+        self.subscribers: Dict[int, Set[str]] = {}
+        # Guards the subscribers and the locks, changes of different playlists only share it briefly
+        self.lock = threading.Lock()
+        # Reentrant, publish takes it again inside the writers
+        self.playlist_locks: Dict[int, threading.RLock] = {}
+        # Number of threads holding or waiting for the lock of each playlist
+        self.lock_users: Dict[int, int] = {}
+
+    @contextlib.contextmanager
+    def playlist_lock(self, playlist_id: int) -> Iterator[None]:
+        """Holds the lock of a playlist, reentrant.
+
+        Args:
+            playlist_id: Playlist ID.
+        """
+        with self.lock:
+            lock = self.playlist_locks.get(playlist_id)
+            if lock is None:
+                lock = self.playlist_locks[playlist_id] = threading.RLock()
+            self.lock_users[playlist_id] = self.lock_users.get(playlist_id, 0) + 1
+        try:
+            with lock:
+                yield
+        finally:
+            with self.lock:
+                self.lock_users[playlist_id] -= 1
+                if not self.lock_users[playlist_id]:
+                    del self.lock_users[playlist_id]
+                    self.prune(playlist_id)
+
+    def prune(self, playlist_id: int) -> None:
+        """Drops the state of a playlist nobody follows or changes, called with `lock` held.
+
+        Args:
+            playlist_id: Playlist ID.
+        """
+        if playlist_id not in self.subscribers and playlist_id not in self.lock_users:
+            self.playlist_locks.pop(playlist_id, None)
+            self.revisions.pop(playlist_id, None)
+
+    def subscribe(self, playlist_id: int, user_id: str) -> None:
+        with self.lock:
+            self.subscribers.setdefault(playlist_id, set()).add(user_id)
+
+    def unsubscribe(self, user_id: str) -> None:
+        with self.lock:
+            for playlist_id, users in list(self.subscribers.items()):
+                users.discard(user_id)
+                if not users:
+                    del self.subscribers[playlist_id]
+                    self.prune(playlist_id)
+
+    def send_snapshot(self, playlist_id: int, user_id: str) -> None:
+        """Sends the full playlist with its current revision to one user.
+
+        Args:
+            playlist_id: Playlist ID.
+            user_id: User ID.
+        """
+        # Under the lock, so that no delta is published between the read and the revision
+        with self.playlist_lock(playlist_id):
+            songs = self.db.read_songs_from_playlist(playlist_id=playlist_id, data=('songs.id', 'songs.name', 'artists.name', 'albums.name'))
+            snapshot = {
+                "epoch": self.epoch,
+                "revision": self.revisions.get(playlist_id, 0),
+                "songs": [{"id": song[0], "title": song[1], "artist": song[2], "album": song[3]} for song in songs],
+            }
+            self.emit("playlist:snapshot", snapshot, user_id)
+
+    def publish(self, playlist_id: int, event: str, data: dict) -> None:
+        with self.playlist_lock(playlist_id):
+            self.revisions[playlist_id] = self.revisions.get(playlist_id, 0) + 1
+            delta = {"epoch": self.epoch, "revision": self.revisions[playlist_id], **data}
+            with self.lock:
+                subscribers = list(self.subscribers.get(playlist_id, ()))
+            for user_id in subscribers:
+                self.emit(event, delta, user_id)
+
+    def added(self, playlist_id: int, song: Song) -> None:
+        self.publish(playlist_id, "playlist:add", {"song": song_data(song)})
+
+    def removed(self, playlist_id: int, song_id: str) -> None:
+        self.publish(playlist_id, "playlist:remove", {"id": song_id})
+
+    def cleared(self, playlist_id: int) -> None:
+        self.publish(playlist_id, "playlist:clear", {})
@@ -0,0 +1,147 @@
+import logging
+import os
+import shutil
+import threading
+from typing import List, Tuple
+
+import numpy as np
+from annoy import AnnoyIndex
+
+from kb_index import CatalogIndex, index_directory
+from knowledge_base import KnowledgeBase
+
+logger = logging.getLogger(__name__)
+
+FEATURES = ["danceability", "energy", "loudness", "speechiness", "acousticness", "instrumentalness", "liveness", "valence", "tempo"]
+N_TREES = 20
+# Most songs returned by one recommendation request of a client
+MAX_RECOMMENDATIONS = 50
+
+
+class FeatureIndex():
+    """
+    Approximate nearest neighbour index over the normalized audio features of the songs.
+    `features[row]` is the z-scored feature vector of the song at that row of the knowledge base,
+    stored as a float32 .npy file and memory-mapped; the Annoy index holds one item per distinct song id.
+    """
+    def __init__(self, features: np.ndarray, annoy_index: AnnoyIndex, knowledge_base: KnowledgeBase):
+        self.features = features
+        self.annoy_index = annoy_index
+        self.knowledge_base = knowledge_base
+
+    @classmethod
+    def build(cls, db, knowledge_base: KnowledgeBase, directory: str) -> None:
+        """
+        Read the audio features of the songs, normalize them and save the feature matrix and its Annoy index.
+        :param db: The Playlist database.
+        :param knowledge_base: The knowledge base the rows refer to.
+        :param directory: Where to save the index.
+        """
+        songs = knowledge_base["songs"]
+        features = np.full((len(songs), len(FEATURES)), np.nan, dtype=np.float32)
+        indexed = np.zeros(len(songs), dtype=bool)
+        for batch in db.read_batches(table="songs", data=["id"] + FEATURES):
+            for record in batch:
+                # Songs linked to several artists appear on several rows, only the first one is indexed
+                row = knowledge_base.row("songs", record[0])
+                if row != -1 and not indexed[row]:
+                    features[row] = [np.nan if value is None else value for value in record[1:]]
+                    indexed[row] = True
+
+        mean = np.nanmean(features[indexed], axis=0) if indexed.any() else np.zeros(len(FEATURES))
+        std = np.nanstd(features[indexed], axis=0) if indexed.any() else np.ones(len(FEATURES))
+        std[std == 0] = 1
+        features = np.nan_to_num((features - mean) / std).astype(np.float32)
+
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "features.npy"), features)
+        annoy_index = AnnoyIndex(len(FEATURES), "euclidean")
+        for row in np.flatnonzero(indexed):
+            annoy_index.add_item(int(row), features[row])
+        annoy_index.build(N_TREES)
+        annoy_index.save(os.path.join(directory, "features.ann"))
+
+    @classmethod
+    def load(cls, directory: str, knowledge_base: KnowledgeBase) -> "FeatureIndex":
+        features = np.load(os.path.join(directory, "features.npy"), mmap_mode="r")
+        annoy_index = AnnoyIndex(len(FEATURES), "euclidean")
+        annoy_index.load(os.path.join(directory, "features.ann"))
+        return cls(features, annoy_index, knowledge_base)
+
+    @classmethod
+    def load_or_build(cls, db, catalog_index: CatalogIndex) -> "FeatureIndex":
+        """
+        Load the index of the current catalog version, building it first if needed.
+        :param db: The Playlist database.
+        :param catalog_index: The loaded catalog index.
+        :return: The index.
+        """
+        directory = os.path.join(index_directory(db.path), catalog_index.version, "features")
+        if not os.path.exists(directory):
+            logger.info("Building feature index %s...", directory)
+            tmp_directory = f"{directory}.tmp-{os.getpid()}"
+            cls.build(db, catalog_index.knowledge_base, tmp_directory)
+            try:
+                os.rename(tmp_directory, directory)
+            except OSError:
+                # Another worker finished the same build first
+                shutil.rmtree(tmp_directory, ignore_errors=True)
+        return cls.load(directory, catalog_index.knowledge_base)
+
+    def recommend(self, song_ids: List[str], limit: int = 5) -> List[Tuple[str, float]]:
+        """
+        Find the songs closest to the centroid of the given songs.
+        :param song_ids: Ids of the songs to start from, e.g. the content of a playlist.
+        :param limit: Number of songs to return.
+        :return: List of (song id, distance) tuples, closest first, excluding the given songs.
+        """
+        rows = [row for row in (self.knowledge_base.row("songs", song_id) for song_id in song_ids) if row != -1]
+        if not rows:
+            return []
+        centroid = np.asarray(self.features[rows]).mean(axis=0)
+
+        exclude = set(song_ids)
+        items, distances = self.annoy_index.get_nns_by_vector(centroid, limit + len(exclude), include_distances=True)
+        recommendations = []
+        for item, distance in zip(items, distances):
+            song_id = self.knowledge_base["songs"][item][0]
+            if song_id not in exclude:
+                exclude.add(song_id)
+                recommendations.append((song_id, distance))
+        return recommendations[:limit]
+
+
+class CatalogRecommender():
+    """
+    The FeatureIndex of the catalog index loaded by an entity linker, reloaded along with that index when the catalog
+    is rebuilt, so that recommended rows refer to the knowledge base the song ids are looked up in.
+    """
+    def __init__(self, db, entity_linker):
+        """
+        :param db: The Playlist database.
+        :param entity_linker: An EntityLinker or a LinkerClient.
+        """
+        self.db = db
+        self.entity_linker = entity_linker
+        self.lock = threading.Lock()
+        self.load(entity_linker.catalog_index)
+
+    def load(self, catalog_index: CatalogIndex) -> None:
+        self.feature_index = FeatureIndex.load_or_build(self.db, catalog_index)
+        self.catalog_version = catalog_index.version
+
+    def current(self) -> FeatureIndex:
+        """
+        :return: The index of the catalog index the entity linker currently has loaded.
+        """
+        self.entity_linker.check_catalog()
+        catalog_index = self.entity_linker.catalog_index
+        if catalog_index.version != self.catalog_version:
+            with self.lock:
+                if catalog_index.version != self.catalog_version:
+                    logger.info("Catalog rebuilt, reloading the feature index...")
+                    self.load(catalog_index)
+        return self.feature_index
+
+    def recommend(self, song_ids: List[str], limit: int = 5) -> List[Tuple[str, float]]:
+        return self.current().recommend(song_ids, limit=limit)
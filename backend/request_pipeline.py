@@ -0,0 +1,104 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict
+
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+WORKERS = 4
+MAX_PENDING = 64
+
+
+class RequestPipeline():
+    """Runs the requests of many sessions on a bounded pool of worker threads.
+
+    Requests of one session run one at a time, in the order they were submitted; requests of
+    different sessions run concurrently. A session is handed to the pool one request at a time,
+    so a session with a long backlog does not hold a worker while others wait.
+    """
+
+    def __init__(self, workers: int = WORKERS, max_pending: int = MAX_PENDING) -> None:
+        """
+        Args:
+            workers: Number of worker threads.
+            max_pending: Maximum number of requests queued or running, over all sessions.
+        """
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="request")
+        self.queues: Dict[str, Deque[Callable[[], None]]] = {}
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+
+    def submit(self, session_id: str, request: Callable[[], None]) -> bool:
+        """Queues a request of a session.
+
+        Args:
+            session_id: Session the request belongs to.
+            request: Called without arguments on a worker thread.
+
+        Returns:
+            False if the pipeline is full and the request was not queued.
+        """
+        with self.lock:
+            if self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+            queue = self.queues.get(session_id)
+            if queue is not None:
+                # The session is already scheduled, its worker picks the request up
+                queue.append(request)
+                return True
+            self.queues[session_id] = deque([request])
+        self.executor.submit(self.run, session_id)
+        return True
+
+    def run(self, session_id: str) -> None:
+        with self.lock:
+            queue = self.queues[session_id]
+            if not queue:
+                # Cancelled before it started
+                del self.queues[session_id]
+                return
+            request = queue.popleft()
+        try:
+            with metrics.timer("request"):
+                request()
+        except Exception:
+            metrics.increment("request_errors")
+            logger.exception("Error processing a request of %s", session_id)
+        finally:
+            with self.lock:
+                self.pending -= 1
+                if self.queues[session_id]:
+                    reschedule = True
+                else:
+                    del self.queues[session_id]
+                    reschedule = False
+                if not self.pending:
+                    self.idle.notify_all()
+            if reschedule:
+                self.executor.submit(self.run, session_id)
+
+    def cancel(self, session_id: str) -> None:
+        """Drops the requests of a session that have not started yet.
+
+        Args:
+            session_id: Session ID.
+        """
+        with self.lock:
+            queue = self.queues.get(session_id)
+            if queue:
+                self.pending -= len(queue)
+                queue.clear()
+                if not self.pending:
+                    self.idle.notify_all()
+
+    def shutdown(self) -> None:
+        """Waits for the queued requests to finish and stops the workers."""
+        with self.idle:
+            self.idle.wait_for(lambda: not self.pending)
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,144 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDING = 10000
+
+
+class DelayScheduler():
+    """Runs callbacks after a delay, all from one thread.
+
+    Tasks wait in a heap ordered by due time. Cancelled tasks are only dropped from the task table
+    and skipped when they reach the top of the heap. Callbacks run on the scheduler thread and must
+    return quickly, longer work belongs on the request pipeline.
+    """
+
+    def __init__(self, max_pending: int = MAX_PENDING) -> None:
+        """
+        Args:
+            max_pending: Maximum number of tasks waiting, further tasks are refused.
+        """
+        self.max_pending = max_pending
+        self.heap: List[Tuple[float, int]] = []
+        self.tasks: Dict[int, Tuple[Callable[[], None], Hashable]] = {}
+        self.owners: Dict[Hashable, Set[int]] = {}
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    def schedule(self, delay: float, callback: Callable[[], None], owner: Hashable = None) -> Optional[int]:
+        """Runs a callback after `delay` seconds.
+
+        Args:
+            delay: Delay in seconds.
+            callback: Called without arguments on the scheduler thread.
+            owner: Key under which the task can be cancelled with `cancel_owner`, e.g. a session.
+
+        Returns:
+            Handle of the task, None if the queue is full.
+        """
+        with self.condition:
+            if self.stopped or len(self.tasks) >= self.max_pending:
+                metrics.increment("scheduler_rejected")
+                return None
+            handle = next(self.counter)
+            self.tasks[handle] = (callback, owner)
+            if owner is not None:
+                self.owners.setdefault(owner, set()).add(handle)
+            heapq.heappush(self.heap, (time.monotonic() + delay, handle))
+            if len(self.heap) > 2 * len(self.tasks) + 64:
+                # Drop the cancelled tasks
+                self.heap = [entry for entry in self.heap if entry[1] in self.tasks]
+                heapq.heapify(self.heap)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="scheduler", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return handle
+
+    def cancel(self, handle: int) -> bool:
+        """Cancels a task that has not run yet.
+
+        Args:
+            handle: Handle returned by `schedule`.
+
+        Returns:
+            Whether the task was pending.
+        """
+        with self.condition:
+            return self.remove(handle) is not None
+
+    def cancel_owner(self, owner: Hashable) -> int:
+        """Cancels the pending tasks of an owner.
+
+        Args:
+            owner: Key given to `schedule`.
+
+        Returns:
+            Number of tasks cancelled.
+        """
+        with self.condition:
+            handles = list(self.owners.get(owner, ()))
+            for handle in handles:
+                self.remove(handle)
+            return len(handles)
+
+    def remove(self, handle: int) -> Optional[Callable[[], None]]:
+        task = self.tasks.pop(handle, None)
+        if task is None:
+            return None
+        callback, owner = task
+        if owner is not None:
+            handles = self.owners[owner]
+            handles.discard(handle)
+            if not handles:
+                del self.owners[owner]
+        return callback
+
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                while True:
+                    if self.stopped:
+                        return
+                    while self.heap and self.heap[0][1] not in self.tasks:
+                        heapq.heappop(self.heap)
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    due, handle = self.heap[0]
+                    delay = due - time.monotonic()
+                    if delay <= 0:
+                        heapq.heappop(self.heap)
+                        callback = self.remove(handle)
+                        break
+                    self.condition.wait(delay)
+            try:
+                callback()
+            except Exception as e:
+                logger.exception(f"Error in a scheduled task: {e}")
+
+    def shutdown(self) -> None:
+        """Stops the scheduler thread, pending tasks are dropped."""
+        with self.condition:
+            self.stopped = True
+            self.tasks.clear()
+            self.owners.clear()
+            self.heap.clear()
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+
+
+scheduler = DelayScheduler()
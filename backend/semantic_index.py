@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import uuid
+from typing import List, Tuple
+
+from annoy import AnnoyIndex
+from sentence_transformers import SentenceTransformer
+
+from kb_index import CatalogIndex, TitleIndex
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+SEMANTIC_DIR = os.path.join("data", "models", "semantic")
+N_TREES = 10
+
+
+def load_model() -> SentenceTransformer:
+    return SentenceTransformer(MODEL_NAME, device="cpu")
+
+
+def similarity(distance: float) -> float:
+    # Annoy's angular distance is sqrt(2 - 2 cos), scaled to a 0-100 score like fuzz.ratio
+    return max(0.0, 100 * (1 - distance ** 2 / 2))
+
+
+class SemanticIndex():
+    """
+    Annoy index over the embeddings of the cleaned names of one table.
+    Item i of the index is the title at position i of the TitleIndex it was built from.
+    """
+    def __init__(self, annoy_index: AnnoyIndex, title_index: TitleIndex):
+        self.annoy_index = annoy_index
+        self.title_index = title_index
+
+    @staticmethod
+    def paths(table: str, directory: str = SEMANTIC_DIR) -> Tuple[str, str]:
+        return os.path.join(directory, f"{table}.ann"), os.path.join(directory, f"{table}.json")
+
+    @classmethod
+    def build(cls, model: SentenceTransformer, table: str, title_index: TitleIndex, catalog_version: str, directory: str = SEMANTIC_DIR, batch_size: int = 4096) -> None:
+        """
+        Embed the titles of a table and save their Annoy index.
+        :param model: The sentence embedding model.
+        :param table: Name of the table.
+        :param title_index: The titles of the table.
+        :param catalog_version: Version of the catalog index the titles come from.
+        """
+        os.makedirs(directory, exist_ok=True)
+        annoy_path, meta_path = cls.paths(table, directory)
+        annoy_index = AnnoyIndex(model.get_sentence_embedding_dimension(), "angular")
+        annoy_index.on_disk_build(annoy_path + ".tmp")
+        for start in range(0, len(title_index), batch_size):
+            titles = [title_index.titles[i] for i in range(start, min(start + batch_size, len(title_index)))]
+            embeddings = model.encode(titles, batch_size=256, normalize_embeddings=True)
+            for i, embedding in enumerate(embeddings):
+                annoy_index.add_item(start + i, embedding)
+            logger.info("%s: embedded %d/%d titles", table, start + len(titles), len(title_index))
+        annoy_index.build(N_TREES)
+        annoy_index.unload()
+        os.replace(annoy_path + ".tmp", annoy_path)
+        with open(meta_path, "w") as f:
+            json.dump({"model": MODEL_NAME, "catalog_version": catalog_version, "dimension": model.get_sentence_embedding_dimension()}, f)
+
+    @classmethod
+    def load(cls, table: str, title_index: TitleIndex, catalog_version: str, directory: str = SEMANTIC_DIR):
+        """
+        Memory-map the Annoy index of a table.
+        :return: The index, or None if it is missing or was built for another catalog version.
+        """
+        annoy_path, meta_path = cls.paths(table, directory)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if meta["catalog_version"] != catalog_version or meta["model"] != MODEL_NAME:
+            logger.warning("Semantic index %s is stale, run semantic_index.py to rebuild it", annoy_path)
+            return None
+        annoy_index = AnnoyIndex(meta["dimension"], "angular")
+        annoy_index.load(annoy_path)
+        return cls(annoy_index, title_index)
+
+    def query(self, embeddings, limit: int = 3) -> List[List[Tuple[int, float]]]:
+        """
+        :param embeddings: Normalized embeddings of the mentions.
+        :param limit: Number of neighbours per mention.
+        :return: For each mention, a list of (table row, score) tuples, best first.
+        """
+        matches = []
+        for embedding in embeddings:
+            items, distances = self.annoy_index.get_nns_by_vector(embedding, limit, include_distances=True)
+            matches.append([(int(self.title_index.rows[item]), similarity(distance)) for item, distance in zip(items, distances)])
+        return matches
+
+
+if __name__ == "__main__":
+    # Offline job: embed the names of the catalog and build the Annoy indexes used by the entity linker
+    from playlist import Playlist
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    db = Playlist(id=uuid.uuid4().hex, init=False)
+    catalog_index = CatalogIndex.load_or_build(db)
+    model = load_model()
+    for table, title_index in catalog_index.title_index.items():
+        SemanticIndex.build(model, table, title_index, catalog_index.version)
@@ -0,0 +1,261 @@
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Iterable, List, Optional
+
+from dialoguekit.connector import DialogueConnector
+from dialoguekit.participant import Agent, User
+
+logger = logging.getLogger(__name__)
+
+IDLE_TIMEOUT = 30 * 60
+SWEEP_INTERVAL = 60
+AGENT_POOL_SIZE = 16
+SNAPSHOT_ATTEMPTS = 5
+
+
+@dataclass
+class Session:
+    """State of one connected client."""
+
+    user_id: str
+    user: User
+    agent: Agent
+    connector: Optional[DialogueConnector] = None
+    created: float = field(default_factory=time.monotonic)
+    last_active: float = field(default_factory=time.monotonic)
+
+
+def snapshot(container: object) -> list:
+    """Copies the contents of a container that other threads may be changing.
+
+    Args:
+        container: Dictionary, list, tuple, set or deque.
+
+    Returns:
+        Keys and values of a dictionary, elements otherwise. Empty if the
+        container kept changing during every attempt.
+    """
+    for _ in range(SNAPSHOT_ATTEMPTS):
+        try:
+            if isinstance(container, dict):
+                return [item for pair in list(container.items()) for item in pair]
+            return list(container)
+        except RuntimeError:
+            # Changed size during the copy, by a pipeline worker or the sweeper
+            continue
+    return []
+
+
+def estimate_size(root: object, exclude: Iterable[object] = ()) -> int:
+    """Approximates the memory held by an object and what it references.
+
+    Containers are copied before they are followed, so the estimate can be taken
+    while the session is in use.
+
+    Args:
+        root: Object to measure.
+        exclude: Objects shared between sessions, not counted nor followed.
+
+    Returns:
+        Size in bytes.
+    """
+    seen = {id(obj) for obj in exclude}
+    stack = [root]
+    size = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, type(sys))) or callable(obj):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, (dict, list, tuple, set, frozenset, deque)):
+            stack.extend(snapshot(obj))
+        elif hasattr(obj, "__dict__"):
+            stack.append(vars(obj))
+    return size
+
+
+class SessionManager:
+    """Live sessions of the platform, each with its agent, user and dialogue connector.
+
+    Sessions are closed on disconnect, or after `idle_timeout` seconds without a request.
+    Agents of closed sessions are reset and kept in a bounded pool for the next sessions.
+    """
+
+    def __init__(
+        self,
+        new_agent: Callable[[], Agent],
+        idle_timeout: float = IDLE_TIMEOUT,
+        pool_size: int = AGENT_POOL_SIZE,
+        on_expire: Callable[[str], None] = None,
+    ) -> None:
+        """
+        Args:
+            new_agent: Creates an agent when the pool is empty.
+            idle_timeout: Seconds without activity after which a session expires.
+            pool_size: Maximum number of idle agents kept for reuse, 0 disables pooling.
+            on_expire: Called with the user ID of an expired session, defaults to closing it.
+        """
+        self.new_agent = new_agent
+        self.idle_timeout = idle_timeout
+        self.pool_size = pool_size
+        self.on_expire = on_expire or self.close
+        self.sessions: Dict[str, Session] = {}
+        self.pool: Deque[Agent] = deque()
+        self.lock = threading.Lock()
+        self.sweep_thread = None
+        self.sweep_stop = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def acquire_agent(self) -> Agent:
+        with self.lock:
+            if self.pool:
+                return self.pool.pop()
+        return self.new_agent()
+
+    def release_agent(self, agent: Agent) -> None:
+        if not hasattr(agent, "reset"):
+            return
+        agent.reset()
+        with self.lock:
+            if len(self.pool) < self.pool_size:
+                self.pool.append(agent)
+
+    def open(self, user_id: str, user: User) -> Session:
+        """Starts a session with an agent from the pool.
+
+        Args:
+            user_id: User ID.
+            user: The user of the session.
+
+        Returns:
+            The session, its connector is set by the caller.
+        """
+        session = Session(user_id, user, self.acquire_agent())
+        with self.lock:
+            previous = self.sessions.get(user_id)
+            self.sessions[user_id] = session
+        if previous is not None:
+            self.teardown(previous, reuse=False)
+        return session
+
+    def get(self, user_id: str) -> Optional[Session]:
+        return self.sessions.get(user_id)
+
+    def touch(self, user_id: str) -> None:
+        """Marks a session as active.
+
+        Args:
+            user_id: User ID.
+        """
+        session = self.sessions.get(user_id)
+        if session is not None:
+            session.last_active = time.monotonic()
+
+    def close(self, user_id: str, reuse: bool = True) -> Optional[Session]:
+        """Ends a session, closing its dialogue connector and pooling its agent.
+
+        Args:
+            user_id: User ID.
+            reuse: Whether the agent can go back to the pool, only when no request still uses it.
+
+        Returns:
+            The closed session, None if there was none.
+        """
+        session = self.detach(user_id)
+        if session is not None:
+            self.teardown(session, reuse)
+        return session
+
+    def detach(self, user_id: str) -> Optional[Session]:
+        """Removes a session from the live sessions, without tearing it down.
+
+        Args:
+            user_id: User ID.
+
+        Returns:
+            The session, None if there was none.
+        """
+        with self.lock:
+            return self.sessions.pop(user_id, None)
+
+    def teardown(self, session: Session, reuse: bool = True) -> None:
+        """Closes the dialogue connector of a detached session and pools its agent.
+
+        Args:
+            session: The session.
+            reuse: Whether the agent can go back to the pool.
+        """
+        if hasattr(session.agent, "cancel_scheduled"):
+            session.agent.cancel_scheduled()
+        if session.connector is not None:
+            try:
+                # Exports the dialogue history
+                session.connector.close()
+            except Exception as e:
+                logger.warning(f"Error closing the dialogue of {session.user_id}: {e}")
+        if reuse:
+            self.release_agent(session.agent)
+
+    def expire_idle(self, now: float = None) -> List[str]:
+        """Expires the sessions idle for longer than the timeout.
+
+        Args:
+            now: Current `time.monotonic()`.
+
+        Returns:
+            User IDs of the expired sessions.
+        """
+        now = now if now is not None else time.monotonic()
+        with self.lock:
+            expired = [user_id for user_id, session in self.sessions.items() if now - session.last_active > self.idle_timeout]
+        for user_id in expired:
+            logger.info(f"Session expired; user_id: {user_id}")
+            self.on_expire(user_id)
+        return expired
+
+    def start_sweeping(self, interval: float = SWEEP_INTERVAL) -> None:
+        """Expires idle sessions every `interval` seconds, from a daemon thread."""
+        if self.sweep_thread is not None:
+            return
+        self.sweep_stop.clear()
+
+        def run():
+            while not self.sweep_stop.wait(interval):
+                try:
+                    self.expire_idle()
+                except Exception as e:
+                    logger.exception(f"Error expiring sessions: {e}")
+
+        self.sweep_thread = threading.Thread(target=run, name="session-sweep", daemon=True)
+        self.sweep_thread.start()
+
+    def stop_sweeping(self) -> None:
+        if self.sweep_thread is not None:
+            self.sweep_stop.set()
+            self.sweep_thread.join()
+            self.sweep_thread = None
+
+    def stats(self) -> dict:
+        return {"sessions": len(self.sessions), "pooled_agents": len(self.pool)}
+
+    def memory_estimates(self, shared: Iterable[object] = ()) -> Dict[str, int]:
+        """Estimates the memory held by each session: agent, user, connector and dialogue history.
+
+        Args:
+            shared: Objects referenced by every session (platform, database, entity linker...), not counted.
+
+        Returns:
+            Dictionary from user ID to an estimate in bytes.
+        """
+        shared = list(shared)
+        # The sessions are copied under the lock; what they reference is copied container by container while walked
+        with self.lock:
+            sessions = list(self.sessions.values())
+        return {session.user_id: estimate_size(session, shared) for session in sessions}
@@ -0,0 +1,30 @@
+import agent as agent_module
+from agent import PlaylistAgent
+
+
+class RecordingConnector:
+    def __init__(self):
+        self.utterances = []
+
+    def register_agent_utterance(self, utterance) -> None:
+        self.utterances.append(utterance.text)
+
+
+def test_suggestion_of_a_previous_session_is_not_sent(monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(agent_module.scheduler, "schedule", lambda delay, callback, owner=None: scheduled.append(callback))
+    agent = PlaylistAgent(id="agent")
+    previous = agent._dialogue_connector = RecordingConnector()
+    agent.check_for_suggestions()
+
+    # The scheduler took the suggestion off its queue, then the pooled agent was given to another session
+    agent.reset()
+    current = agent._dialogue_connector = RecordingConnector()
+    scheduled[0]()
+
+    assert previous.utterances == []
+    assert current.utterances == []
+
+    agent.check_for_suggestions()
+    scheduled[1]()
+    assert len(current.utterances) == 1
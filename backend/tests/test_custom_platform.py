@@ -0,0 +1,91 @@
+import threading
+from unittest import mock
+
+import pytest
+from dialoguekit.core import AnnotatedUtterance
+from dialoguekit.participant import Agent
+from dialoguekit.participant.participant import DialogueParticipant
+
+from custom_platform import CustomPlatform
+from instrumentation import metrics
+from request_pipeline import RequestPipeline
+from session_manager import SessionManager
+
+
+class RecordingAgent(Agent):
+    """Agent greeting the user and keeping the text of what it receives."""
+
+    def __init__(self):
+        super().__init__("agent")
+        self.received = []
+
+    def welcome(self) -> None:
+        self._dialogue_connector.register_agent_utterance(AnnotatedUtterance("Hello", participant=DialogueParticipant.AGENT))
+
+    def goodbye(self) -> None:
+        pass
+
+    def receive_utterance(self, utterance) -> None:
+        self.received.append(utterance.text)
+
+    def get_commands(self) -> dict:
+        return {}
+
+    def connect_playlist(self, *args) -> None:
+        pass
+
+    def reset(self) -> None:
+        self.received = []
+
+
+@pytest.fixture
+def platform(tmp_path, monkeypatch):
+    # Closed dialogues are exported to the working directory
+    monkeypatch.chdir(tmp_path)
+    # Only what sessions and messages use, without the catalog and the models
+    platform = CustomPlatform.__new__(CustomPlatform)
+    platform.sessions = SessionManager(RecordingAgent, on_expire=platform.expire)
+    platform.pipeline = RequestPipeline(workers=1)
+    platform.playlists = {}
+    platform.playlist = 1
+    platform.socketio = mock.Mock()
+    platform.playlist_sync = mock.Mock()
+    platform.db = platform.entity_linker = platform.recommender = platform.artist_stats = None
+    yield platform
+    platform.pipeline.shutdown()
+
+
+def run_blocked(platform, user_id, *steps):
+    """Runs the steps while a request of the user holds the only worker, then lets the queued requests run."""
+    release = threading.Event()
+    platform.pipeline.submit(user_id, release.wait)
+    for step in steps:
+        step()
+    release.set()
+    with platform.pipeline.idle:
+        platform.pipeline.idle.wait_for(lambda: not platform.pipeline.pending)
+
+
+def test_message_queued_when_the_session_expires_reopens_it(platform):
+    platform.connect("user")
+    expired_agent = platform.sessions.get("user").agent
+    errors = metrics.snapshot()["counters"].get("request_errors", 0)
+
+    run_blocked(platform, "user", lambda: platform.message("user", "add Yesterday"), lambda: platform.expire("user"))
+
+    session = platform.sessions.get("user")
+    assert session is not None
+    assert session.agent is not expired_agent
+    assert session.agent.received == ["add Yesterday"]
+    assert expired_agent.received == []
+    assert metrics.snapshot()["counters"].get("request_errors", 0) == errors
+
+
+def test_message_of_a_disconnected_client_is_dropped(platform):
+    platform.connect("user")
+    platform.playlists.pop("user")
+    platform.close_session("user")
+
+    run_blocked(platform, "user", lambda: platform.message("user", "add Yesterday"))
+
+    assert platform.sessions.get("user") is None
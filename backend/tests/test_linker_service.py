@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+import linker_service
+import recommender
+from linker_service import LinkerClient
+from recommender import CatalogRecommender
+
+
+class CatalogDatabase:
+    def __init__(self):
+        self.build_version = "1"
+
+    def read(self, table, data, where):
+        return [(self.build_version,)]
+
+
+def test_catalog_rebuild_reloads_the_client_index_and_the_recommender(monkeypatch):
+    monkeypatch.setattr(linker_service, "VERSION_CHECK_INTERVAL", 0)
+    db = CatalogDatabase()
+    monkeypatch.setattr(linker_service.CatalogIndex, "load_or_build", lambda db: SimpleNamespace(version=db.build_version))
+    monkeypatch.setattr(recommender.FeatureIndex, "load_or_build",
+                        lambda db, catalog_index: SimpleNamespace(recommend=lambda song_ids, limit: [(catalog_index.version, 0.0)]))
+    client = LinkerClient(call=None, db=db)
+    feature_recommender = CatalogRecommender(db, client)
+    assert feature_recommender.recommend(["song"]) == [("1", 0.0)]
+
+    db.build_version = "2"
+    assert feature_recommender.recommend(["song"]) == [("2", 0.0)]
+    assert client.catalog_index.version == "2"
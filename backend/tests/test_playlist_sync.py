@@ -0,0 +1,32 @@
+from playlist_sync import PlaylistSync
+
+
+class EmptyPlaylists:
+    def read_songs_from_playlist(self, playlist_id, data):
+        return []
+
+
+def make_sync():
+    events = []
+    return PlaylistSync(EmptyPlaylists(), lambda event, data, user_id: events.append((event, data, user_id))), events
+
+
+def test_state_of_a_playlist_is_dropped_with_its_last_subscriber():
+    sync, events = make_sync()
+    sync.subscribe(1, "user")
+    sync.removed(1, "song")
+    assert [(event, data["revision"]) for event, data, _ in events] == [("playlist:remove", 1)]
+
+    sync.unsubscribe("user")
+    assert (sync.subscribers, sync.revisions, sync.playlist_locks) == ({}, {}, {})
+
+
+def test_lock_held_by_a_writer_is_kept_until_released():
+    sync, _ = make_sync()
+    sync.subscribe(1, "user")
+    with sync.playlist_lock(1):
+        sync.unsubscribe("user")
+        lock = sync.playlist_locks[1]
+        with sync.playlist_lock(1):
+            assert sync.playlist_locks[1] is lock
+    assert sync.playlist_locks == {}
@@ -1,8 +1,8 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { MDBIcon, MDBBtn, MDBTable, MDBTableHead, MDBTableBody, MDBInput } from 'mdb-react-ui-kit';
 
 import { useSocket } from "../../contexts/SocketContext";
-import { AgentMessage, ChatMessage, Annotation, Song, Response } from "../../types";
+import { Song, Response, PlaylistSnapshot, PlaylistDelta } from "../../types";
 
 export default function Playlist() {
   const [playlist, setPlaylist] = useState<Song[]>([]);
@@ -10,57 +10,56 @@ export default function Playlist() {
   const [isAddingRow, setIsAddingRow] = useState(false);
   const { socket } = useSocket();
 
+  const epoch = useRef<string | null>(null);
+  const revision = useRef(0);
+
   useEffect(() => {
-    socket?.on("message", (response: AgentMessage) => {
-      if (response.info) {
-        console.log(response.info);
-      }
-      if (response.message) {
-        handelMessageForPlaylist(response.message);
-      }
-    });
-
-    socket?.on("playlist", (data: Song[]) => { // Errors here
-      setPlaylist(data);
-    });
-  });
-
-  const handleAgentRemoveSong = (annotations: Annotation[]) => {
-    const song: Song = {}
-    annotations.map((annotation) => 
-      {
-        song.title = annotation.value.title
-        song.artist = annotation.value.artist
-        song.album = annotation.value.album
-      }
-    )
-
-    if (song.title && song.artist) {
-      setPlaylist((prevPlaylist) =>
-        prevPlaylist.filter(
-          (item) =>
-            item.title?.toLowerCase() !== song.title?.toLowerCase() ||
-            item.artist?.toLowerCase() !== song.artist?.toLowerCase()
-        )
-      );
+    if (!socket) {
+      return;
     }
-  }
-
-  const handelMessageForPlaylist = (message: ChatMessage) => {
-    const intent = message.intent
-    const annotations: Annotation[] = message.annotations
-    console.log(annotations)
 
-    if (intent === "add") {
-      
-    }
-    else if (intent === "remove") {
-      handleAgentRemoveSong(annotations)
-    }
-    else if (intent === "clear") {
-      setPlaylist([])
-    }
-  };
+    const onSnapshot = (snapshot: PlaylistSnapshot) => {
+      epoch.current = snapshot.epoch;
+      revision.current = snapshot.revision;
+      setPlaylist(snapshot.songs);
+    };
+
+    // Applies a delta if it is the next revision, otherwise asks for a snapshot
+    const applyDelta = (update: (prevPlaylist: Song[]) => Song[]) => (delta: PlaylistDelta) => {
+      if (delta.epoch !== epoch.current || delta.revision > revision.current + 1) {
+        socket.emit("playlist_sync", {});
+        return;
+      }
+      if (delta.revision <= revision.current) {
+        return;
+      }
+      revision.current = delta.revision;
+      setPlaylist((prevPlaylist) => update(prevPlaylist));
+    };
+
+    // A song already listed, e.g. by a snapshot read just after it was added, is not added twice
+    const onAdd = (delta: PlaylistDelta) =>
+      applyDelta((prevPlaylist) =>
+        prevPlaylist.some((item) => item.id === delta.song?.id) ? prevPlaylist : [...prevPlaylist, delta.song as Song]
+      )(delta);
+    const onRemove = (delta: PlaylistDelta) =>
+      applyDelta((prevPlaylist) => prevPlaylist.filter((item) => item.id !== delta.id))(delta);
+    const onClear = applyDelta(() => []);
+
+    socket.on("playlist:snapshot", onSnapshot);
+    socket.on("playlist:add", onAdd);
+    socket.on("playlist:remove", onRemove);
+    socket.on("playlist:clear", onClear);
+    // The snapshot sent on connect may have arrived before this component mounted
+    socket.emit("playlist_sync", {});
+
+    return () => {
+      socket.off("playlist:snapshot", onSnapshot);
+      socket.off("playlist:add", onAdd);
+      socket.off("playlist:remove", onRemove);
+      socket.off("playlist:clear", onClear);
+    };
+  }, [socket]);
 
   const handleAddSong = () => {
     if (newSong.title && newSong.artist && newSong.album) {
@@ -71,9 +70,9 @@ export default function Playlist() {
       };
 
       socket?.emit("add", {add: song}); 
-      socket?.on("add:response", (response: Response) => {
+      socket?.once("add:response", (response: Response) => {
+        // The song itself arrives with the playlist:add delta
         if (response.status === "OK") {
-          setPlaylist([...playlist, song]);
           setNewSong({ title: '', artist: '', album: '' }); // Clear input fields after adding
         }
         setIsAddingRow(false);
@@ -83,9 +82,6 @@ export default function Playlist() {
 
   const handleRemoveSong = (index: number) => {
     socket?.emit("remove", {remove: playlist[index]})
-
-    const updatedPlaylist = playlist.filter((_, i) => i !== index);
-    setPlaylist(updatedPlaylist);
   };
 
   const handleNewRowClick = () => {
@@ -94,7 +90,6 @@ export default function Playlist() {
 
   const handleClearPlaylist = () => {
     socket?.emit("clear", {})
-    setPlaylist([]);
   };
 
   return (
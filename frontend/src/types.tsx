@@ -31,6 +31,19 @@ export type Song = {
   album?: string;
 };
 
+export type PlaylistSnapshot = {
+  epoch: string;
+  revision: number;
+  songs: Song[];
+};
+
+export type PlaylistDelta = {
+  epoch: string;
+  revision: number;
+  song?: Song;
+  id?: string;
+};
+
 export type Response = {
   status: string;
   message: string;